@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+EVALUATION CACHE ADMIN
+Inspect the evaluation cache, migrate it between storage backends and move it
+between deployments as a compact archive.
+
+    python cache_admin.py stats [--backend sqlite]
+    python cache_admin.py migrate --from json --to sqlite [--delete-source]
+    python cache_admin.py export --out cache.jsonl.gz [--eval-type qa_evaluation] [--max-age-days 30]
+    python cache_admin.py import --in cache.jsonl.gz [--overwrite]
+"""
+import argparse
+import logging
+import sys
+from collections import defaultdict
+
+from services.cache_backends import create_cache_backend
+from services.cache_transfer import export_archive, import_archive
+from services.determinism_config import EVALUATION_CACHE_DIR, DeterministicEvalConfig
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+logger = logging.getLogger("cache_admin")
+
+MIGRATE_BATCH = 500
+
+
+def cmd_stats(args) -> int:
+    backend = create_cache_backend(args.backend, EVALUATION_CACHE_DIR)
+    stats = backend.stats()
+    print(f"📦 Backend: {backend.name} ({EVALUATION_CACHE_DIR})")
+    for eval_type, bucket in sorted(stats["by_eval_type"].items()):
+        print(f"   {eval_type:<16} {bucket['count']:>8} entries {bucket['bytes']:>14,} bytes")
+    print(f"   {'TOTAL':<16} {stats['total_cached_results']:>8} entries {stats['total_size_bytes']:>14,} bytes")
+    return 0
+
+
+def cmd_migrate(args) -> int:
+    if args.source == args.target:
+        logger.error("Source and target backends are the same")
+        return 1
+
+    source = create_cache_backend(args.source, EVALUATION_CACHE_DIR)
+    target = create_cache_backend(args.target, EVALUATION_CACHE_DIR)
+    logger.info(f"🔁 Migrating evaluation cache: {source.name} -> {target.name}")
+
+    pending = defaultdict(list)
+    migrated = defaultdict(int)
+
+    def flush(eval_type: str) -> None:
+        target.set_many(eval_type, pending[eval_type])
+        migrated[eval_type] += len(pending[eval_type])
+        pending[eval_type] = []
+
+    for eval_type, content_hash, cached_at, payload in source.iter_entries():
+        pending[eval_type].append((content_hash, cached_at, payload))
+        if len(pending[eval_type]) >= MIGRATE_BATCH:
+            flush(eval_type)
+    for eval_type in list(pending):
+        if pending[eval_type]:
+            flush(eval_type)
+
+    for eval_type, count in sorted(migrated.items()):
+        logger.info(f"   ✅ {eval_type}: {count} entries")
+    logger.info(f"Migrated {sum(migrated.values())} entries")
+
+    if args.delete_source:
+        removed = source.clear()
+        logger.info(f"🗑️ Removed {removed} entries from the {source.name} backend")
+    return 0
+
+
+def cmd_export(args) -> int:
+    backend = create_cache_backend(args.backend, EVALUATION_CACHE_DIR)
+    report = export_archive(
+        backend, args.out, eval_types=args.eval_type, max_age_days=args.max_age_days,
+        ttl_seconds=DeterministicEvalConfig.CACHE_TTL_DAYS * 86400,
+    )
+    for eval_type, count in sorted(report["by_eval_type"].items()):
+        logger.info(f"   ✅ {eval_type}: {count} entries")
+    return 0
+
+
+def cmd_import(args) -> int:
+    backend = create_cache_backend(args.backend, EVALUATION_CACHE_DIR)
+    try:
+        report = import_archive(
+            backend, args.archive, overwrite=args.overwrite,
+            ttl_seconds=DeterministicEvalConfig.CACHE_TTL_DAYS * 86400,
+        )
+    except (OSError, ValueError) as e:
+        logger.error(f"Import failed: {e}")
+        return 1
+    for eval_type, count in sorted(report["by_eval_type"].items()):
+        logger.info(f"   ✅ {eval_type}: {count} entries")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Evaluation cache administration")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    stats = sub.add_parser("stats", help="Show entry counts and sizes per eval_type")
+    stats.add_argument("--backend", default="json", choices=["json", "sqlite"])
+    stats.set_defaults(func=cmd_stats)
+
+    migrate = sub.add_parser("migrate", help="Copy every entry from one backend to another")
+    migrate.add_argument("--from", dest="source", default="json", choices=["json", "sqlite"])
+    migrate.add_argument("--to", dest="target", default="sqlite", choices=["json", "sqlite"])
+    migrate.add_argument("--delete-source", action="store_true", help="Clear the source backend after copying")
+    migrate.set_defaults(func=cmd_migrate)
+
+    export = sub.add_parser("export", help="Write cache entries to a gzip JSONL archive")
+    export.add_argument("--backend", default=DeterministicEvalConfig.CACHE_BACKEND, choices=["json", "sqlite"])
+    export.add_argument("--out", required=True, help="Archive path, e.g. evaluation_cache.jsonl.gz")
+    export.add_argument("--eval-type", action="append", help="Only export this eval_type (repeatable)")
+    export.add_argument("--max-age-days", type=float, help="Only export entries cached within this many days")
+    export.set_defaults(func=cmd_export)
+
+    load = sub.add_parser("import", help="Load an export archive into a backend")
+    load.add_argument("--backend", default=DeterministicEvalConfig.CACHE_BACKEND, choices=["json", "sqlite"])
+    load.add_argument("--in", dest="archive", required=True, help="Archive written by the export command")
+    load.add_argument("--overwrite", action="store_true", help="Replace entries that are already cached")
+    load.set_defaults(func=cmd_import)
+
+    args = parser.parse_args()
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
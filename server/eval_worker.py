@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+EVALUATION WORKER
+Standalone process draining the durable evaluation job queue. Run as many as needed, on
+any host that shares the database and uploads directory; tasks are claimed under leases,
+so workers never grade the same file twice and a killed worker's files are resumed by
+the others.
+
+    python eval_worker.py [--workers 1] [--concurrency 4]
+"""
+import argparse
+import asyncio
+import logging
+import signal
+import sys
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from services.evaluation_worker import WORKER_CONCURRENCY, EvaluationWorker
+from services.generate_service_complete import GenerateServiceComplete
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+logger = logging.getLogger("eval_worker")
+
+
+async def run(args) -> None:
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            pass
+
+    service = GenerateServiceComplete()
+    workers = [EvaluationWorker(service, concurrency=args.concurrency) for _ in range(args.workers)]
+    await asyncio.gather(*(worker.run(stop) for worker in workers))
+    logger.info("🛑 Evaluation workers stopped (in-flight tasks resume elsewhere once their leases expire)")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Durable evaluation job worker")
+    parser.add_argument("--workers", type=int, default=1, help="Worker loops in this process")
+    parser.add_argument("--concurrency", type=int, default=WORKER_CONCURRENCY, help="Files in flight per worker")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -56,6 +56,41 @@ async def scheduled_cleanup():
         # Run once every 24 hours (86400 seconds)
         await asyncio.sleep(86400)
 
+async def scheduled_cache_compaction():
+    """Background task enforcing evaluation cache TTL and per-eval_type size budgets"""
+    from services.determinism_config import DeterministicEvalConfig, EvaluationCache
+    interval = DeterministicEvalConfig.CACHE_COMPACTION_INTERVAL_SECONDS
+    while True:
+        try:
+            # Filesystem/SQLite work runs in a worker thread so requests are not blocked
+            await asyncio.to_thread(EvaluationCache.compact)
+        except Exception as e:
+            logger.error(f"Error in scheduled cache compaction task: {e}")
+        
+        await asyncio.sleep(interval)
+
+async def scheduled_context_cache_sweep():
+    """Background task deleting provider context-cache handles no batch is using any more"""
+    from services.context_cache import prompt_cache
+    from services.llm_backend import get_llm_backend
+    backend = get_llm_backend()
+    while True:
+        await asyncio.sleep(prompt_cache.sweep_interval_seconds)
+        try:
+            removed = await prompt_cache.sweep(backend if backend.is_available() else None)
+            if removed:
+                logger.info(f"🗂️ Swept {removed} idle context cache handle(s)")
+        except Exception as e:
+            logger.error(f"Error in scheduled context cache sweep task: {e}")
+
+async def import_cache_archive(path: str):
+    """Warm the evaluation cache from an export archive without blocking startup"""
+    from services.determinism_config import EvaluationCache
+    try:
+        await asyncio.to_thread(EvaluationCache.import_archive, path)
+    except Exception as e:
+        logger.error(f"Error importing evaluation cache archive {path}: {e}")
+
 @app.on_event("startup")
 async def startup_event():
     # DIAGNOSTIC: Check network connectivity before DB init
@@ -93,6 +128,27 @@ async def startup_event():
     # Start the cleanup task in the background
     asyncio.create_task(scheduled_cleanup())
 
+    # Delete unscoped context-cache handles (debug / validator calls) instead of paying for them until TTL
+    from services.context_cache import prompt_cache
+    if prompt_cache.enabled and prompt_cache.sweep_interval_seconds > 0:
+        asyncio.create_task(scheduled_context_cache_sweep())
+
+    # Drain the durable evaluation job queue in this process too (EVAL_JOB_WORKERS=0 leaves it to eval_worker.py)
+    from services.evaluation_jobs import EVAL_JOB_WORKERS
+    files.job_manager.start_workers(EVAL_JOB_WORKERS)
+
+    from services.determinism_config import DeterministicEvalConfig
+    if DeterministicEvalConfig.CACHE_COMPACTION_INTERVAL_SECONDS > 0:
+        asyncio.create_task(scheduled_cache_compaction())
+    
+    archive = DeterministicEvalConfig.CACHE_IMPORT_ON_STARTUP
+    if archive:
+        if os.path.exists(archive):
+            logger.info(f"📥 Importing evaluation cache archive {archive} in the background")
+            asyncio.create_task(import_cache_archive(archive))
+        else:
+            logger.warning(f"EVAL_CACHE_IMPORT_ON_STARTUP archive not found: {archive}")
+
 
 @app.get("/")
 def read_root():
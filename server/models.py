@@ -117,3 +117,81 @@ class EvaluationDetail(Base):
     # Relationships
     evaluation_result = relationship("EvaluationResult", back_populates="details")
 
+
+
+class JobStatus(str, enum.Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+class EvaluationJob(Base):
+    __tablename__ = "evaluation_jobs"
+
+    id = Column(String, primary_key=True, index=True)  # UUID returned to the client
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    assignment_id = Column(Integer, ForeignKey("assignments.id"), nullable=True)
+    status = Column(SQLEnum(JobStatus), default=JobStatus.QUEUED, nullable=False, index=True)
+    request_json = Column(Text, nullable=False)  # GenerateRequest as submitted
+    plan_json = Column(Text, nullable=True)  # Resolved description / evaluation type, written when tasks are created
+    result_json = Column(Text, nullable=True)  # Final GenerateResponse payload
+    error = Column(Text, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    lease_owner = Column(String, nullable=True)  # Worker currently planning or finalizing the job
+    lease_expires_at = Column(DateTime(timezone=True), nullable=True)
+    available_at = Column(DateTime(timezone=True), nullable=True)  # Retry backoff: not claimable before this
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    
+    # Relationships
+    tasks = relationship("EvaluationTask", back_populates="job", cascade="all, delete-orphan", order_by="EvaluationTask.file_index")
+    events = relationship("EvaluationJobEvent", back_populates="job", cascade="all, delete-orphan")
+
+
+class TaskStatus(str, enum.Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+class EvaluationTask(Base):
+    """One file of an evaluation job; claimed by a worker under a renewable lease"""
+    __tablename__ = "evaluation_tasks"
+
+    id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(String, ForeignKey("evaluation_jobs.id"), nullable=False, index=True)
+    file_index = Column(Integer, nullable=False)  # Position in the job's result list
+    file_id = Column(String, nullable=True)  # Upload id (None for GitHub files)
+    name = Column(String, nullable=True)  # Student display name once extracted
+    payload_json = Column(Text, nullable=False)  # Upload path info, or the GitHub file itself
+    status = Column(SQLEnum(TaskStatus), default=TaskStatus.PENDING, nullable=False, index=True)
+    stage = Column(String, nullable=False, default="queued")  # Pipeline stage last entered
+    attempts = Column(Integer, nullable=False, default=0)
+    lease_owner = Column(String, nullable=True)
+    lease_expires_at = Column(DateTime(timezone=True), nullable=True)
+    available_at = Column(DateTime(timezone=True), nullable=True)  # Retry backoff: not claimable before this
+    checkpoint_json = Column(Text, nullable=True)  # QA pairs and per-question grades finished so far
+    result_json = Column(Text, nullable=True)  # Saved score for this file
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
+    
+    # Relationships
+    job = relationship("EvaluationJob", back_populates="tasks")
+
+
+class EvaluationJobEvent(Base):
+    """Append-only progress log streamed to clients; the id doubles as the SSE event id"""
+    __tablename__ = "evaluation_job_events"
+
+    id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(String, ForeignKey("evaluation_jobs.id"), nullable=False, index=True)
+    event = Column(String, nullable=False)  # 'files', 'progress', 'result', 'done'
+    data_json = Column(Text, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    
+    # Relationships
+    job = relationship("EvaluationJob", back_populates="events")
@@ -1,15 +1,28 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Query
+from fastapi.responses import FileResponse
+from starlette.background import BackgroundTask
 from sqlalchemy.orm import Session
 from models import User
-from auth import get_current_user
+from auth import get_current_admin, get_current_user
 from services.file_processor import FileProcessor
 from services.gemini_service import GeminiService
 from services.determinism_config import DeterministicEvalConfig, EvaluationCache
+from services.context_cache import prompt_cache
+from services.llm_trace import llm_tracer
 import re
 import asyncio
+import logging
+import shutil
+import tempfile
+import uuid
 from pathlib import Path
+from typing import List, Optional
 
 router = APIRouter(prefix="/debug", tags=["debug"])
+logger = logging.getLogger(__name__)
+
+# Background cache imports, referenced so they are not garbage-collected mid-run
+_import_tasks = set()
 
 # Initialize file processor
 file_processor = FileProcessor()
@@ -18,7 +31,7 @@ file_processor = FileProcessor()
 UPLOAD_DIR = Path("uploads")
 
 @router.get("/extracted/{file_id}")
-def debug_extracted(file_id: str, current_user: User = Depends(get_current_user)):
+async def debug_extracted(file_id: str, current_user: User = Depends(get_current_user)):
     """Return the extracted text and a quick QA hint for a given uploaded file id for debugging extraction issues."""
     file_path = None
     for saved_file in UPLOAD_DIR.glob(f"{file_id}.*"):
@@ -30,7 +43,7 @@ def debug_extracted(file_id: str, current_user: User = Depends(get_current_user)
     if not file_path or not file_path.exists():
         raise HTTPException(status_code=404, detail=f"File with ID {file_id} not found")
 
-    file_data = file_processor.read_file(str(file_path))
+    file_data = await file_processor.read_file_async(str(file_path))
     content = file_data.get('content', '') or ''
 
     # Quick QA extractor (same heuristics as the main batch pipeline)
@@ -193,12 +206,100 @@ def cache_stats(current_user: User = Depends(get_current_user)):
     return {
         "cache_enabled": DeterministicEvalConfig.ENABLE_RESULT_CACHE,
         "cache_ttl_days": DeterministicEvalConfig.CACHE_TTL_DAYS,
-        "statistics": stats
+        "statistics": stats,
+        # Per-eval_type hit/miss/eviction counters for the in-memory and disk tiers
+        "tiers": EvaluationCache.get_tier_stats(),
+        # Requests that joined an identical in-flight LLM call (counted separately from cache hits)
+        "coalesced": GeminiService.get_coalescing_stats(),
+        "context_cache": prompt_cache.get_stats()
+    }
+
+
+@router.get("/consensus-stats")
+def consensus_stats(current_user: User = Depends(get_current_user)):
+    """Consensus vote counters (calls issued vs. saved by early exit)"""
+    return {
+        "strategy": DeterministicEvalConfig.CONSENSUS_STRATEGY,
+        "max_calls_per_question": DeterministicEvalConfig.CONSENSUS_CALLS,
+        "statistics": GeminiService.get_consensus_stats()
     }
 
 
+@router.get("/llm-trace")
+def llm_trace_stats(current_user: User = Depends(get_current_user)):
+    """LLM trace sink configuration and counters (recorded, sampled out, dropped)"""
+    return llm_tracer.get_stats()
+
+
+@router.post("/cache-compact")
+async def cache_compact(current_user: User = Depends(get_current_admin)):
+    """Run evaluation cache compaction now (TTL purge + per-eval_type size budgets) (ADMIN ONLY)"""
+    report = await asyncio.to_thread(EvaluationCache.compact)
+    return {"success": True, "report": report}
+
+
+@router.get("/cache-export")
+async def cache_export(
+    eval_type: Optional[List[str]] = Query(None),
+    max_age_days: Optional[float] = None,
+    current_user: User = Depends(get_current_admin)
+):
+    """Download the evaluation cache (optionally filtered by eval_type / age) as a gzip JSONL archive (ADMIN ONLY)"""
+    archive = Path(tempfile.gettempdir()) / f"evaluation_cache_{uuid.uuid4().hex}.jsonl.gz"
+    report = await asyncio.to_thread(EvaluationCache.export_archive, archive, eval_type, max_age_days)
+    return FileResponse(
+        path=archive,
+        filename="evaluation_cache.jsonl.gz",
+        media_type="application/gzip",
+        headers={"X-Cache-Entries": str(report["entries"])},
+        background=BackgroundTask(archive.unlink, missing_ok=True)
+    )
+
+
+@router.post("/cache-import")
+async def cache_import(
+    file: UploadFile = File(...),
+    overwrite: bool = False,
+    current_user: User = Depends(get_current_admin)
+):
+    """Upload an export archive and load it in the background; poll /debug/cache-import/status (ADMIN ONLY)"""
+    archive = Path(tempfile.gettempdir()) / f"evaluation_cache_import_{uuid.uuid4().hex}.jsonl.gz"
+    try:
+        # Claim the import slot before answering so a concurrent upload gets a 409, not a silent no-op
+        EvaluationCache.claim_import(archive)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    
+    try:
+        with archive.open("wb") as out:
+            await asyncio.to_thread(shutil.copyfileobj, file.file, out)
+    except Exception as e:
+        EvaluationCache.abort_import(f"Upload failed: {e}")
+        archive.unlink(missing_ok=True)
+        raise HTTPException(status_code=500, detail=f"Failed to store cache archive: {e}")
+    
+    async def run_import():
+        try:
+            await asyncio.to_thread(EvaluationCache.import_archive, archive, overwrite, True)
+        except Exception as e:
+            logger.error(f"Error importing uploaded evaluation cache archive: {e}")
+        finally:
+            archive.unlink(missing_ok=True)
+    
+    task = asyncio.create_task(run_import())
+    _import_tasks.add(task)
+    task.add_done_callback(_import_tasks.discard)
+    return {"success": True, "status": "started", "progress": EvaluationCache.get_import_progress()}
+
+
+@router.get("/cache-import/status")
+def cache_import_status(current_user: User = Depends(get_current_admin)):
+    """Progress of the running (or last) cache import: bytes read, entries imported/skipped (ADMIN ONLY)"""
+    return EvaluationCache.get_import_progress()
+
+
 @router.post("/cache-clear")
-def cache_clear(current_user: User = Depends(get_current_user)):
+def cache_clear(current_user: User = Depends(get_current_admin)):
     """Clear all cached evaluation results (ADMIN ONLY)"""
     count = EvaluationCache.clear_all()
     return {
@@ -218,6 +319,10 @@ def get_determinism_config(current_user: User = Depends(get_current_user)):
         "USE_CONSENSUS": DeterministicEvalConfig.USE_CONSENSUS,
         "CONSENSUS_CALLS": DeterministicEvalConfig.CONSENSUS_CALLS,
         "CONSENSUS_THRESHOLD": DeterministicEvalConfig.CONSENSUS_THRESHOLD,
+        "CONSENSUS_STRATEGY": DeterministicEvalConfig.CONSENSUS_STRATEGY,
+        "CONSENSUS_HEDGE_DELAY_SECONDS": DeterministicEvalConfig.CONSENSUS_HEDGE_DELAY_SECONDS,
+        "BATCH_QA_EVALUATION": DeterministicEvalConfig.BATCH_QA_EVALUATION,
+        "BATCH_INPUT_TOKEN_BUDGET": DeterministicEvalConfig.BATCH_INPUT_TOKEN_BUDGET,
         "VALIDATE_CONTENT_HASH": DeterministicEvalConfig.VALIDATE_CONTENT_HASH,
         "ENABLE_RESULT_CACHE": DeterministicEvalConfig.ENABLE_RESULT_CACHE,
         "CACHE_TTL_DAYS": DeterministicEvalConfig.CACHE_TTL_DAYS,
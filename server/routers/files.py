@@ -1,4 +1,5 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Header
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from models import User
 from auth import get_current_user
@@ -7,6 +8,7 @@ import json
 import os
 import uuid
 from pathlib import Path
+from typing import Optional
 from database import get_db
 import logging
 
@@ -15,10 +17,12 @@ logger = logging.getLogger(__name__)
 # Import services
 from services.file_processor import FileProcessor
 from services.generate_service_complete import GenerateServiceComplete
+from services.evaluation_jobs import EvaluationJobManager
 
 # Initialize services
 file_processor = FileProcessor()
 generate_service = GenerateServiceComplete()
+job_manager = EvaluationJobManager(generate_service)
 
 # Create uploads directory for temporary file storage
 UPLOAD_DIR = Path("uploads")
@@ -114,3 +118,67 @@ async def generate_content(
     Saves assignment and results to database
     """
     return await generate_service.generate_content(request, current_user, db)
+
+
+@router.post("/generate/jobs", status_code=202)
+async def submit_generate_job(
+    request: GenerateRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Start a generate batch in the background and return its job id immediately.
+    Poll /files/generate/jobs/{job_id} or follow /files/generate/jobs/{job_id}/events (SSE).
+    """
+    if not request.file_ids and not request.github_url and "github.com" not in (request.description or "").lower():
+        raise HTTPException(status_code=400, detail="Provide at least one file or GitHub URL")
+    
+    job_id = await job_manager.submit(request, current_user)
+    return {
+        "success": True,
+        "job_id": job_id,
+        "status_url": f"/files/generate/jobs/{job_id}",
+        "events_url": f"/files/generate/jobs/{job_id}/events",
+    }
+
+
+@router.get("/generate/jobs/{job_id}")
+async def get_generate_job(job_id: str, current_user: User = Depends(get_current_user)):
+    """Job status with each file's pipeline stage and overall percent complete"""
+    job = await job_manager.get_status(job_id, current_user.id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job
+
+
+@router.get("/generate/jobs/{job_id}/result", response_model=GenerateResponse)
+async def get_generate_job_result(job_id: str, current_user: User = Depends(get_current_user)):
+    """Final /files/generate response of a finished job"""
+    result = await job_manager.get_result(job_id, current_user.id)
+    if result is None:
+        raise HTTPException(status_code=404, detail=f"No result for job {job_id} (unknown or still running)")
+    return result
+
+
+@router.get("/generate/jobs/{job_id}/events")
+async def stream_generate_job(
+    job_id: str,
+    last_event_id: Optional[int] = None,
+    last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID"),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Server-sent events: "files", per-file "progress", one "result" per student as it is saved, then "done".
+    Reconnecting with Last-Event-ID (header or ?last_event_id=) resumes after that event.
+    """
+    if await job_manager.get_status(job_id, current_user.id) is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    
+    resume_after = last_event_id
+    if resume_after is None and last_event_id_header and last_event_id_header.isdigit():
+        resume_after = int(last_event_id_header)
+    
+    return StreamingResponse(
+        job_manager.stream(job_id, current_user.id, resume_after or 0),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
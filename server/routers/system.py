@@ -1,5 +1,8 @@
 from fastapi import APIRouter
 from services.gemini_service import GeminiService
+from services.llm_limiter import gemini_limiter
+from services.circuit_breaker import get_circuit_breaker_states
+from services.rate_limiter import get_rate_limiter_states
 
 router = APIRouter(prefix="/system", tags=["system"])
 
@@ -17,11 +20,26 @@ def check_gemini_status():
         return {
             "status": "connected" if is_connected else "disconnected",
             "models": models,
-            "message": "LLM service is available" if is_connected else "LLM service is not available"
+            "message": "LLM service is available" if is_connected else "LLM service is not available",
+            "backend": gemini_service.backend.name,
+            "circuit_breakers": get_circuit_breaker_states()
         }
     except Exception as e:
         return {
             "status": "error",
             "models": [],
-            "message": f"Error checking LLM status: {str(e)}"
+            "message": f"Error checking LLM status: {str(e)}",
+            "circuit_breakers": get_circuit_breaker_states()
         }
+
+
+@router.get("/gemini/limiter")
+def get_gemini_limiter_status():
+    """Current adaptive concurrency limiter state (limit, in-flight, queued, admitted)"""
+    return gemini_limiter.snapshot()
+
+
+@router.get("/gemini/rate-limits")
+def get_gemini_rate_limits():
+    """RPM/TPM quota limiter state per model, including the wait-time histogram"""
+    return get_rate_limiter_states()
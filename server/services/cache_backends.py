@@ -0,0 +1,398 @@
+"""
+EvaluationCache Storage Backends
+- json:   legacy layout, one <eval_type>/<content_hash>.json file per entry (atomic writes)
+- sqlite: single-file transactional store (WAL) with compressed values, deduplicated
+          large strings and indexed stats
+Backends exchange results as JSON text so tiers above them never re-encode.
+"""
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from . import cache_codec
+
+logger = logging.getLogger(__name__)
+
+# (cached_at epoch seconds, result as JSON text)
+CacheRecord = Tuple[float, str]
+# (eval_type, content_hash, cached_at, accessed_at, hit_count, size_bytes) used by compaction
+EntryMeta = Tuple[str, str, float, float, int, int]
+
+
+class JsonDirCacheBackend:
+    """
+    One pretty-printed JSON file per entry under <root>/<eval_type>/ (the original layout).
+    File mtime is the write time; atime is set explicitly on every read and serves as the
+    access time for LRU eviction (hit counts are not tracked, so LFU degrades to LRU).
+    """
+
+    name = "json"
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, eval_type: str, content_hash: str) -> Path:
+        return self.root / eval_type / f"{content_hash}.json"
+
+    @staticmethod
+    def _read(path: Path) -> Tuple[str, str, CacheRecord]:
+        with open(path, 'r', encoding='utf-8') as f:
+            cached_data = json.load(f)
+        cached_at = datetime.fromisoformat(cached_data.get('cached_at', '1970-01-01')).timestamp()
+        payload = json.dumps(cached_data.get('result'), default=str)
+        return cached_data.get('eval_type', path.parent.name), cached_data.get('content_hash', path.stem), (cached_at, payload)
+
+    def get(self, eval_type: str, content_hash: str) -> Optional[CacheRecord]:
+        path = self._path(eval_type, content_hash)
+        if not path.exists():
+            return None
+        record = self._read(path)[2]
+        self._touch(path)
+        return record
+
+    @staticmethod
+    def _touch(path: Path) -> None:
+        try:
+            os.utime(path, (time.time(), path.stat().st_mtime))
+        except OSError:
+            pass
+
+    def get_many(self, eval_type: str, content_hashes: Iterable[str]) -> Dict[str, CacheRecord]:
+        found = {}
+        for content_hash in content_hashes:
+            record = self.get(eval_type, content_hash)
+            if record is not None:
+                found[content_hash] = record
+        return found
+
+    def set(self, eval_type: str, content_hash: str, cached_at: float, payload: str) -> None:
+        path = self._path(eval_type, content_hash)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        cache_data = {
+            'content_hash': content_hash,
+            'eval_type': eval_type,
+            'cached_at': datetime.fromtimestamp(cached_at).isoformat(),
+            'result': json.loads(payload)
+        }
+        # Write to a temp file in the same directory and rename, so readers never see partial JSON
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{content_hash[:16]}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(cache_data, f, indent=2, default=str)
+            os.replace(tmp_path, path)
+            os.utime(path, (cached_at, cached_at))
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def set_many(self, eval_type: str, records: Iterable[Tuple[str, float, str]]) -> None:
+        for content_hash, cached_at, payload in records:
+            self.set(eval_type, content_hash, cached_at, payload)
+
+    def delete_many(self, eval_type: str, content_hashes: Iterable[str]) -> int:
+        removed = 0
+        for content_hash in content_hashes:
+            try:
+                self._path(eval_type, content_hash).unlink()
+                removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+    def touch_many(self, eval_type: str, hits: Dict[str, int]) -> None:
+        for content_hash in hits:
+            self._touch(self._path(eval_type, content_hash))
+
+    def scan(self) -> Iterator[EntryMeta]:
+        for type_dir in self.root.iterdir():
+            if not type_dir.is_dir():
+                continue
+            with os.scandir(type_dir) as it:
+                for entry in it:
+                    if not entry.name.endswith(".json"):
+                        continue
+                    try:
+                        st = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    yield type_dir.name, entry.name[:-5], st.st_mtime, max(st.st_atime, st.st_mtime), 0, st.st_size
+
+    def reclaim(self) -> None:
+        # Remove temp files orphaned by writers that died mid-write
+        cutoff = time.time() - 3600
+        for tmp in self.root.rglob('.*.tmp'):
+            try:
+                if tmp.stat().st_mtime < cutoff:
+                    tmp.unlink()
+            except OSError:
+                pass
+
+    def clear(self) -> int:
+        count = 0
+        for cache_file in self.root.rglob('*.json'):
+            cache_file.unlink()
+            count += 1
+        return count
+
+    def stats(self) -> Dict:
+        by_type: Dict[str, Dict[str, int]] = {}
+        for cache_file in self.root.rglob('*.json'):
+            bucket = by_type.setdefault(cache_file.parent.name, {"count": 0, "bytes": 0})
+            bucket["count"] += 1
+            bucket["bytes"] += cache_file.stat().st_size
+        return {
+            "total_cached_results": sum(b["count"] for b in by_type.values()),
+            "total_size_bytes": sum(b["bytes"] for b in by_type.values()),
+            "by_eval_type": by_type,
+        }
+
+    def iter_entries(self) -> Iterator[Tuple[str, str, float, str]]:
+        """Yield (eval_type, content_hash, cached_at, payload) for every readable entry."""
+        for cache_file in self.root.rglob('*.json'):
+            try:
+                eval_type, content_hash, (cached_at, payload) = self._read(cache_file)
+            except Exception as e:
+                logger.warning(f"Skipping unreadable cache file {cache_file}: {e}")
+                continue
+            yield eval_type, content_hash, cached_at, payload
+
+
+class SQLiteCacheBackend:
+    """
+    All entries in one SQLite file (WAL mode, one connection per thread).
+    Values are cache_codec-encoded (tagged, compressed above a threshold). Large strings
+    are stored once in cache_blobs keyed by sha256 and referenced from entries, so answers
+    repeated across many qa_evaluation entries cost their bytes once.
+    Per-row size, access time and hit count make stats and eviction indexed queries.
+    """
+
+    name = "sqlite"
+    BATCH_SIZE = 500
+
+    def __init__(self, path: Path, vacuum_free_ratio: float = 0.25):
+        self.path = Path(path)
+        # VACUUM rewrites the whole file; only worth it once this share of pages is free
+        self.vacuum_free_ratio = vacuum_free_ratio
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS cache_entries (
+                    eval_type    TEXT    NOT NULL,
+                    content_hash TEXT    NOT NULL,
+                    cached_at    REAL    NOT NULL,
+                    accessed_at  REAL    NOT NULL,
+                    hit_count    INTEGER NOT NULL DEFAULT 0,
+                    size         INTEGER NOT NULL,
+                    value        BLOB    NOT NULL,
+                    PRIMARY KEY (eval_type, content_hash)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS idx_cache_entries_accessed ON cache_entries (eval_type, accessed_at);
+                CREATE TABLE IF NOT EXISTS cache_blobs (
+                    digest TEXT PRIMARY KEY,
+                    size   INTEGER NOT NULL,
+                    value  BLOB    NOT NULL
+                ) WITHOUT ROWID;
+            """)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(cache_entries)")}
+            if "blob_refs" not in columns:
+                conn.execute("ALTER TABLE cache_entries ADD COLUMN blob_refs TEXT")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _resolve(self, conn: sqlite3.Connection, payloads: List[str]) -> List[Optional[str]]:
+        """Substitute blob references in a batch of decoded payloads (one blob query)"""
+        digests = {d for p in payloads for d in cache_codec.blob_refs(p)}
+        if not digests:
+            return payloads
+        blobs: Dict[str, str] = {}
+        digest_list = list(digests)
+        for i in range(0, len(digest_list), self.BATCH_SIZE):
+            batch = digest_list[i:i + self.BATCH_SIZE]
+            rows = conn.execute(
+                f"SELECT digest, value FROM cache_blobs WHERE digest IN ({','.join('?' * len(batch))})", batch
+            ).fetchall()
+            blobs.update({digest: cache_codec.decode(value) for digest, value in rows})
+        resolved: List[Optional[str]] = []
+        for p in payloads:
+            try:
+                resolved.append(cache_codec.restore(p, lambda d: blobs[d]))
+            except KeyError:
+                # Dangling reference: treat the entry as a miss rather than return a corrupt payload
+                resolved.append(None)
+        return resolved
+
+    def get(self, eval_type: str, content_hash: str) -> Optional[CacheRecord]:
+        return self.get_many(eval_type, [content_hash]).get(content_hash)
+
+    def get_many(self, eval_type: str, content_hashes: Iterable[str]) -> Dict[str, CacheRecord]:
+        hashes = list(dict.fromkeys(content_hashes))
+        found: Dict[str, CacheRecord] = {}
+        conn = self._conn()
+        now = time.time()
+        with conn:
+            for i in range(0, len(hashes), self.BATCH_SIZE):
+                batch = hashes[i:i + self.BATCH_SIZE]
+                marks = ",".join("?" * len(batch))
+                rows = conn.execute(
+                    f"SELECT content_hash, cached_at, value FROM cache_entries WHERE eval_type = ? AND content_hash IN ({marks})",
+                    [eval_type, *batch],
+                ).fetchall()
+                payloads = self._resolve(conn, [cache_codec.decode(value) for _, _, value in rows])
+                for (content_hash, cached_at, _), payload in zip(rows, payloads):
+                    if payload is not None:
+                        found[content_hash] = (cached_at, payload)
+                if rows:
+                    conn.execute(
+                        f"UPDATE cache_entries SET accessed_at = ?, hit_count = hit_count + 1 WHERE eval_type = ? AND content_hash IN ({','.join('?' * len(rows))})",
+                        [now, eval_type, *[r[0] for r in rows]],
+                    )
+        return found
+
+    def set(self, eval_type: str, content_hash: str, cached_at: float, payload: str) -> None:
+        self.set_many(eval_type, [(content_hash, cached_at, payload)])
+
+    def set_many(self, eval_type: str, records: Iterable[Tuple[str, float, str]]) -> None:
+        rows = []
+        blobs: Dict[str, bytes] = {}
+        for content_hash, cached_at, payload in records:
+            payload, entry_blobs = cache_codec.dedupe(payload)
+            for digest, literal in entry_blobs.items():
+                if digest not in blobs:
+                    blobs[digest] = cache_codec.encode(literal)
+            value = cache_codec.encode(payload)
+            refs = json.dumps(sorted(entry_blobs)) if entry_blobs else None
+            rows.append((eval_type, content_hash, cached_at, cached_at, len(value), value, refs))
+        if not rows:
+            return
+        conn = self._conn()
+        with conn:
+            if blobs:
+                conn.executemany(
+                    "INSERT OR IGNORE INTO cache_blobs (digest, size, value) VALUES (?, ?, ?)",
+                    [(digest, len(value), value) for digest, value in blobs.items()],
+                )
+            conn.executemany(
+                "INSERT OR REPLACE INTO cache_entries (eval_type, content_hash, cached_at, accessed_at, hit_count, size, value, blob_refs) "
+                "VALUES (?, ?, ?, ?, 0, ?, ?, ?)",
+                rows,
+            )
+
+    def delete_many(self, eval_type: str, content_hashes: Iterable[str]) -> int:
+        hashes = list(content_hashes)
+        removed = 0
+        conn = self._conn()
+        with conn:
+            for i in range(0, len(hashes), self.BATCH_SIZE):
+                batch = hashes[i:i + self.BATCH_SIZE]
+                cur = conn.execute(
+                    f"DELETE FROM cache_entries WHERE eval_type = ? AND content_hash IN ({','.join('?' * len(batch))})",
+                    [eval_type, *batch],
+                )
+                removed += cur.rowcount
+        return removed
+
+    def touch_many(self, eval_type: str, hits: Dict[str, int]) -> None:
+        if not hits:
+            return
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                "UPDATE cache_entries SET accessed_at = ?, hit_count = hit_count + ? WHERE eval_type = ? AND content_hash = ?",
+                [(now, count, eval_type, content_hash) for content_hash, count in hits.items()],
+            )
+
+    def scan(self) -> Iterator[EntryMeta]:
+        cursor = self._conn().execute(
+            "SELECT eval_type, content_hash, cached_at, accessed_at, hit_count, size FROM cache_entries"
+        )
+        yield from cursor
+
+    def _collect_blobs(self, conn: sqlite3.Connection) -> int:
+        """Delete blobs no longer referenced by any entry"""
+        with conn:
+            # Hold the write lock so no writer can reference a blob between the scan and the delete
+            conn.execute("BEGIN IMMEDIATE")
+            referenced = set()
+            for (refs,) in conn.execute("SELECT blob_refs FROM cache_entries WHERE blob_refs IS NOT NULL"):
+                referenced.update(json.loads(refs))
+            orphans = [digest for (digest,) in conn.execute("SELECT digest FROM cache_blobs") if digest not in referenced]
+            for i in range(0, len(orphans), self.BATCH_SIZE):
+                batch = orphans[i:i + self.BATCH_SIZE]
+                conn.execute(f"DELETE FROM cache_blobs WHERE digest IN ({','.join('?' * len(batch))})", batch)
+        return len(orphans)
+
+    def reclaim(self) -> None:
+        """Drop orphaned blobs and return freed pages to the filesystem after large deletions."""
+        conn = self._conn()
+        self._collect_blobs(conn)
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        total_pages = conn.execute("PRAGMA page_count").fetchone()[0]
+        if not total_pages or free_pages / total_pages < self.vacuum_free_ratio:
+            return
+        logger.info(f"🧹 Vacuuming evaluation cache: {free_pages}/{total_pages} pages free")
+        conn.execute("VACUUM")
+        # In WAL mode the file only shrinks once the vacuumed pages are checkpointed
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def clear(self) -> int:
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM cache_blobs")
+            return conn.execute("DELETE FROM cache_entries").rowcount
+
+    def stats(self) -> Dict:
+        rows = self._conn().execute(
+            "SELECT eval_type, COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries GROUP BY eval_type"
+        ).fetchall()
+        by_type = {eval_type: {"count": count, "bytes": size} for eval_type, count, size in rows}
+        blob_count, blob_bytes = self._conn().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_blobs").fetchone()
+        return {
+            "total_cached_results": sum(b["count"] for b in by_type.values()),
+            "total_size_bytes": sum(b["bytes"] for b in by_type.values()) + blob_bytes,
+            "by_eval_type": by_type,
+            "shared_blobs": {"count": blob_count, "bytes": blob_bytes},
+            "file_size_bytes": self.path.stat().st_size if self.path.exists() else 0,
+        }
+
+    def iter_entries(self) -> Iterator[Tuple[str, str, float, str]]:
+        conn = self._conn()
+        cursor = conn.execute("SELECT eval_type, content_hash, cached_at, value FROM cache_entries")
+        while True:
+            rows = cursor.fetchmany(self.BATCH_SIZE)
+            if not rows:
+                break
+            payloads = self._resolve(conn, [cache_codec.decode(value) for _, _, _, value in rows])
+            for (eval_type, content_hash, cached_at, _), payload in zip(rows, payloads):
+                if payload is not None:
+                    yield eval_type, content_hash, cached_at, payload
+
+
+def create_cache_backend(name: str, root: Path, vacuum_free_ratio: float = 0.25):
+    """Build the EvaluationCache storage backend by name (json | sqlite)"""
+    name = (name or "json").lower()
+    if name == "sqlite":
+        return SQLiteCacheBackend(Path(root) / "cache.sqlite3", vacuum_free_ratio=vacuum_free_ratio)
+    if name != "json":
+        logger.warning(f"Unknown EVALUATION_CACHE_BACKEND '{name}', using json")
+    return JsonDirCacheBackend(Path(root))
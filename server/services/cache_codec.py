@@ -0,0 +1,120 @@
+"""
+Evaluation Cache Value Codec
+Compression for cached payloads and content-addressed dedup of large strings
+"""
+import hashlib
+import json
+import os
+import re
+import zlib
+from typing import Callable, Dict, Iterable, Tuple, Union
+
+# Optional zstd (faster and smaller than zlib); zlib is always available
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+COMPRESSION = os.getenv("EVAL_CACHE_COMPRESSION", "zstd").lower()  # zstd | zlib | none
+COMPRESS_MIN_BYTES = int(os.getenv("EVAL_CACHE_COMPRESS_MIN_BYTES", "512"))
+DEDUP_BLOBS = os.getenv("EVAL_CACHE_DEDUP_BLOBS", "true").lower() in ("1", "true", "yes")
+DEDUP_MIN_CHARS = int(os.getenv("EVAL_CACHE_DEDUP_MIN_CHARS", "1024"))
+
+# Tags for encoded values; JSON text never starts with these bytes, so untagged
+# values written before compression existed still decode as raw JSON
+TAG_RAW = b"j"
+TAG_ZLIB = b"z"
+TAG_ZSTD = b"s"
+
+# A deduplicated string is replaced in the payload by this sentinel string literal
+_BLOB_PREFIX = "\x00blob:"
+BLOB_REF_RE = re.compile(r'"\\u0000blob:([0-9a-f]{64})"')
+
+if ZSTD_AVAILABLE:
+    _zstd_compressor = zstandard.ZstdCompressor(level=3)
+    _zstd_decompressor = zstandard.ZstdDecompressor()
+
+
+def encode(payload: Union[str, bytes]) -> bytes:
+    """Tag and (above the threshold) compress a payload"""
+    raw = payload.encode("utf-8") if isinstance(payload, str) else payload
+    if COMPRESSION == "none" or len(raw) < COMPRESS_MIN_BYTES:
+        return TAG_RAW + raw
+    if COMPRESSION == "zstd" and ZSTD_AVAILABLE:
+        return TAG_ZSTD + _zstd_compressor.compress(raw)
+    return TAG_ZLIB + zlib.compress(raw, 6)
+
+
+def decode(value: bytes) -> str:
+    tag, body = value[:1], value[1:]
+    if tag == TAG_ZSTD:
+        if not ZSTD_AVAILABLE:
+            raise RuntimeError("Cache entry is zstd-compressed but the 'zstandard' package is not installed")
+        return _zstd_decompressor.decompress(body).decode("utf-8")
+    if tag == TAG_ZLIB:
+        return zlib.decompress(body).decode("utf-8")
+    if tag == TAG_RAW:
+        return body.decode("utf-8")
+    return value.decode("utf-8")
+
+
+def pack(payload: str) -> Union[str, bytes]:
+    """Compact in-memory form: small payloads stay as text, large ones are compressed bytes"""
+    if len(payload) < COMPRESS_MIN_BYTES or COMPRESSION == "none":
+        return payload
+    return encode(payload)
+
+
+def unpack(value: Union[str, bytes]) -> str:
+    return value if isinstance(value, str) else decode(value)
+
+
+def dedupe(payload: str) -> Tuple[str, Dict[str, str]]:
+    """
+    Replace every string of at least DEDUP_MIN_CHARS chars in a JSON payload with a
+    sentinel naming its sha256. Returns the rewritten payload and {digest: JSON literal}.
+    """
+    if not DEDUP_BLOBS or len(payload) < DEDUP_MIN_CHARS:
+        return payload, {}
+
+    blobs: Dict[str, str] = {}
+
+    def walk(node):
+        if isinstance(node, str):
+            if len(node) >= DEDUP_MIN_CHARS:
+                literal = json.dumps(node)
+                digest = hashlib.sha256(literal.encode("utf-8")).hexdigest()
+                blobs[digest] = literal
+                return _BLOB_PREFIX + digest
+            return node
+        if isinstance(node, list):
+            return [walk(v) for v in node]
+        if isinstance(node, dict):
+            return {k: walk(v) for k, v in node.items()}
+        return node
+
+    rewritten = walk(json.loads(payload))
+    if not blobs:
+        return payload, {}
+    return json.dumps(rewritten), blobs
+
+
+def blob_refs(payload: str) -> Iterable[str]:
+    return BLOB_REF_RE.findall(payload)
+
+
+def restore(payload: str, lookup: Callable[[str], str]) -> str:
+    """Substitute blob sentinels with their literals (pure text replacement, no JSON parse)."""
+    if "\\u0000blob:" not in payload:
+        return payload
+    return BLOB_REF_RE.sub(lambda m: lookup(m.group(1)), payload)
+
+
+def describe() -> Dict:
+    return {
+        "compression": COMPRESSION if (COMPRESSION != "zstd" or ZSTD_AVAILABLE) else "zlib (zstandard not installed)",
+        "compress_min_bytes": COMPRESS_MIN_BYTES,
+        "dedup_blobs": DEDUP_BLOBS,
+        "dedup_min_chars": DEDUP_MIN_CHARS,
+    }
@@ -0,0 +1,87 @@
+"""
+Evaluation Cache Compaction
+Decides which entries to drop: expired entries first, then the least recently (LRU)
+or least frequently (LFU) used entries of each eval_type until it fits its byte budget
+"""
+import json
+import logging
+import os
+from collections import defaultdict
+from typing import Dict, Iterable, List, Tuple
+
+from .cache_backends import EntryMeta
+
+logger = logging.getLogger(__name__)
+
+
+def budgets_from_env() -> Dict[str, int]:
+    """Per-eval_type byte budgets, e.g. EVAL_CACHE_MAX_BYTES='{"ocr": 268435456}'"""
+    raw = os.getenv("EVAL_CACHE_MAX_BYTES", "")
+    if not raw:
+        return {}
+    try:
+        return {eval_type: int(limit) for eval_type, limit in json.loads(raw).items()}
+    except (ValueError, AttributeError, TypeError) as e:
+        logger.warning(f"Ignoring invalid EVAL_CACHE_MAX_BYTES: {e}")
+        return {}
+
+
+def plan_compaction(entries: Iterable[EntryMeta], now: float, ttl_seconds: float, default_budget: int,
+                    budgets: Dict[str, int], policy: str = "lru") -> Dict[str, Dict]:
+    """
+    Return {eval_type: {"expired": [hash...], "evicted": [hash...], "reclaimed_bytes", "remaining_bytes"}}.
+    A budget of 0 means unbounded (only expired entries are removed).
+    """
+    by_type: Dict[str, List[EntryMeta]] = defaultdict(list)
+    for entry in entries:
+        by_type[entry[0]].append(entry)
+
+    if policy == "lfu":
+        order = lambda e: (e[4], e[3])  # fewest hits, then oldest access
+    else:
+        order = lambda e: e[3]          # oldest access
+
+    plan = {}
+    for eval_type, type_entries in by_type.items():
+        expired: List[str] = []
+        reclaimed = 0
+        live: List[EntryMeta] = []
+        for entry in type_entries:
+            if now - entry[2] > ttl_seconds:
+                expired.append(entry[1])
+                reclaimed += entry[5]
+            else:
+                live.append(entry)
+
+        remaining = sum(e[5] for e in live)
+        budget = budgets.get(eval_type, default_budget)
+        evicted: List[str] = []
+        if budget > 0 and remaining > budget:
+            for entry in sorted(live, key=order):
+                if remaining <= budget:
+                    break
+                evicted.append(entry[1])
+                remaining -= entry[5]
+                reclaimed += entry[5]
+
+        plan[eval_type] = {
+            "expired": expired,
+            "evicted": evicted,
+            "reclaimed_bytes": reclaimed,
+            "remaining_bytes": remaining,
+        }
+    return plan
+
+
+def summarize(plan: Dict[str, Dict]) -> Tuple[Dict[str, Dict], int]:
+    """Counts-only view of a plan for logs and endpoints, plus total reclaimed bytes"""
+    report = {
+        eval_type: {
+            "expired": len(p["expired"]),
+            "evicted": len(p["evicted"]),
+            "reclaimed_bytes": p["reclaimed_bytes"],
+            "remaining_bytes": p["remaining_bytes"],
+        }
+        for eval_type, p in plan.items()
+    }
+    return report, sum(p["reclaimed_bytes"] for p in plan.values())
@@ -0,0 +1,213 @@
+"""
+Evaluation Cache Export / Import
+Portable archive of cached results so a fresh deployment starts warm instead of
+paying full LLM cost (and losing re-evaluation determinism) for every repeat answer.
+
+Archive format: gzip-compressed JSON lines. The first line is a header
+{"format": "evaluation_cache_export", "version": 1, ...}; every other line is one
+entry {"t": eval_type, "h": content_hash, "c": cached_at, "p": payload_json_text}.
+"""
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_FORMAT = "evaluation_cache_export"
+ARCHIVE_VERSION = 1
+IMPORT_BATCH = 500
+
+
+class TransferProgress:
+    """Thread-safe progress counters for the running (or last) import, exposed by the admin endpoint"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state: Dict = {"state": "idle"}
+
+    def start(self, path: str, bytes_total: int) -> None:
+        with self._lock:
+            if self._state["state"] == "running":
+                raise RuntimeError(f"A cache import is already running ({self._state['path']})")
+            self._state = {
+                "state": "running",
+                "path": path,
+                "bytes_total": bytes_total,
+                "bytes_read": 0,
+                "imported": 0,
+                "skipped_existing": 0,
+                "skipped_expired": 0,
+                "by_eval_type": defaultdict(int),
+                "started_at": datetime.now().isoformat(),
+                "finished_at": None,
+                "error": None,
+            }
+
+    def set_source(self, path: str, bytes_total: int) -> None:
+        """Fill in the archive of an import reserved with start() before the archive was written"""
+        with self._lock:
+            self._state["path"] = path
+            self._state["bytes_total"] = bytes_total
+
+    def update(self, bytes_read: int, eval_type: str = None, imported: int = 0,
+               skipped_existing: int = 0, skipped_expired: int = 0) -> None:
+        with self._lock:
+            state = self._state
+            state["bytes_read"] = bytes_read
+            state["imported"] += imported
+            state["skipped_existing"] += skipped_existing
+            state["skipped_expired"] += skipped_expired
+            if eval_type and imported:
+                state["by_eval_type"][eval_type] += imported
+
+    def finish(self, error: Optional[str] = None) -> None:
+        with self._lock:
+            self._state["state"] = "failed" if error else "completed"
+            self._state["error"] = error
+            self._state["finished_at"] = datetime.now().isoformat()
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            state = dict(self._state)
+        if "by_eval_type" in state:
+            state["by_eval_type"] = dict(state["by_eval_type"])
+        total = state.get("bytes_total")
+        if total:
+            state["percent"] = round(100.0 * state["bytes_read"] / total, 1)
+        return state
+
+
+import_progress = TransferProgress()
+
+
+def export_archive(backend, path: Path, eval_types: Optional[Iterable[str]] = None,
+                   max_age_days: Optional[float] = None, ttl_seconds: Optional[float] = None) -> Dict:
+    """
+    Stream every matching entry of a cache backend into a gzip JSONL archive.
+    Entries older than max_age_days (or already past the cache TTL) are left out.
+    Written to a temp file and renamed so a failed export never leaves a truncated archive.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    wanted = set(eval_types) if eval_types else None
+    now = time.time()
+    cutoff = now - max_age_days * 86400 if max_age_days else None
+    expiry = now - ttl_seconds if ttl_seconds else None
+
+    counts: Dict[str, int] = defaultdict(int)
+    tmp_path = path.with_name(path.name + ".tmp")
+    try:
+        with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=6) as out:
+            header = {
+                "format": ARCHIVE_FORMAT,
+                "version": ARCHIVE_VERSION,
+                "exported_at": datetime.fromtimestamp(now).isoformat(),
+                "eval_types": sorted(wanted) if wanted else None,
+                "max_age_days": max_age_days,
+            }
+            out.write(json.dumps(header) + "\n")
+            for eval_type, content_hash, cached_at, payload in backend.iter_entries():
+                if wanted is not None and eval_type not in wanted:
+                    continue
+                if (cutoff is not None and cached_at < cutoff) or (expiry is not None and cached_at < expiry):
+                    continue
+                out.write(json.dumps({"t": eval_type, "h": content_hash, "c": cached_at, "p": payload}) + "\n")
+                counts[eval_type] += 1
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+    report = {
+        "path": str(path),
+        "entries": sum(counts.values()),
+        "by_eval_type": dict(counts),
+        "size_bytes": path.stat().st_size,
+    }
+    logger.info(f"📤 Exported {report['entries']} cache entries to {path} ({report['size_bytes']:,} bytes)")
+    return report
+
+
+def _read_header(line: str) -> Dict:
+    try:
+        header = json.loads(line)
+    except ValueError:
+        header = None
+    if not isinstance(header, dict) or header.get("format") != ARCHIVE_FORMAT:
+        raise ValueError("Not an evaluation cache export archive")
+    if header.get("version", 0) > ARCHIVE_VERSION:
+        raise ValueError(f"Unsupported archive version {header.get('version')}")
+    return header
+
+
+def import_archive(backend, path: Path, shared=None, overwrite: bool = False,
+                   ttl_seconds: Optional[float] = None, progress: TransferProgress = import_progress,
+                   claimed: bool = False) -> Dict:
+    """
+    Load an export archive into a cache backend (and the shared tier, when configured).
+    Entries already present locally are kept unless the archive copy is newer or overwrite=True;
+    expired entries are skipped. cached_at is preserved so imported results age normally.
+    claimed=True means the caller already reserved the import with progress.start().
+    Blocking; run it off the event loop.
+    """
+    path = Path(path)
+    if claimed:
+        try:
+            progress.set_source(str(path), path.stat().st_size)
+        except OSError as e:
+            progress.finish(error=str(e))
+            raise
+    else:
+        progress.start(str(path), path.stat().st_size)
+    expiry = time.time() - ttl_seconds if ttl_seconds else None
+    pending: Dict[str, List[Tuple[str, float, str]]] = defaultdict(list)
+
+    def flush(eval_type: str, bytes_read: int) -> None:
+        batch = pending.pop(eval_type, [])
+        if not batch:
+            return
+        if not overwrite:
+            existing = backend.get_many(eval_type, [content_hash for content_hash, _, _ in batch])
+            fresh = [r for r in batch if r[0] not in existing or existing[r[0]][0] < r[1]]
+        else:
+            fresh = batch
+        if fresh:
+            backend.set_many(eval_type, fresh)
+            if shared is not None:
+                shared.set_many(eval_type, fresh)
+        progress.update(bytes_read, eval_type, imported=len(fresh), skipped_existing=len(batch) - len(fresh))
+
+    try:
+        with open(path, "rb") as raw, gzip.open(raw, "rt", encoding="utf-8") as lines:
+            _read_header(next(lines, ""))
+            for line in lines:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                if expiry is not None and entry["c"] < expiry:
+                    progress.update(raw.tell(), skipped_expired=1)
+                    continue
+                pending[entry["t"]].append((entry["h"], entry["c"], entry["p"]))
+                if len(pending[entry["t"]]) >= IMPORT_BATCH:
+                    flush(entry["t"], raw.tell())
+            for eval_type in list(pending):
+                flush(eval_type, raw.tell())
+    except Exception as e:
+        progress.finish(error=str(e))
+        logger.error(f"❌ Cache import from {path} failed: {e}")
+        raise
+
+    progress.finish()
+    report = progress.snapshot()
+    logger.info(
+        f"📥 Imported {report['imported']} cache entries from {path} "
+        f"({report['skipped_existing']} already cached, {report['skipped_expired']} expired)"
+    )
+    return report
@@ -0,0 +1,149 @@
+"""
+LLM Circuit Breaker
+Per-model breaker that fails fast while the backend is overloaded instead of
+letting every call sit through its own retry/backoff cycle
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """
+    Classic three-state breaker over a sliding time window:
+    - CLOSED: calls flow; opens when the failure ratio over the window reaches
+      failure_ratio (with at least min_calls observations).
+    - OPEN: calls are rejected immediately for open_seconds.
+    - HALF_OPEN: up to half_open_probes calls are let through; a success closes the
+      breaker, a failure re-opens it.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_ratio: float = 0.5, min_calls: int = 10,
+                 window_seconds: float = 60.0, open_seconds: float = 30.0, half_open_probes: int = 1):
+        self.name = name
+        self.failure_ratio = failure_ratio
+        self.min_calls = min_calls
+        self.window_seconds = window_seconds
+        self.open_seconds = open_seconds
+        self.half_open_probes = max(1, half_open_probes)
+
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._outcomes: Deque[Tuple[float, bool]] = deque()
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._rejected = 0
+        self._times_opened = 0
+
+    @classmethod
+    def from_env(cls, name: str) -> "CircuitBreaker":
+        return cls(
+            name,
+            failure_ratio=float(os.getenv("LLM_BREAKER_FAILURE_RATIO", "0.5")),
+            min_calls=int(os.getenv("LLM_BREAKER_MIN_CALLS", "10")),
+            window_seconds=float(os.getenv("LLM_BREAKER_WINDOW_SECONDS", "60")),
+            open_seconds=float(os.getenv("LLM_BREAKER_OPEN_SECONDS", "30")),
+            half_open_probes=int(os.getenv("LLM_BREAKER_HALF_OPEN_PROBES", "1")),
+        )
+
+    def allow(self) -> bool:
+        """Return True if a call may proceed. Every allowed call must be followed by record()."""
+        with self._lock:
+            if self._state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.open_seconds:
+                    self._rejected += 1
+                    return False
+                self._state = self.HALF_OPEN
+                self._probes_in_flight = 0
+                logger.info(f"Circuit breaker '{self.name}' half-open: sending probe")
+
+            if self._state == self.HALF_OPEN:
+                if self._probes_in_flight >= self.half_open_probes:
+                    self._rejected += 1
+                    return False
+                self._probes_in_flight += 1
+            return True
+
+    def record(self, success: Optional[bool]) -> None:
+        """Record a call outcome. None means the call was abandoned (e.g. cancelled) without a verdict."""
+        with self._lock:
+            now = time.monotonic()
+            if self._state == self.HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+                if success is True:
+                    self._state = self.CLOSED
+                    self._outcomes.clear()
+                    logger.info(f"Circuit breaker '{self.name}' closed: probe succeeded")
+                elif success is False:
+                    self._trip(now)
+                return
+
+            if success is None:
+                return
+            self._outcomes.append((now, success))
+            while self._outcomes and now - self._outcomes[0][0] > self.window_seconds:
+                self._outcomes.popleft()
+
+            if self._state == self.CLOSED and len(self._outcomes) >= self.min_calls:
+                failures = sum(1 for _, ok in self._outcomes if not ok)
+                if failures / len(self._outcomes) >= self.failure_ratio:
+                    self._trip(now)
+
+    def _trip(self, now: float) -> None:
+        # Caller holds the lock.
+        self._state = self.OPEN
+        self._opened_at = now
+        self._times_opened += 1
+        self._outcomes.clear()
+        logger.warning(f"⚡ Circuit breaker '{self.name}' OPEN for {self.open_seconds}s: failing LLM calls fast")
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+                return self.HALF_OPEN
+            return self._state
+
+    def snapshot(self) -> Dict:
+        state = self.state
+        with self._lock:
+            failures = sum(1 for _, ok in self._outcomes if not ok)
+            retry_in = max(0.0, self.open_seconds - (time.monotonic() - self._opened_at)) if state == self.OPEN else 0.0
+            return {
+                "state": state,
+                "window_calls": len(self._outcomes),
+                "window_failures": failures,
+                "failure_ratio_threshold": self.failure_ratio,
+                "times_opened": self._times_opened,
+                "rejected_calls": self._rejected,
+                "retry_in_seconds": round(retry_in, 1),
+            }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_registry_lock = threading.Lock()
+
+
+def get_circuit_breaker(model: str) -> CircuitBreaker:
+    """Shared breaker for a model (one per process)"""
+    with _registry_lock:
+        breaker = _breakers.get(model)
+        if breaker is None:
+            breaker = CircuitBreaker.from_env(model)
+            _breakers[model] = breaker
+        return breaker
+
+
+def get_circuit_breaker_states() -> Dict[str, Dict]:
+    with _registry_lock:
+        breakers = list(_breakers.values())
+    return {b.name: b.snapshot() for b in breakers}
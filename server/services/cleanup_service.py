@@ -4,7 +4,7 @@ import time
 from datetime import datetime, timedelta
 from pathlib import Path
 from sqlalchemy.orm import Session
-from models import Assignment, AssignmentFile
+from models import Assignment, AssignmentFile, EvaluationJob, EvaluationJobEvent, EvaluationTask
 
 logger = logging.getLogger(__name__)
 
@@ -18,6 +18,15 @@ class CleanupService:
             cutoff_date = datetime.now() - timedelta(days=days)
             logger.info(f"Starting database and file cleanup. Cutoff: {cutoff_date}")
 
+            # 0. Drop old background evaluation jobs (they reference the assignments below)
+            old_jobs = db.query(EvaluationJob.id).filter(EvaluationJob.created_at < cutoff_date)
+            db.query(EvaluationJobEvent).filter(EvaluationJobEvent.job_id.in_(old_jobs)).delete(synchronize_session=False)
+            db.query(EvaluationTask).filter(EvaluationTask.job_id.in_(old_jobs)).delete(synchronize_session=False)
+            removed_jobs = db.query(EvaluationJob).filter(EvaluationJob.created_at < cutoff_date).delete(synchronize_session=False)
+            db.commit()
+            if removed_jobs:
+                logger.info(f"Removed {removed_jobs} evaluation jobs older than the cutoff.")
+
             # 1. Find assignments older than the cutoff
             old_assignments = db.query(Assignment).filter(Assignment.created_at < cutoff_date).all()
             
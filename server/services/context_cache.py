@@ -0,0 +1,195 @@
+"""
+Gemini Context Caching
+Creates provider-side cached-content handles for large, stable prompt prefixes
+(role + rubric + reference material) so a batch sends them once instead of per call
+"""
+import asyncio
+import contextvars
+import hashlib
+import logging
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Optional, Set
+
+from .single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Keys used inside the current generate/re-evaluate batch (see ContextCacheManager.batch)
+_batch_scope: contextvars.ContextVar[Optional[Set[str]]] = contextvars.ContextVar("context_cache_batch_scope", default=None)
+
+
+class _CachedPrefix:
+    __slots__ = ("name", "model", "expires_at", "last_used", "refs")
+
+    def __init__(self, name: str, model: str, expires_at: float):
+        self.name = name
+        self.model = model
+        self.expires_at = expires_at
+        self.last_used = time.time()
+        self.refs = 0
+
+
+class ContextCacheManager:
+    """
+    Maps prompt prefixes to provider cached-content handles.
+    - Handles are created lazily, once per (model, prefix), and shared by all callers.
+    - TTL is extended when a handle close to expiry is reused.
+    - Handles used inside a batch() scope are deleted when the last batch using them ends;
+      anything else is left to the provider TTL and sweep().
+    - Prefixes below min_tokens are not worth caching (provider minimum) and return None.
+    """
+
+    REFRESH_MARGIN_SECONDS = 60
+    FAILURE_BACKOFF_SECONDS = 300
+
+    def __init__(self, enabled: bool = True, ttl_seconds: int = 900, min_tokens: int = 4096,
+                 sweep_interval_seconds: int = 300, idle_seconds: int = 600):
+        self.enabled = enabled
+        self.ttl_seconds = ttl_seconds
+        self.min_tokens = min_tokens
+        self.sweep_interval_seconds = sweep_interval_seconds
+        self.idle_seconds = idle_seconds
+        self._lock = threading.Lock()
+        self._entries: Dict[str, _CachedPrefix] = {}
+        self._failed_until: Dict[str, float] = {}
+        self._create_flight = SingleFlight("context_cache_create")
+        self._stats = {"created": 0, "reused": 0, "refreshed": 0, "deleted": 0, "failures": 0, "skipped_small": 0}
+
+    @classmethod
+    def from_env(cls) -> "ContextCacheManager":
+        return cls(
+            enabled=os.getenv("GEMINI_CONTEXT_CACHE", "true").lower() in ("1", "true", "yes"),
+            ttl_seconds=int(os.getenv("GEMINI_CONTEXT_CACHE_TTL_SECONDS", "900")),
+            min_tokens=int(os.getenv("GEMINI_CONTEXT_CACHE_MIN_TOKENS", "4096")),
+            sweep_interval_seconds=int(os.getenv("GEMINI_CONTEXT_CACHE_SWEEP_SECONDS", "300")),
+            idle_seconds=int(os.getenv("GEMINI_CONTEXT_CACHE_IDLE_SECONDS", "600")),
+        )
+
+    @staticmethod
+    def _key(model: str, prefix: str) -> str:
+        return hashlib.sha256(f"{model}|||{prefix}".encode()).hexdigest()
+
+    async def get_handle(self, backend, model: str, prefix: str) -> Optional[str]:
+        """Return a cached-content name for this prefix, creating it if needed; None means send inline."""
+        if not self.enabled or backend is None:
+            return None
+        if len(prefix) // 4 < self.min_tokens:
+            self._stats["skipped_small"] += 1
+            return None
+
+        key = self._key(model, prefix)
+        now = time.time()
+        if self._failed_until.get(key, 0) > now:
+            return None
+
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at - now <= self.REFRESH_MARGIN_SECONDS:
+            entry = await self._refresh(backend, key, entry)
+
+        if entry is None:
+            entry = await self._create_flight.do(key, lambda: self._create(backend, key, model, prefix))
+            if entry is None:
+                return None
+        else:
+            self._stats["reused"] += 1
+
+        entry.last_used = time.time()
+        scope = _batch_scope.get()
+        if scope is not None and key not in scope:
+            scope.add(key)
+            with self._lock:
+                entry.refs += 1
+        return entry.name
+
+    async def _create(self, backend, key: str, model: str, prefix: str) -> Optional[_CachedPrefix]:
+        existing = self._entries.get(key)
+        if existing is not None:
+            return existing
+        try:
+            name = await backend.create_cache(model, prefix, self.ttl_seconds, f"rubric-{key[:12]}")
+        except Exception as e:
+            self._stats["failures"] += 1
+            self._failed_until[key] = time.time() + self.FAILURE_BACKOFF_SECONDS
+            logger.warning(f"Context cache creation failed, sending prompt inline: {e}")
+            return None
+
+        entry = _CachedPrefix(name, model, time.time() + self.ttl_seconds)
+        with self._lock:
+            self._entries[key] = entry
+        self._stats["created"] += 1
+        logger.info(f"🗂️ Created context cache {name} for rubric prefix (~{len(prefix) // 4} tokens)")
+        return entry
+
+    async def _refresh(self, backend, key: str, entry: _CachedPrefix) -> Optional[_CachedPrefix]:
+        try:
+            await backend.update_cache(entry.name, self.ttl_seconds)
+            entry.expires_at = time.time() + self.ttl_seconds
+            self._stats["refreshed"] += 1
+            return entry
+        except Exception as e:
+            logger.info(f"Context cache {entry.name} could not be refreshed ({e}); recreating")
+            self.invalidate_name(entry.name)
+            return None
+
+    def invalidate_name(self, name: str) -> None:
+        """Forget a handle the provider rejected (expired or deleted elsewhere)."""
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if entry.name == name:
+                    del self._entries[key]
+
+    async def _delete(self, backend, entry: _CachedPrefix) -> None:
+        try:
+            await backend.delete_cache(entry.name)
+            self._stats["deleted"] += 1
+        except Exception as e:
+            logger.debug(f"Context cache {entry.name} delete failed (will expire via TTL): {e}")
+
+    @asynccontextmanager
+    async def batch(self, backend):
+        """Scope one evaluation batch: handles it created are cleaned up when no batch uses them."""
+        keys: Set[str] = set()
+        token = _batch_scope.set(keys)
+        try:
+            yield
+        finally:
+            _batch_scope.reset(token)
+            to_delete = []
+            with self._lock:
+                for key in keys:
+                    entry = self._entries.get(key)
+                    if entry is None:
+                        continue
+                    entry.refs -= 1
+                    if entry.refs <= 0:
+                        del self._entries[key]
+                        to_delete.append(entry)
+            if backend is not None:
+                await asyncio.gather(*[self._delete(backend, e) for e in to_delete])
+
+    async def sweep(self, backend, idle_seconds: Optional[int] = None) -> int:
+        """Delete expired handles and unscoped handles idle for longer than idle_seconds."""
+        if idle_seconds is None:
+            idle_seconds = self.idle_seconds
+        now = time.time()
+        to_delete = []
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if entry.refs <= 0 and (entry.expires_at <= now or now - entry.last_used > idle_seconds):
+                    del self._entries[key]
+                    to_delete.append(entry)
+        if backend is not None:
+            await asyncio.gather(*[self._delete(backend, e) for e in to_delete])
+        return len(to_delete)
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            active = len(self._entries)
+        return {"enabled": self.enabled, "active_handles": active, **self._stats}
+
+
+# Shared by every GeminiService instance in the process
+prompt_cache = ContextCacheManager.from_env()
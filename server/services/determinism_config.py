@@ -5,9 +5,20 @@ Ensures reproducible, consistent evaluation results across multiple sessions
 import hashlib
 import json
 import logging
-from pathlib import Path
-from typing import Dict, Optional, Any
+import os
+import threading
+import time
+from collections import defaultdict
 from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Any, Tuple
+
+from .memory_cache import MemoryLRUCache
+from .cache_backends import create_cache_backend
+from .cache_compaction import budgets_from_env, plan_compaction, summarize
+from .shared_cache import create_shared_tier
+from .cache_transfer import export_archive, import_archive, import_progress
+from . import cache_codec
 
 logger = logging.getLogger(__name__)
 
@@ -27,11 +38,36 @@ class DeterministicEvalConfig:
     USE_CONSENSUS = True  # 3-call majority voting
     CONSENSUS_CALLS = 3
     CONSENSUS_THRESHOLD = 0.67  # 2 out of 3 votes
+    # "hedged": fire 2 calls, add the 3rd only on disagreement/failure (or after the hedge delay)
+    # "parallel": always fire all CONSENSUS_CALLS at once
+    CONSENSUS_STRATEGY = os.getenv("CONSENSUS_STRATEGY", "hedged").lower()
+    CONSENSUS_HEDGE_DELAY_SECONDS = float(os.getenv("CONSENSUS_HEDGE_DELAY_SECONDS", "0"))  # 0 = never hedge on latency
+    
+    # Batched grading (opt-in): grade all QA pairs of one submission per structured call
+    BATCH_QA_EVALUATION = os.getenv("BATCH_QA_EVALUATION", "false").lower() in ("1", "true", "yes")
+    BATCH_INPUT_TOKEN_BUDGET = int(os.getenv("BATCH_INPUT_TOKEN_BUDGET", "200000"))
+    BATCH_OUTPUT_TOKEN_BUDGET = int(os.getenv("BATCH_OUTPUT_TOKEN_BUDGET", "32000"))
+    BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "25"))
     
     # Content validation
     VALIDATE_CONTENT_HASH = True
     ENABLE_RESULT_CACHE = True
     CACHE_TTL_DAYS = 365  # Cache results for 1 year (essentially permanent for university)
+    # Disk tier storage: "json" (one file per entry) or "sqlite" (single transactional file)
+    CACHE_BACKEND = os.getenv("EVALUATION_CACHE_BACKEND", "json").lower()
+    # Compaction: expired entries are purged, then each eval_type is trimmed to its byte budget
+    CACHE_MAX_BYTES_PER_TYPE = int(os.getenv("EVAL_CACHE_MAX_BYTES_PER_TYPE", str(512 * 1024 * 1024)))  # 0 = unbounded
+    CACHE_EVICTION_POLICY = os.getenv("EVAL_CACHE_EVICTION_POLICY", "lru").lower()  # lru | lfu
+    CACHE_COMPACTION_INTERVAL_SECONDS = int(os.getenv("EVAL_CACHE_COMPACTION_INTERVAL_SECONDS", "3600"))  # 0 = disabled
+    CACHE_VACUUM_FREE_RATIO = float(os.getenv("EVAL_CACHE_VACUUM_FREE_RATIO", "0.25"))  # sqlite: VACUUM once this share of pages is free
+    # Warm-up: export archive loaded in the background at startup (see cache_admin.py export)
+    CACHE_IMPORT_ON_STARTUP = os.getenv("EVAL_CACHE_IMPORT_ON_STARTUP", "")
+    # Optional shared tier across workers/nodes: redis://host:6379/0, or memory:// for an in-process stand-in
+    SHARED_CACHE_URL = os.getenv("EVAL_SHARED_CACHE_URL", "")
+    SHARED_CACHE_PREFIX = os.getenv("EVAL_SHARED_CACHE_PREFIX", "evalcache")
+    # In-process LRU tier in front of the disk cache (0 disables)
+    MEMORY_CACHE_MAX_ENTRIES = int(os.getenv("EVAL_MEMORY_CACHE_MAX_ENTRIES", "5000"))
+    MEMORY_CACHE_MAX_BYTES = int(os.getenv("EVAL_MEMORY_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
     
     # Scoring precision
     SCORE_PRECISION = 2  # Round to 2 decimal places
@@ -61,65 +97,128 @@ class DeterministicEvalConfig:
 
 
 class EvaluationCache:
-    """Cache evaluation results based on content hash"""
+    """Cache evaluation results based on content hash (memory LRU -> local disk backend -> optional shared tier)"""
+    
+    _memory = MemoryLRUCache(
+        max_entries=DeterministicEvalConfig.MEMORY_CACHE_MAX_ENTRIES,
+        max_bytes=DeterministicEvalConfig.MEMORY_CACHE_MAX_BYTES,
+    )
+    _backend = create_cache_backend(DeterministicEvalConfig.CACHE_BACKEND, EVALUATION_CACHE_DIR,
+                                    vacuum_free_ratio=DeterministicEvalConfig.CACHE_VACUUM_FREE_RATIO)
+    _shared = create_shared_tier(
+        DeterministicEvalConfig.SHARED_CACHE_URL,
+        prefix=DeterministicEvalConfig.SHARED_CACHE_PREFIX,
+        ttl_seconds=DeterministicEvalConfig.CACHE_TTL_DAYS * 86400,
+    )
+    _disk_lock = threading.Lock()
+    _disk_counters: Dict[str, Dict[str, int]] = defaultdict(lambda: {"hits": 0, "misses": 0})
+    # Memory-tier hits not yet reflected in the backend's access time / hit count
+    _pending_access: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+    _pending_access_count = 0
+    _MAX_PENDING_ACCESS = 100000
+    _last_compaction: Optional[Dict] = None
     
     @staticmethod
-    def _get_cache_file(content_hash: str, eval_type: str = "qa") -> Path:
-        """Get cache file path for evaluation"""
-        cache_subdir = EVALUATION_CACHE_DIR / eval_type
-        cache_subdir.mkdir(exist_ok=True, parents=True)
-        return cache_subdir / f"{content_hash}.json"
+    def _is_expired(cached_at: float) -> bool:
+        return (time.time() - cached_at) / 86400 > DeterministicEvalConfig.CACHE_TTL_DAYS
+    
+    @staticmethod
+    def _count_disk(eval_type: str, outcome: str, n: int = 1) -> None:
+        with EvaluationCache._disk_lock:
+            EvaluationCache._disk_counters[eval_type][outcome] += n
+    
+    @staticmethod
+    def _note_access(eval_type: str, content_hash: str) -> None:
+        with EvaluationCache._disk_lock:
+            if EvaluationCache._pending_access_count < EvaluationCache._MAX_PENDING_ACCESS:
+                EvaluationCache._pending_access[eval_type][content_hash] += 1
+                EvaluationCache._pending_access_count += 1
     
     @staticmethod
     def get(content_hash: str, eval_type: str = "qa") -> Optional[Dict]:
         """Retrieve cached evaluation result"""
+        return EvaluationCache.get_many([content_hash], eval_type).get(content_hash)
+    
+    @staticmethod
+    def get_many(content_hashes: Iterable[str], eval_type: str = "qa") -> Dict[str, Any]:
+        """Retrieve several cached results of one eval_type in a single backend round trip"""
         if not DeterministicEvalConfig.ENABLE_RESULT_CACHE:
-            return None
+            return {}
         
-        cache_file = EvaluationCache._get_cache_file(content_hash, eval_type)
+        found: Dict[str, Any] = {}
+        missing: List[str] = []
+        for content_hash in content_hashes:
+            # Memory tier: hot keys never touch the disk backend
+            hot = EvaluationCache._memory.get(eval_type, content_hash)
+            if hot is not None and not EvaluationCache._is_expired(hot[0]):
+                found[content_hash] = json.loads(cache_codec.unpack(hot[1]))
+                EvaluationCache._note_access(eval_type, content_hash)
+            else:
+                if hot is not None:
+                    EvaluationCache._memory.discard(eval_type, content_hash)
+                missing.append(content_hash)
         
-        if not cache_file.exists():
-            return None
+        if not missing:
+            return found
         
         try:
-            with open(cache_file, 'r', encoding='utf-8') as f:
-                cached_data = json.load(f)
-            
-            # Check TTL
-            cached_at = datetime.fromisoformat(cached_data.get('cached_at', '1970-01-01'))
-            age_days = (datetime.now() - cached_at).days
-            
-            if age_days > DeterministicEvalConfig.CACHE_TTL_DAYS:
-                # logger.info(f"Cache expired for {content_hash[:8]}...")
-                return None
-            
-            # logger.info(f"✓ Cache HIT for evaluation type '{eval_type}' (content_hash={content_hash[:8]}...)")
-            return cached_data.get('result')
-        
+            records = EvaluationCache._backend.get_many(eval_type, missing)
         except Exception as e:
             logger.error(f"Error reading cache: {e}")
-            return None
+            records = {}
+        
+        hits = 0
+        for content_hash, (cached_at, payload) in records.items():
+            if EvaluationCache._is_expired(cached_at):
+                # logger.info(f"Cache expired for {content_hash[:8]}...")
+                continue
+            found[content_hash] = json.loads(payload)
+            EvaluationCache._memory.put(eval_type, content_hash, cached_at, cache_codec.pack(payload))
+            hits += 1
+        EvaluationCache._count_disk(eval_type, "hits", hits)
+        EvaluationCache._count_disk(eval_type, "misses", len(missing) - hits)
+        
+        # Shared tier: results graded by another worker/node, copied into the local tiers
+        shared = EvaluationCache._shared
+        if shared is not None:
+            still_missing = [h for h in missing if h not in found]
+            backfill = []
+            for content_hash, (cached_at, payload) in shared.get_many(eval_type, still_missing).items():
+                if EvaluationCache._is_expired(cached_at):
+                    continue
+                found[content_hash] = json.loads(payload)
+                EvaluationCache._memory.put(eval_type, content_hash, cached_at, cache_codec.pack(payload))
+                backfill.append((content_hash, cached_at, payload))
+            if backfill:
+                try:
+                    EvaluationCache._backend.set_many(eval_type, backfill)
+                except Exception as e:
+                    logger.error(f"Error writing cache: {e}")
+        return found
     
     @staticmethod
     def set(content_hash: str, result: Dict, eval_type: str = "qa") -> bool:
         """Store evaluation result in cache"""
+        return EvaluationCache.set_many([(content_hash, result)], eval_type)
+    
+    @staticmethod
+    def set_many(items: Iterable[Tuple[str, Any]], eval_type: str = "qa") -> bool:
+        """Store several (content_hash, result) pairs of one eval_type in one backend write"""
         if not DeterministicEvalConfig.ENABLE_RESULT_CACHE:
             return False
         
         try:
-            cache_file = EvaluationCache._get_cache_file(content_hash, eval_type)
+            cached_at = time.time()
+            records = [(content_hash, cached_at, json.dumps(result, default=str)) for content_hash, result in items]
+            EvaluationCache._backend.set_many(eval_type, records)
+            if EvaluationCache._shared is not None:
+                EvaluationCache._shared.set_many(eval_type, records)
             
-            cache_data = {
-                'content_hash': content_hash,
-                'eval_type': eval_type,
-                'cached_at': datetime.now().isoformat(),
-                'result': result
-            }
+            # Write-through to the memory tier
+            for content_hash, _, payload in records:
+                EvaluationCache._memory.put(eval_type, content_hash, cached_at, cache_codec.pack(payload))
             
-            with open(cache_file, 'w', encoding='utf-8') as f:
-                json.dump(cache_data, f, indent=2, default=str)
-            
-            # logger.info(f"✓ Cache STORED for evaluation type '{eval_type}' (content_hash={content_hash[:8]}...)")
+            # logger.info(f"✓ Cache STORED for evaluation type '{eval_type}' ({len(records)} entries)")
             return True
         
         except Exception as e:
@@ -129,32 +228,125 @@ class EvaluationCache:
     @staticmethod
     def clear_all() -> int:
         """Clear all cached evaluations (for admin/testing)"""
-        count = 0
+        EvaluationCache._memory.clear()
+        if EvaluationCache._shared is not None:
+            EvaluationCache._shared.clear()
         try:
-            for cache_file in EVALUATION_CACHE_DIR.rglob('*.json'):
-                cache_file.unlink()
-                count += 1
+            count = EvaluationCache._backend.clear()
             logger.info(f"Cleared {count} cached evaluations")
             return count
         except Exception as e:
             logger.error(f"Error clearing cache: {e}")
-            return count
+            return 0
+    
+    @staticmethod
+    def compact() -> Dict:
+        """
+        Purge expired entries and trim every eval_type to its byte budget (LRU or LFU by access).
+        Blocking; run it off the event loop.
+        """
+        started = time.time()
+        backend = EvaluationCache._backend
+        
+        # Fold memory-tier hits into the backend so hot entries are not evicted as idle
+        with EvaluationCache._disk_lock:
+            pending = EvaluationCache._pending_access
+            EvaluationCache._pending_access = defaultdict(lambda: defaultdict(int))
+            EvaluationCache._pending_access_count = 0
+        for eval_type, hits in pending.items():
+            backend.touch_many(eval_type, dict(hits))
+        
+        plan = plan_compaction(
+            list(backend.scan()),
+            now=started,
+            ttl_seconds=DeterministicEvalConfig.CACHE_TTL_DAYS * 86400,
+            default_budget=DeterministicEvalConfig.CACHE_MAX_BYTES_PER_TYPE,
+            budgets=budgets_from_env(),
+            policy=DeterministicEvalConfig.CACHE_EVICTION_POLICY,
+        )
+        
+        removed = 0
+        for eval_type, type_plan in plan.items():
+            doomed = type_plan["expired"] + type_plan["evicted"]
+            if not doomed:
+                continue
+            removed += backend.delete_many(eval_type, doomed)
+            for content_hash in doomed:
+                EvaluationCache._memory.discard(eval_type, content_hash)
+        if removed:
+            backend.reclaim()
+        
+        by_type, reclaimed = summarize(plan)
+        report = {
+            "ran_at": datetime.fromtimestamp(started).isoformat(),
+            "duration_seconds": round(time.time() - started, 3),
+            "policy": DeterministicEvalConfig.CACHE_EVICTION_POLICY,
+            "removed_entries": removed,
+            "reclaimed_bytes": reclaimed,
+            "by_eval_type": by_type,
+        }
+        EvaluationCache._last_compaction = report
+        logger.info(f"🧹 Cache compaction removed {removed} entries, reclaimed {reclaimed:,} bytes")
+        return report
+    
+    @staticmethod
+    def export_archive(path: Path, eval_types: Optional[Iterable[str]] = None,
+                       max_age_days: Optional[float] = None) -> Dict:
+        """Write the disk tier (optionally filtered by eval_type / age) to a gzip JSONL archive"""
+        return export_archive(
+            EvaluationCache._backend, path, eval_types=eval_types, max_age_days=max_age_days,
+            ttl_seconds=DeterministicEvalConfig.CACHE_TTL_DAYS * 86400,
+        )
+    
+    @staticmethod
+    def import_archive(path: Path, overwrite: bool = False, claimed: bool = False) -> Dict:
+        """Load an export archive into the disk and shared tiers. Blocking; run it off the event loop."""
+        report = import_archive(
+            EvaluationCache._backend, path, shared=EvaluationCache._shared, overwrite=overwrite,
+            ttl_seconds=DeterministicEvalConfig.CACHE_TTL_DAYS * 86400, claimed=claimed,
+        )
+        if overwrite:
+            # Replaced entries may still be held by the memory tier
+            EvaluationCache._memory.clear()
+        return report
+    
+    @staticmethod
+    def claim_import(path: Path) -> None:
+        """Reserve the single import slot; raises RuntimeError if an import is already running"""
+        import_progress.start(str(path), 0)
+    
+    @staticmethod
+    def abort_import(error: str) -> None:
+        """Release a claimed import that never started"""
+        import_progress.finish(error=error)
+    
+    @staticmethod
+    def get_import_progress() -> Dict:
+        return import_progress.snapshot()
     
     @staticmethod
     def get_cache_stats() -> Dict:
         """Get cache statistics"""
-        count = 0
-        total_size = 0
+        stats = {'total_cached_results': 0, 'total_size_bytes': 0}
         
         try:
-            for cache_file in EVALUATION_CACHE_DIR.rglob('*.json'):
-                count += 1
-                total_size += cache_file.stat().st_size
+            stats.update(EvaluationCache._backend.stats())
         except Exception as e:
             logger.error(f"Error getting cache stats: {e}")
         
+        stats['backend'] = EvaluationCache._backend.name
+        stats['last_compaction'] = EvaluationCache._last_compaction
+        stats['cache_dir'] = str(EVALUATION_CACHE_DIR)
+        return stats
+    
+    @staticmethod
+    def get_tier_stats() -> Dict:
+        """Per-eval_type hit/miss/eviction counters for the memory and disk tiers"""
+        with EvaluationCache._disk_lock:
+            disk = {eval_type: dict(counters) for eval_type, counters in EvaluationCache._disk_counters.items()}
         return {
-            'total_cached_results': count,
-            'total_size_bytes': total_size,
-            'cache_dir': str(EVALUATION_CACHE_DIR)
+            "memory": EvaluationCache._memory.get_stats(),
+            "codec": cache_codec.describe(),
+            "disk": disk,
+            "shared": EvaluationCache._shared.get_stats() if EvaluationCache._shared is not None else None,
         }
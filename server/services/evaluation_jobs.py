@@ -0,0 +1,373 @@
+"""
+Durable Evaluation Jobs
+/files/generate batches as DB-backed work: one job row per batch, one task row per file and
+an append-only event log. Workers (inside the API process or `python eval_worker.py`) claim
+tasks under renewable leases, so any number of processes can drain one queue and a crashed
+worker's tasks are picked up again once their lease expires. Tasks checkpoint their QA split
+and every graded question, so a resumed task only re-grades what was lost.
+"""
+import asyncio
+import json
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, exists, or_, update
+
+from database import SessionLocal
+from models import EvaluationJob, EvaluationJobEvent, EvaluationTask, JobStatus, TaskStatus
+
+logger = logging.getLogger(__name__)
+
+# A claimed job/task belongs to its worker until the lease expires; heartbeats renew it
+JOB_LEASE_SECONDS = float(os.getenv("EVAL_JOB_LEASE_SECONDS", "60"))
+# Claims per task (or planning attempts per job) before it is failed instead of retried
+JOB_MAX_ATTEMPTS = int(os.getenv("EVAL_JOB_MAX_ATTEMPTS", "3"))
+# A released task/job waits base * 2^(attempt-1) seconds (capped) before it can be claimed again
+JOB_RETRY_BASE_SECONDS = float(os.getenv("EVAL_JOB_RETRY_BASE_SECONDS", "30"))
+JOB_RETRY_MAX_SECONDS = float(os.getenv("EVAL_JOB_RETRY_MAX_SECONDS", "600"))
+# Worker loops started inside the API process (0 = only external eval_worker.py processes)
+EVAL_JOB_WORKERS = int(os.getenv("EVAL_JOB_WORKERS", "1"))
+SSE_POLL_SECONDS = float(os.getenv("EVAL_JOB_SSE_POLL_SECONDS", "1.0"))
+SSE_KEEPALIVE_SECONDS = 15.0
+
+# Share of a file's work that is done once it enters each stage
+STAGE_PERCENT = {"queued": 0, "extract": 10, "qa_split": 20, "grade": 40, "persist": 90, "done": 100, "failed": 100}
+
+
+class LeaseLost(Exception):
+    """The worker no longer owns the row it tried to write (its lease expired and it was reclaimed)"""
+
+
+class RetryLater(Exception):
+    """A transient outage not caused by the file (e.g. LLM circuit breaker open): retry without using up an attempt"""
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def format_sse(event_id: int, event: str, data: Dict) -> str:
+    return f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def retry_delay(attempts: int) -> float:
+    return min(JOB_RETRY_MAX_SECONDS, JOB_RETRY_BASE_SECONDS * 2 ** max(0, attempts - 1))
+
+
+def _lease_free(model, now: datetime):
+    return or_(model.lease_owner.is_(None), model.lease_expires_at < now)
+
+
+def _available(model, now: datetime):
+    return or_(model.available_at.is_(None), model.available_at <= now)
+
+
+class JobStore:
+    """
+    Queue operations on the job/task tables. Claims use SELECT ... FOR UPDATE SKIP LOCKED
+    (a no-op on SQLite) followed by an UPDATE that re-checks the claim condition, so two
+    workers can never both win the same row. Every write a worker makes afterwards is
+    conditioned on it still holding the lease and raises LeaseLost otherwise.
+    Blocking; call from a worker thread.
+    """
+
+    @staticmethod
+    def add_event(db, job_id: str, event: str, data: Dict) -> None:
+        db.add(EvaluationJobEvent(job_id=job_id, event=event, data_json=json.dumps(data, default=str)))
+
+    @staticmethod
+    def submit(user_id: int, request_json: str) -> str:
+        job_id = str(uuid.uuid4())
+        with SessionLocal() as db:
+            db.add(EvaluationJob(id=job_id, user_id=user_id, status=JobStatus.QUEUED, request_json=request_json))
+            db.commit()
+        return job_id
+
+    # --- Claims ---
+
+    @staticmethod
+    def _claim_job(owner: str, claimable) -> Optional[EvaluationJob]:
+        now = utcnow()
+        with SessionLocal() as db:
+            job = (db.query(EvaluationJob).filter(claimable, _lease_free(EvaluationJob, now), _available(EvaluationJob, now))
+                   .order_by(EvaluationJob.created_at).with_for_update(skip_locked=True).first())
+            if job is None:
+                return None
+            claimed = db.execute(
+                update(EvaluationJob)
+                .where(EvaluationJob.id == job.id, claimable, _lease_free(EvaluationJob, now), _available(EvaluationJob, now))
+                .values(lease_owner=owner, lease_expires_at=now + timedelta(seconds=JOB_LEASE_SECONDS),
+                        attempts=EvaluationJob.attempts + 1)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            db.commit()
+            if not claimed:
+                return None
+            db.refresh(job)
+            db.expunge(job)
+            return job
+
+    @staticmethod
+    def claim_job_for_planning(owner: str) -> Optional[EvaluationJob]:
+        """A queued job whose files have not been split into tasks yet"""
+        return JobStore._claim_job(owner, EvaluationJob.status == JobStatus.QUEUED)
+
+    @staticmethod
+    def claim_job_for_finalizing(owner: str) -> Optional[EvaluationJob]:
+        """A running job whose tasks have all finished"""
+        unfinished = exists().where(and_(EvaluationTask.job_id == EvaluationJob.id,
+                                         EvaluationTask.status.in_([TaskStatus.PENDING, TaskStatus.RUNNING])))
+        return JobStore._claim_job(owner, and_(EvaluationJob.status == JobStatus.RUNNING, ~unfinished))
+
+    @staticmethod
+    def claim_task(owner: str) -> Optional[Dict]:
+        """Next pending task past its retry backoff, or a running one whose worker stopped renewing its lease"""
+        for _ in range(5):  # Lost races are retried; None means the queue is really empty
+            now = utcnow()
+            claimable = or_(and_(EvaluationTask.status == TaskStatus.PENDING, _available(EvaluationTask, now)),
+                            and_(EvaluationTask.status == TaskStatus.RUNNING, EvaluationTask.lease_expires_at < now))
+            with SessionLocal() as db:
+                task = (db.query(EvaluationTask).join(EvaluationJob)
+                        .filter(claimable, EvaluationJob.status == JobStatus.RUNNING)
+                        .order_by(EvaluationTask.id)
+                        .with_for_update(skip_locked=True, of=EvaluationTask).first())
+                if task is None:
+                    return None
+                claim = {
+                    "task_id": task.id,
+                    "job_id": task.job_id,
+                    "index": task.file_index,
+                    "file_id": task.file_id,
+                    "display_name": task.name,
+                    "payload": json.loads(task.payload_json),
+                    "checkpoint": json.loads(task.checkpoint_json) if task.checkpoint_json else {},
+                    "attempts": task.attempts + 1,
+                    "resumed": task.status == TaskStatus.RUNNING,
+                }
+                claimed = db.execute(
+                    update(EvaluationTask).where(EvaluationTask.id == task.id, claimable)
+                    .values(status=TaskStatus.RUNNING, lease_owner=owner, attempts=EvaluationTask.attempts + 1,
+                            lease_expires_at=now + timedelta(seconds=JOB_LEASE_SECONDS))
+                    .execution_options(synchronize_session=False)
+                ).rowcount
+                db.commit()
+            if claimed:
+                return claim
+        return None
+
+    @staticmethod
+    def renew_leases(owner: str) -> int:
+        """Heartbeat: extend every lease this worker holds"""
+        expires = utcnow() + timedelta(seconds=JOB_LEASE_SECONDS)
+        with SessionLocal() as db:
+            renewed = db.execute(
+                update(EvaluationTask)
+                .where(EvaluationTask.lease_owner == owner, EvaluationTask.status == TaskStatus.RUNNING)
+                .values(lease_expires_at=expires)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            renewed += db.execute(
+                update(EvaluationJob).where(EvaluationJob.lease_owner == owner).values(lease_expires_at=expires)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            db.commit()
+        return renewed
+
+    # --- Owned writes ---
+
+    @staticmethod
+    def owned_task(db, task_id: int, owner: str) -> EvaluationTask:
+        task = (db.query(EvaluationTask)
+                .filter(EvaluationTask.id == task_id, EvaluationTask.lease_owner == owner,
+                        EvaluationTask.status == TaskStatus.RUNNING)
+                .with_for_update().first())
+        if task is None:
+            raise LeaseLost(f"task {task_id}")
+        return task
+
+    @staticmethod
+    def owned_job(db, job_id: str, owner: str) -> EvaluationJob:
+        job = (db.query(EvaluationJob).filter(EvaluationJob.id == job_id, EvaluationJob.lease_owner == owner)
+               .with_for_update().first())
+        if job is None:
+            raise LeaseLost(f"job {job_id}")
+        return job
+
+    @staticmethod
+    def set_stage(task_id: int, owner: str, item: Dict, stage: str) -> None:
+        with SessionLocal() as db:
+            task = JobStore.owned_task(db, task_id, owner)
+            task.stage = stage
+            task.name = item.get("display_name") or task.name
+            JobStore.add_event(db, task.job_id, "progress", {"index": task.file_index, "file_id": task.file_id, "name": task.name, "stage": stage})
+            db.commit()
+
+    @staticmethod
+    def save_checkpoint(task_id: int, owner: str, checkpoint: Dict) -> None:
+        with SessionLocal() as db:
+            JobStore.owned_task(db, task_id, owner).checkpoint_json = json.dumps(checkpoint, default=str)
+            db.commit()
+
+    @staticmethod
+    def release_task(task_id: int, owner: str, error: str, count_attempt: bool = True) -> float:
+        """
+        Hand a failed attempt back to the queue after an exponential backoff (returned, in
+        seconds); its checkpoint is kept for the retry. count_attempt=False gives the attempt back.
+        """
+        with SessionLocal() as db:
+            task = JobStore.owned_task(db, task_id, owner)
+            delay = retry_delay(task.attempts)
+            task.status = TaskStatus.PENDING
+            task.lease_owner = None
+            task.lease_expires_at = None
+            task.available_at = utcnow() + timedelta(seconds=delay)
+            task.error = error
+            if not count_attempt:
+                task.attempts = max(0, task.attempts - 1)
+            db.commit()
+        return delay
+
+    @staticmethod
+    def fail_task(task_id: int, owner: str, score: Dict) -> None:
+        """Give up on a task whose result could not be saved"""
+        with SessionLocal() as db:
+            task = JobStore.owned_task(db, task_id, owner)
+            task.status = TaskStatus.FAILED
+            task.stage = "failed"
+            task.error = score.get("error")
+            task.result_json = json.dumps({"score": score, "formatted": None}, default=str)
+            task.lease_owner = None
+            task.lease_expires_at = None
+            JobStore.add_event(db, task.job_id, "result", {"index": task.file_index, "file_id": task.file_id, "score": score})
+            db.commit()
+
+    @staticmethod
+    def release_job(job_id: str, owner: str, error: str, give_up: bool) -> None:
+        with SessionLocal() as db:
+            job = JobStore.owned_job(db, job_id, owner)
+            job.lease_owner = None
+            job.lease_expires_at = None
+            job.error = error
+            job.available_at = utcnow() + timedelta(seconds=retry_delay(job.attempts))
+            if give_up:
+                job.status = JobStatus.FAILED
+                job.finished_at = utcnow()
+                JobStore.add_event(db, job_id, "done", {"status": JobStatus.FAILED.value, "assignment_id": job.assignment_id, "error": error})
+            db.commit()
+
+    # --- Reads ---
+
+    @staticmethod
+    def job_status(job_id: str, user_id: int) -> Optional[Dict]:
+        with SessionLocal() as db:
+            job = db.query(EvaluationJob).filter(EvaluationJob.id == job_id, EvaluationJob.user_id == user_id).first()
+            if job is None:
+                return None
+            files = []
+            for task in job.tasks:
+                score = json.loads(task.result_json)["score"] if task.result_json else None
+                files.append({
+                    "index": task.file_index,
+                    "file_id": task.file_id,
+                    "name": task.name,
+                    "status": task.status.value,
+                    "stage": "failed" if task.status == TaskStatus.FAILED else task.stage,
+                    "attempts": task.attempts,
+                    "score_percent": score.get("score_percent") if score else None,
+                    "error": task.error,
+                })
+            if job.status == JobStatus.COMPLETED:
+                percent = 100.0
+            elif files:
+                percent = round(sum(STAGE_PERCENT.get(f["stage"], 0) for f in files) / len(files), 1)
+            else:
+                percent = 0.0
+            return {
+                "job_id": job.id,
+                "status": job.status.value,
+                "percent": percent,
+                "total_files": len(files),
+                "completed_files": sum(1 for f in files if f["status"] in (TaskStatus.DONE.value, TaskStatus.FAILED.value)),
+                "files": files,
+                "assignment_id": job.assignment_id,
+                "error": job.error,
+            }
+
+    @staticmethod
+    def job_result(job_id: str, user_id: int) -> Optional[Dict]:
+        with SessionLocal() as db:
+            job = db.query(EvaluationJob).filter(EvaluationJob.id == job_id, EvaluationJob.user_id == user_id).first()
+            return json.loads(job.result_json) if job is not None and job.result_json else None
+
+    @staticmethod
+    def events_after(job_id: str, after_id: int, limit: int = 200) -> Tuple[List[tuple], bool]:
+        """(events with id > after_id, whether the job has finished)"""
+        with SessionLocal() as db:
+            rows = (db.query(EvaluationJobEvent)
+                    .filter(EvaluationJobEvent.job_id == job_id, EvaluationJobEvent.id > after_id)
+                    .order_by(EvaluationJobEvent.id).limit(limit).all())
+            status = db.query(EvaluationJob.status).filter(EvaluationJob.id == job_id).scalar()
+            finished = status in (JobStatus.COMPLETED, JobStatus.FAILED, None)
+            return [(row.id, row.event, json.loads(row.data_json)) for row in rows], finished
+
+
+class EvaluationJobManager:
+    """API-side facade: submits jobs, reads status/results and streams the event log"""
+
+    def __init__(self, generate_service):
+        self.generate_service = generate_service
+        self._workers = []
+        self._tasks = set()
+
+    def start_workers(self, count: int = EVAL_JOB_WORKERS) -> None:
+        """Run worker loops inside this process (call from the app's startup event)"""
+        from services.evaluation_worker import EvaluationWorker
+        for _ in range(count):
+            worker = EvaluationWorker(self.generate_service)
+            self._workers.append(worker)
+            task = asyncio.create_task(worker.run())
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        if count:
+            logger.info(f"🧾 Started {count} in-process evaluation worker(s)")
+
+    async def submit(self, request, current_user) -> str:
+        job_id = await asyncio.to_thread(JobStore.submit, current_user.id, request.model_dump_json())
+        logger.info(f"🧾 Evaluation job {job_id} queued ({len(request.file_ids)} files)")
+        for worker in self._workers:
+            worker.wake()
+        return job_id
+
+    async def get_status(self, job_id: str, user_id: int) -> Optional[Dict]:
+        return await asyncio.to_thread(JobStore.job_status, job_id, user_id)
+
+    async def get_result(self, job_id: str, user_id: int) -> Optional[Dict]:
+        return await asyncio.to_thread(JobStore.job_result, job_id, user_id)
+
+    async def stream(self, job_id: str, user_id: int, last_event_id: int = 0) -> AsyncIterator[str]:
+        """
+        SSE frames for a job from the durable event log, resuming after last_event_id (the
+        browser's Last-Event-ID). Works from any API process, whichever worker runs the job.
+        """
+        cursor = max(0, last_event_id)
+        idle = 0.0
+        while True:
+            events, finished = await asyncio.to_thread(JobStore.events_after, job_id, cursor)
+            for event_id, event, data in events:
+                yield format_sse(event_id, event, data)
+                cursor = event_id
+                if event == "done":
+                    return
+            if events:
+                idle = 0.0
+                continue
+            if finished:
+                return  # Resumed after the final event
+            if idle >= SSE_KEEPALIVE_SECONDS:
+                yield ": keep-alive\n\n"
+                idle = 0.0
+            await asyncio.sleep(SSE_POLL_SECONDS)
+            idle += SSE_POLL_SECONDS
@@ -0,0 +1,355 @@
+"""
+Evaluation Worker
+Drains the durable job queue (services.evaluation_jobs): plans queued jobs into per-file
+tasks, streams claimed tasks through extract -> QA split -> grade -> persist, and finalizes
+jobs once every task is finished. A heartbeat renews the worker's leases; if the process
+dies, its tasks become claimable again when the leases expire and resume from their
+checkpoints.
+"""
+import asyncio
+import json
+import logging
+import os
+import socket
+import uuid
+from pathlib import Path
+from typing import Dict, Optional
+
+from database import SessionLocal
+from models import Assignment, AssignmentStatus, EvaluationJob, EvaluationTask, EvaluationType, JobStatus, TaskStatus, User
+from schemas.schemas import GenerateRequest
+from services.evaluation_jobs import JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS, JobStore, LeaseLost, RetryLater, utcnow
+from services.extraction_pool import get_extraction_pool
+from services.generate_service_complete import PPT_EXTENSIONS
+from services.pipeline import Stage, run_pipeline
+
+logger = logging.getLogger(__name__)
+
+# Files in flight per worker (per stage)
+WORKER_CONCURRENCY = int(os.getenv("EVAL_WORKER_CONCURRENCY", "4"))
+# Idle wait between queue polls; submit() wakes in-process workers immediately
+WORKER_POLL_SECONDS = float(os.getenv("EVAL_WORKER_POLL_SECONDS", "2"))
+
+
+class EvaluationWorker:
+
+    def __init__(self, generate_service, concurrency: int = WORKER_CONCURRENCY):
+        self.service = generate_service
+        self.concurrency = max(1, concurrency)
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._wake: Optional[asyncio.Event] = None
+        self._jobs: Dict[str, Dict] = {}  # job_id -> request, plan and per-batch memo
+
+    def wake(self) -> None:
+        if self._wake is not None:
+            self._wake.set()
+
+    async def run(self, stop: Optional[asyncio.Event] = None) -> None:
+        self._wake = asyncio.Event()
+        heartbeat = asyncio.create_task(self._heartbeat())
+        logger.info(f"🧾 Evaluation worker {self.worker_id} started")
+        try:
+            while stop is None or not stop.is_set():
+                try:
+                    worked = await self._drain()
+                except Exception as e:
+                    logger.error(f"Evaluation worker {self.worker_id} error: {e}", exc_info=True)
+                    worked = False
+                if worked:
+                    continue
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), WORKER_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            heartbeat.cancel()
+
+    async def _heartbeat(self) -> None:
+        while True:
+            await asyncio.sleep(JOB_LEASE_SECONDS / 3)
+            try:
+                await asyncio.to_thread(JobStore.renew_leases, self.worker_id)
+            except Exception as e:
+                logger.warning(f"Lease renewal failed for {self.worker_id}: {e}")
+
+    async def _drain(self) -> bool:
+        """Plan, process and finalize until the queue has nothing claimable; True if anything ran"""
+        worked = False
+        while (job := await asyncio.to_thread(JobStore.claim_job_for_planning, self.worker_id)) is not None:
+            await self._plan(job)
+            worked = True
+
+        if await self._process_tasks():
+            worked = True
+
+        while (job := await asyncio.to_thread(JobStore.claim_job_for_finalizing, self.worker_id)) is not None:
+            await self._finalize(job)
+            worked = True
+        return worked
+
+    # --- Planning ---
+
+    async def _plan(self, job) -> None:
+        """Resolve reference material and files once, then write one task per file"""
+        try:
+            request = GenerateRequest(**json.loads(job.request_json))
+            github_url = self.service._resolve_github_url(request)
+            await self.service._apply_reference_material(request)
+            github_files, github_names = await self.service._github_files(github_url)
+            student_files = self.service._resolve_student_files(request.file_ids)
+            if not github_files and not student_files:
+                raise RuntimeError("None of the submitted files could be found")
+
+            all_ppt_files = not github_files and all(p.suffix.lower() in PPT_EXTENSIONS for _, p, _ in student_files)
+            payloads = [
+                {"kind": "github", "file_data": fd, "display_name": name, "file_id": None}
+                for fd, name in zip(github_files, github_names)
+            ] + [
+                {"kind": "upload", "path": str(path), "original_filename": original_filename, "file_id": file_id}
+                for file_id, path, original_filename in student_files
+            ]
+            plan = {
+                "description": request.description,
+                "evaluation_type": (EvaluationType.PPT if all_ppt_files else EvaluationType.FILE).value,
+                "file_ids": [file_id for file_id, _, _ in student_files],
+            }
+            await asyncio.to_thread(self._save_plan, job.id, request, plan, payloads)
+            logger.info(f"🧾 Job {job.id} planned: {len(payloads)} tasks")
+        except LeaseLost:
+            logger.warning(f"Lost the lease on job {job.id} while planning")
+        except Exception as e:
+            logger.error(f"Planning job {job.id} failed: {e}")
+            await asyncio.to_thread(JobStore.release_job, job.id, self.worker_id, str(e), job.attempts >= JOB_MAX_ATTEMPTS)
+
+    def _save_plan(self, job_id: str, request, plan: Dict, payloads) -> None:
+        # Assignment, tasks and plan are committed together so a crash never duplicates them
+        with SessionLocal() as db:
+            job = JobStore.owned_job(db, job_id, self.worker_id)
+            user = db.get(User, job.user_id)
+            assignment = self.service._new_assignment(db, user, request, EvaluationType(plan["evaluation_type"]), AssignmentStatus.DRAFT)
+            listed = []
+            for index, payload in enumerate(payloads):
+                name = payload.get("display_name") or payload.get("original_filename") or Path(payload.get("path", "")).name
+                db.add(EvaluationTask(job_id=job_id, file_index=index, file_id=payload["file_id"], name=name,
+                                      payload_json=json.dumps(payload), status=TaskStatus.PENDING, stage="queued"))
+                listed.append({"index": index, "file_id": payload["file_id"], "name": name})
+            job.assignment_id = assignment.id
+            job.plan_json = json.dumps(plan)
+            job.status = JobStatus.RUNNING
+            job.attempts = 0
+            job.lease_owner = None
+            job.lease_expires_at = None
+            JobStore.add_event(db, job_id, "files", {"files": listed})
+            db.commit()
+
+    def _job_context(self, job_id: str) -> Dict:
+        ctx = self._jobs.get(job_id)
+        if ctx is None:
+            with SessionLocal() as db:
+                job = db.get(EvaluationJob, job_id)
+                request = GenerateRequest(**json.loads(job.request_json))
+                plan = json.loads(job.plan_json)
+                request.description = plan["description"]
+                ctx = {
+                    "request": request,
+                    "assignment_id": job.assignment_id,
+                    "evaluation_type": EvaluationType(plan["evaluation_type"]),
+                    "description_qa": {},
+                }
+            self._jobs[job_id] = ctx
+        return ctx
+
+    # --- Tasks ---
+
+    async def _process_tasks(self) -> bool:
+        claimed = 0
+
+        async def source():
+            nonlocal claimed
+            while (task := await asyncio.to_thread(JobStore.claim_task, self.worker_id)) is not None:
+                claimed += 1
+                task["ctx"] = await asyncio.to_thread(self._job_context, task["job_id"])
+                if task["resumed"]:
+                    logger.info(f"♻️ Resuming task {task['task_id']} (job {task['job_id']}, attempt {task['attempts']})")
+                yield task
+
+        stages = [
+            Stage("extract", self._step("extract", self._extract), self.concurrency),
+            Stage("qa_split", self._step("qa_split", self._split), self.concurrency),
+            Stage("grade", self._step("grade", self._grade), self.concurrency),
+            Stage("persist", self._step("persist", self._persist), 1),
+        ]
+        # Rubric/reference prefix is cached provider-side for the whole drain
+        async with self.service.gemini_service.context_cache_batch():
+            await run_pipeline(source(), stages, queue_size=self.concurrency)
+        self._jobs.clear()
+        return claimed > 0
+
+    def _step(self, stage: str, handler):
+        """Record the stage, run the handler and turn failures into a retry or a failed result"""
+        async def run(item: Dict) -> Optional[Dict]:
+            if "score" in item and stage != "persist":
+                return item  # Already failed for good; only needs saving
+            try:
+                await asyncio.to_thread(JobStore.set_stage, item["task_id"], self.worker_id, item, stage)
+                return await handler(item)
+            except LeaseLost:
+                logger.warning(f"Lost the lease on task {item['task_id']}; another worker owns it now")
+                return None
+            except RetryLater as e:
+                try:
+                    delay = await asyncio.to_thread(JobStore.release_task, item["task_id"], self.worker_id, str(e), False)
+                    logger.warning(f"Task {item['task_id']} postponed {delay:.0f}s in {stage}: {e}")
+                except LeaseLost:
+                    pass
+                return None
+            except Exception as e:
+                logger.error(f"Task {item['task_id']} failed in {stage} (attempt {item['attempts']}): {e}")
+                score = {
+                    "name": item.get("display_name") or "Unknown",
+                    "file_id": item["file_id"],
+                    "score_percent": 0.0,
+                    "reasoning": "Evaluation could not be completed for this file.",
+                    "details": [],
+                    "error": str(e),
+                }
+                try:
+                    if item["attempts"] < JOB_MAX_ATTEMPTS:
+                        # Back to the queue after a backoff; the checkpoint is kept so the retry resumes
+                        await asyncio.to_thread(JobStore.release_task, item["task_id"], self.worker_id, str(e))
+                    elif stage == "persist":
+                        await asyncio.to_thread(JobStore.fail_task, item["task_id"], self.worker_id, score)
+                    else:
+                        # Out of attempts: save a zero score like the synchronous path does
+                        item["error"] = str(e)
+                        item["display_name"] = score["name"]
+                        item.setdefault("file_data", {"filename": score["name"], "content": "", "file_type": "unknown"})
+                        item["score"] = score
+                        return item
+                except LeaseLost:
+                    pass
+                return None
+        return run
+
+    async def _extract(self, item: Dict) -> Dict:
+        if item["attempts"] > JOB_MAX_ATTEMPTS:
+            # Claimed again after its workers kept dying mid-task (crash, OOM kill)
+            raise RuntimeError(f"Abandoned after {JOB_MAX_ATTEMPTS} attempts")
+        payload = item["payload"]
+        if payload["kind"] == "github":
+            item["file_data"] = payload["file_data"]
+            item["display_name"] = payload["display_name"]
+            return item
+
+        # Re-extraction after a restart is served by the extraction cache
+        path = Path(payload["path"])
+        file_data = await self.service.file_processor.read_file_async(str(path), run_blocking=get_extraction_pool().run)
+        item["file_data"] = file_data
+        item["display_name"] = self.service._name_extracted_file(file_data, path, payload.get("original_filename"))
+        return item
+
+    async def _split(self, item: Dict) -> Dict:
+        ctx = item["ctx"]
+        if ctx["evaluation_type"] == EvaluationType.PPT:
+            return item
+        if "qa_pairs" in item["checkpoint"]:
+            item["qa_pairs"] = item["checkpoint"]["qa_pairs"]
+            return item
+        item["qa_pairs"] = await self.service._split_qa(item, ctx["request"], ctx["description_qa"])
+        item["checkpoint"] = {"qa_pairs": item["qa_pairs"], "graded": {}}
+        await asyncio.to_thread(JobStore.save_checkpoint, item["task_id"], self.worker_id, item["checkpoint"])
+        return item
+
+    async def _grade(self, item: Dict) -> Dict:
+        ctx = item["ctx"]
+        request = ctx["request"]
+        if ctx["evaluation_type"] == EvaluationType.PPT:
+            try:
+                result = await self.service._evaluate_single_ppt(item["file_data"], item["payload"]["path"], item["file_id"], request.title, request.description)
+            except Exception as e:
+                result = e
+            item["score"], item["formatted"] = self.service._ppt_outcome(result, item["file_data"], item["file_id"])
+            return item
+
+        checkpoint = item["checkpoint"]
+        graded = {int(idx_q): detail for idx_q, detail in checkpoint.get("graded", {}).items()}
+        if graded:
+            logger.info(f"♻️ Task {item['task_id']}: {len(graded)}/{len(item['qa_pairs'])} questions already graded")
+        lock = asyncio.Lock()
+
+        async def on_graded(idx_q: int, detail: Dict) -> None:
+            # Checkpoint every graded question; the lock keeps snapshots from overtaking each other
+            async with lock:
+                checkpoint.setdefault("graded", {})[str(idx_q)] = detail
+                await asyncio.to_thread(JobStore.save_checkpoint, item["task_id"], self.worker_id, checkpoint)
+
+        score = await self.service._grade_file(item, request, graded, on_graded)
+        error = score.get("error")
+        if error:
+            message = error.get("message", str(error)) if isinstance(error, dict) else str(error)
+            if isinstance(error, dict) and error.get("circuit_open"):
+                # No call reached the LLM, so this says nothing about the file
+                raise RetryLater(f"LLM unavailable: {message}")
+            if item["attempts"] < JOB_MAX_ATTEMPTS:
+                raise RuntimeError(f"LLM unavailable: {message}")
+            # Out of attempts: the zero score is saved, but the task is recorded as failed
+            item["error"] = f"LLM unavailable: {message}"
+        item["score"] = score
+        return item
+
+    async def _persist(self, item: Dict) -> None:
+        await asyncio.to_thread(self._save_result, item)
+        return None
+
+    def _save_result(self, item: Dict) -> None:
+        # Results and the task's completion are committed together so a retry never duplicates them
+        ctx = item["ctx"]
+        with SessionLocal() as db:
+            task = JobStore.owned_task(db, item["task_id"], self.worker_id)
+            self.service._add_file_result(db, ctx["assignment_id"], item, ctx["evaluation_type"])
+            task.status = TaskStatus.FAILED if item.get("error") else TaskStatus.DONE
+            task.stage = "done"
+            task.name = item["display_name"]
+            task.error = item.get("error")
+            task.result_json = json.dumps({"score": item["score"], "formatted": item.get("formatted")}, default=str)
+            task.lease_owner = None
+            task.lease_expires_at = None
+            JobStore.add_event(db, task.job_id, "result", {"index": task.file_index, "file_id": task.file_id, "score": item["score"]})
+            db.commit()
+
+    # --- Finalizing ---
+
+    async def _finalize(self, job) -> None:
+        try:
+            await asyncio.to_thread(self._save_final, job.id)
+            logger.info(f"🧾 Job {job.id} completed")
+        except LeaseLost:
+            logger.warning(f"Lost the lease on job {job.id} while finalizing")
+
+    def _save_final(self, job_id: str) -> None:
+        with SessionLocal() as db:
+            job = JobStore.owned_job(db, job_id, self.worker_id)
+            plan = json.loads(job.plan_json)
+            outcomes = [json.loads(task.result_json) for task in job.tasks]
+            final_scores = [outcome["score"] for outcome in outcomes]
+
+            # --- Peer-to-Peer Plagiarism Detection ---
+            self.service.detect_batch_plagiarism(final_scores)
+
+            if plan["evaluation_type"] == EvaluationType.PPT.value:
+                summary = "\n\n".join(outcome.get("formatted") or "" for outcome in outcomes)
+            else:
+                summary = json.dumps({"scores": final_scores}, indent=2)
+            result = {"success": True, "result": summary, "scores": final_scores, "file_ids": plan["file_ids"], "assignment_id": job.assignment_id}
+
+            assignment = db.get(Assignment, job.assignment_id)
+            if assignment:
+                assignment.status = AssignmentStatus.COMPLETED
+            job.status = JobStatus.COMPLETED
+            job.result_json = json.dumps(result, default=str)
+            job.finished_at = utcnow()
+            job.lease_owner = None
+            job.lease_expires_at = None
+            JobStore.add_event(db, job_id, "done", {"status": JobStatus.COMPLETED.value, "assignment_id": job.assignment_id, "error": None})
+            db.commit()
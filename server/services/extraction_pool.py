@@ -0,0 +1,151 @@
+"""
+Document Extraction Process Pool
+Runs the CPU-bound parsing stage of FileProcessor (pdfplumber layout analysis, python-docx,
+openpyxl, pandas) in worker processes, so batch extraction scales with cores and a
+pathological file cannot stall the event loop. Each task gets a wall-clock timeout and
+each worker an address-space limit.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional, Tuple
+
+# Optional: per-worker memory limits (Unix only)
+try:
+    import resource
+    RESOURCE_AVAILABLE = True
+except ImportError:
+    RESOURCE_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# 0 runs extraction in the default thread pool instead of worker processes
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", str(min(4, os.cpu_count() or 1))))
+EXTRACTION_TIMEOUT_SECONDS = float(os.getenv("EXTRACTION_TIMEOUT_SECONDS", "180"))  # 0 = no limit
+EXTRACTION_MEMORY_LIMIT_MB = int(os.getenv("EXTRACTION_MEMORY_LIMIT_MB", "2048"))  # 0 = no limit
+# Extra time the parent waits past the timeout before killing a worker stuck in C code
+KILL_GRACE_SECONDS = 10.0
+
+
+def _init_worker(memory_limit_bytes: int) -> None:
+    if memory_limit_bytes > 0 and RESOURCE_AVAILABLE:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit_bytes, memory_limit_bytes))
+
+
+def _run_limited(fn: Callable, args: tuple, timeout: float) -> Any:
+    """Worker side: run fn(*args) with a SIGALRM deadline (tasks run on the worker's main thread)"""
+    use_alarm = timeout > 0 and hasattr(signal, "setitimer")
+    if use_alarm:
+        def _expired(signum, frame):
+            raise TimeoutError(f"extraction exceeded {timeout:.0f}s")
+        signal.signal(signal.SIGALRM, _expired)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return fn(*args)
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+class ExtractionPool:
+    """
+    Lazily started spawn-context process pool. A worker that dies (memory limit, crash) or
+    hangs past the grace period takes the pool down with it; the pool is then replaced and
+    the other in-flight tasks are retried once on the fresh pool.
+    Tasks are only submitted while a worker is free, so the parent-side deadline measures
+    run time, never time spent queued behind other files.
+    """
+
+    def __init__(self, workers: int = EXTRACTION_WORKERS, timeout: float = EXTRACTION_TIMEOUT_SECONDS,
+                 memory_limit_mb: int = EXTRACTION_MEMORY_LIMIT_MB):
+        self.workers = workers
+        self.timeout = timeout
+        self.memory_limit_mb = memory_limit_mb
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._slots: Optional[Tuple[asyncio.AbstractEventLoop, asyncio.Semaphore]] = None
+        self._stats = {"tasks": 0, "timeouts": 0, "failures": 0, "pool_restarts": 0}
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(self.memory_limit_mb * 1024 * 1024,),
+                )
+                logger.info(f"📚 Extraction pool started with {self.workers} worker processes")
+            return self._executor
+
+    def _worker_slots(self) -> asyncio.Semaphore:
+        """One admission slot per worker process (per event loop; normally one per process)"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._slots is None or self._slots[0] is not loop:
+                self._slots = (loop, asyncio.Semaphore(self.workers))
+            return self._slots[1]
+
+    def _recycle(self, executor: ProcessPoolExecutor, kill: bool = False) -> None:
+        with self._lock:
+            if self._executor is not executor:
+                return  # Already replaced by another task
+            self._executor = None
+            self._stats["pool_restarts"] += 1
+        if kill:
+            # ProcessPoolExecutor cannot cancel a running task; terminate its workers instead
+            for process in list(getattr(executor, "_processes", {}).values()):
+                process.terminate()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    async def run(self, fn: Callable, *args) -> Any:
+        """Run a picklable blocking callable on the pool (or a thread when workers=0)."""
+        self._stats["tasks"] += 1
+        if self.workers <= 0:
+            return await asyncio.to_thread(fn, *args)
+
+        # Wait for a free worker here rather than in the executor's queue, so the deadline
+        # below starts when the file starts running and queue wait never restarts the pool
+        async with self._worker_slots():
+            for attempt in range(2):
+                executor = self._get_executor()
+                future = executor.submit(_run_limited, fn, args, self.timeout)
+                deadline = self.timeout + KILL_GRACE_SECONDS if self.timeout > 0 else None
+                try:
+                    return await asyncio.wait_for(asyncio.wrap_future(future), deadline)
+                except asyncio.TimeoutError:
+                    self._stats["timeouts"] += 1
+                    logger.warning(f"⏱️ Extraction worker unresponsive after {deadline:.0f}s, restarting pool")
+                    self._recycle(executor, kill=True)
+                    raise TimeoutError(f"extraction exceeded {self.timeout:.0f}s")
+                except BrokenProcessPool:
+                    self._recycle(executor)
+                    if attempt:
+                        self._stats["failures"] += 1
+                        raise
+                    logger.warning("Extraction pool broke (worker crashed or hit its memory limit), retrying on a fresh pool")
+
+    def get_stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "timeout_seconds": self.timeout,
+            "memory_limit_mb": self.memory_limit_mb if RESOURCE_AVAILABLE else None,
+            **self._stats,
+        }
+
+
+_pool: Optional[ExtractionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_extraction_pool() -> ExtractionPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ExtractionPool()
+        return _pool
@@ -5,14 +5,20 @@ import os
 import json
 import csv
 import re
+import hashlib
+import time
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
 import os
 import io
 import base64
 import requests
 import asyncio
+from concurrent.futures.process import BrokenProcessPool
 from .gemini_service import GeminiService
+from .determinism_config import EvaluationCache
+from . import page_render
+from .extraction_pool import get_extraction_pool
 
 # Optional imports for different file types
 try:
@@ -70,7 +76,7 @@ import io as _io
 
 # Optional OCR for scanned PDFs
 try:
-    from pdf2image import convert_from_path
+    from pdf2image import convert_from_path, pdfinfo_from_path
     from PIL import Image
     PDF2IMAGE_AVAILABLE = True
 except ImportError:
@@ -89,12 +95,34 @@ except ImportError:
     PYMUPDF_AVAILABLE = False
 
 
+# Per-page OCR cache (EvaluationCache eval_type "ocr_page"): keyed on the source file hash,
+# page index and render parameters so unchanged pages skip rasterization entirely.
+# Bump the version when the OCR prompt or page post-processing changes.
+PAGE_OCR_CACHE_VERSION = 1
+PYMUPDF_RENDER_SCALE = 2
+PDF2IMAGE_OCR_DPI = 200
+PDF2IMAGE_FORCE_OCR_DPI = 300
+
+# Whole-document extraction cache (EvaluationCache eval_type "extraction"): keyed on the file
+# SHA-256 and the pipeline version, so re-evaluations and duplicate uploads skip re-parsing.
+# Bump the version whenever any extractor or the fallback order changes.
+EXTRACTION_PIPELINE_VERSION = 2
+EXTRACTION_CACHE_ENABLED = os.getenv("EXTRACTION_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+# A PDF page whose text layer has fewer characters than this (and has images) is OCR'd
+PAGE_MIN_TEXT_CHARS = int(os.getenv("PDF_PAGE_MIN_TEXT_CHARS", "150"))
+# Pages of one scanned PDF OCR'd concurrently (rendering runs in page_render's process pool)
+OCR_PAGE_CONCURRENCY = max(1, int(os.getenv("OCR_PAGE_CONCURRENCY", "4")))
+
+
 class FileProcessor:
     """Process and extract text from various file types"""
     
     # Supported Image file extensions
     IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.bmp', '.gif', '.webp'}
 
+    # Types whose extraction is expensive enough (parsing / OCR) to cache by content hash
+    EXTRACTION_CACHE_EXTENSIONS = {'.pdf', '.docx', '.doc', '.xlsx', '.xls', '.ppt', '.pptx', '.pptm'} | IMAGE_EXTENSIONS
+
     # Supported text file extensions
     TEXT_EXTENSIONS = {
         '.txt', '.md', '.py', '.js', '.jsx', '.ts', '.tsx', '.java', '.cpp', '.c', '.h',
@@ -152,8 +180,122 @@ class FileProcessor:
         return False
 
     @staticmethod
-    def force_ocr(file_path: str) -> str:
-        """Force OCR extraction for a file using NVIDIA OCR (if available) or local pytesseract as fallback.
+    def _file_sha256(file_path: str) -> str:
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    @staticmethod
+    def _page_ocr_key(file_hash: str, page_num: int, render_params: str) -> str:
+        """Cache key for one page's OCR text: file content + page + how it was rendered."""
+        key = f"{file_hash}:{page_num}:{render_params}:v{PAGE_OCR_CACHE_VERSION}"
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    @staticmethod
+    async def _ocr_image_async(gemini: GeminiService, img_data: bytes) -> Tuple[Optional[str], bool]:
+        """OCR one rendered page: Gemini Vision first, local tesseract as fallback.
+
+        Returns (text, from_gemini). Only Gemini results are cached per page, so a
+        transient Gemini failure does not pin the lower-quality tesseract text.
+        """
+        try:
+            text = await gemini.ocr_with_gemini(img_data)
+        except Exception:
+            text = None
+        if text and str(text).strip():
+            return str(text), True
+
+        if PYTESSERACT_AVAILABLE:
+            try:
+                img = Image.open(io.BytesIO(img_data))
+                return await asyncio.to_thread(pytesseract.image_to_string, img), False
+            except Exception:
+                pass
+        return None, False
+
+    @staticmethod
+    async def _ocr_pages_async(file_path: str, renderer: str, resolution: int,
+                               keys: Dict[int, str]) -> Dict[int, Optional[str]]:
+        """Render (process pool) and OCR (at most OCR_PAGE_CONCURRENCY in flight) the given pages."""
+        loop = asyncio.get_running_loop()
+        pool = page_render.get_render_pool()
+        gemini = GeminiService()
+        semaphore = asyncio.Semaphore(OCR_PAGE_CONCURRENCY)
+
+        async def ocr_page(page_num: int) -> Optional[str]:
+            async with semaphore:
+                img_data = await loop.run_in_executor(pool, page_render.render_page, file_path, page_num, renderer, resolution)
+                text, from_gemini = await FileProcessor._ocr_image_async(gemini, img_data)
+            if text and from_gemini:
+                EvaluationCache.set(keys[page_num], text, eval_type="ocr_page")
+            return text
+
+        pages = sorted(keys)
+        results = await asyncio.gather(*(ocr_page(n) for n in pages), return_exceptions=True)
+        texts: Dict[int, Optional[str]] = {}
+        for page_num, result in zip(pages, results):
+            if isinstance(result, BrokenProcessPool):
+                page_render.reset_render_pool()
+            texts[page_num] = None if isinstance(result, BaseException) else result
+        return texts
+
+    @staticmethod
+    async def _ocr_images_async(images: List[bytes]) -> Optional[str]:
+        """OCR images handed back by a parsing job (at most OCR_PAGE_CONCURRENCY in flight)."""
+        gemini = GeminiService()
+        semaphore = asyncio.Semaphore(OCR_PAGE_CONCURRENCY)
+
+        async def ocr_one(img_data: bytes) -> Optional[str]:
+            async with semaphore:
+                text, _ = await FileProcessor._ocr_image_async(gemini, img_data)
+            return text
+
+        results = await asyncio.gather(*(ocr_one(img) for img in images), return_exceptions=True)
+        texts = [r.strip() for r in results if isinstance(r, str) and r.strip()]
+        return '\n\n'.join(texts) if texts else None
+
+    @staticmethod
+    def _pdf_page_plan(file_path: str, renderer: str, dpi: int,
+                       pages: Optional[List[int]] = None) -> Tuple[int, Dict[int, str], Dict[int, Optional[str]]]:
+        """Blocking prelude of page OCR: hash the file, count pages, look up cached page text."""
+        file_hash = FileProcessor._file_sha256(file_path)
+        if renderer == 'pymupdf':
+            if pages is None:
+                with fitz.open(file_path) as doc:
+                    pages = list(range(1, doc.page_count + 1))
+            resolution = PYMUPDF_RENDER_SCALE
+            render_params = f"pymupdf:{PYMUPDF_RENDER_SCALE}x:png"
+        else:
+            if pages is None:
+                poppler_path = os.getenv('POPPLER_PATH') or None
+                pages = list(range(1, int(pdfinfo_from_path(file_path, poppler_path=poppler_path)["Pages"]) + 1))
+            resolution = dpi
+            render_params = f"pdf2image:{dpi}dpi:png"
+
+        keys = {n: FileProcessor._page_ocr_key(file_hash, n, render_params) for n in pages}
+        cached = EvaluationCache.get_many(keys.values(), eval_type="ocr_page")
+        return resolution, keys, {n: cached.get(key) for n, key in keys.items()}
+
+    @staticmethod
+    async def _ocr_pdf_pages_async(file_path: str, renderer: str, dpi: int = PDF2IMAGE_OCR_DPI,
+                                   pages: Optional[List[int]] = None) -> Dict[int, Optional[str]]:
+        """OCR the given 1-based pages of a PDF (all pages when None): {page_num: text or None}.
+
+        Cached pages are looked up before anything is rendered; the missing pages are
+        rasterized in the render process pool and OCR'd concurrently.
+        """
+        resolution, keys, texts = await asyncio.to_thread(FileProcessor._pdf_page_plan, file_path, renderer, dpi, pages)
+        missing = {n: keys[n] for n, text in texts.items() if text is None}
+        if missing:
+            texts.update(await FileProcessor._ocr_pages_async(file_path, renderer, resolution, missing))
+
+        return {n: (str(texts[n]) if texts[n] else None) for n in sorted(texts)}
+
+    @staticmethod
+    async def force_ocr(file_path: str) -> Optional[str]:
+        """Force OCR extraction for a file using Gemini Vision or local pytesseract as fallback.
 
         Returns extracted text or None if nothing found.
         """
@@ -165,77 +307,183 @@ class FileProcessor:
             if not PDF2IMAGE_AVAILABLE:
                 return None
             try:
-                poppler_path = os.getenv('POPPLER_PATH') or None
-                images = convert_from_path(file_path, dpi=300, poppler_path=poppler_path)
-                parts = []
-                for img in images:
-
-
-                    # Try Gemini Vision OCR (Very High Accuracy)
-                    try:
-                        gemini = GeminiService()
-                        # Use asyncio.run if called from synchronous context (standard for staticmethods here)
-                        # but file_processor is mostly used in async GenerateServiceComplete.
-                        # However, these methods are not defined as async.
-                        # For now, we'll try to run it synchronously or just skip if it's too complex.
-                        # Actually, GeminiService.ocr_with_gemini is async.
-                        
-                        # Let's use a small helper to run async in sync for this specific task
-                        def run_sync(coro):
-                            import asyncio
-                            try:
-                                loop = asyncio.get_event_loop()
-                                if loop.is_running():
-                                    import nest_asyncio
-                                    nest_asyncio.apply()
-                                return loop.run_until_complete(coro)
-                            except Exception:
-                                return asyncio.run(coro)
-
-                        buf = io.BytesIO()
-                        img.save(buf, format='PNG')
-                        text = run_sync(gemini.ocr_with_gemini(buf.getvalue()))
-                        if text:
-                            parts.append(text)
-                            continue
-                    except Exception as e:
-                        pass
-
-                    # Fallback to local pytesseract
-                    if PYTESSERACT_AVAILABLE:
-                        try:
-                            parts.append(pytesseract.image_to_string(img))
-                        except Exception:
-                            pass
-
-                if parts:
-                    joined = '\n\n'.join(p for p in parts if p and p.strip())
+                pages = await FileProcessor._ocr_pdf_pages_async(file_path, 'pdf2image', dpi=PDF2IMAGE_FORCE_OCR_DPI)
+                if pages:
+                    joined = '\n\n'.join(text for text in pages.values() if text and text.strip())
                     return joined if joined.strip() else None
             except Exception:
                 return None
             return None
 
+        images: List[bytes] = []
         if ext == '.docx':
-            return FileProcessor._ocr_docx_images(file_path)
-
-        if ext == '.doc':
+            await asyncio.to_thread(FileProcessor._docx_images, file_path, images)
+        elif ext == '.doc':
             # Try to convert .doc to images and OCR them
-            return FileProcessor._ocr_doc_images(file_path)
+            com_text = await asyncio.to_thread(FileProcessor._doc_page_images, file_path, images)
+            if com_text:
+                return com_text
+        if images:
+            return await FileProcessor._ocr_images_async(images)
 
         # For other file types, no OCR performed
         return None
     
     @staticmethod
-    def read_file(file_path: str) -> Dict[str, any]:
+    def _is_placeholder(content: str) -> bool:
+        """True for the bracketed '[... not available ...]' / '[Error ...]' messages returned instead of text."""
+        text = (content or '').strip()
+        return not text or (text.startswith('[') and text.endswith(']') and '\n' not in text)
+
+    @staticmethod
+    async def read_file_async(file_path: str, run_blocking: Optional[Callable[..., Awaitable]] = None) -> Dict[str, any]:
         """
-        Read file content based on file extension
-        Returns dict with filename, content, and file_type
+        Read file content based on file extension. Returns dict with filename, content,
+        file_type and 'extraction' metadata (extractor, page_count, seconds, cached); documents
+        that need parsing or OCR are served from the extraction cache when the same bytes were
+        extracted before. Parsing runs through run_blocking (worker threads by default, the
+        extraction process pool for process_many), cache I/O in threads, and all OCR (PDF pages,
+        images, pictures in Word files) is awaited on the calling loop.
         """
+        run_blocking = run_blocking or asyncio.to_thread
         file_path_obj = Path(file_path)
         
         if not file_path_obj.exists():
             raise FileNotFoundError(f"File not found: {file_path}")
         
+        started = time.perf_counter()
+        cache_key, cached = await asyncio.to_thread(FileProcessor._extraction_cache_lookup, file_path_obj)
+        if cached is not None:
+            return FileProcessor._cached_extraction(file_path_obj, cached, started)
+        
+        info: Dict = {}
+        extension = file_path_obj.suffix.lower()
+        if extension == '.pdf' or extension in FileProcessor.IMAGE_EXTENSIONS:
+            try:
+                if extension == '.pdf':
+                    content = await FileProcessor._read_pdf_async(str(file_path_obj), info, run_blocking)
+                    file_type = 'pdf'
+                else:
+                    content = await FileProcessor._read_image_async(str(file_path_obj))
+                    file_type = 'image'
+                result = {
+                    'filename': file_path_obj.name,
+                    'content': content,
+                    'file_type': file_type,
+                    'extension': extension
+                }
+            except Exception as e:
+                result = {
+                    'filename': file_path_obj.name,
+                    'content': f"[Error reading file: {str(e)}]",
+                    'file_type': 'error',
+                    'extension': extension
+                }
+        else:
+            result, parsed = await run_blocking(FileProcessor._read_file_job, str(file_path_obj))
+            images = parsed.pop('ocr_images', None)
+            info.update(parsed)
+            if images:
+                ocr_text = await FileProcessor._ocr_images_async(images)
+                if ocr_text:
+                    result['content'] = ocr_text
+                    info['extractor'] = 'ocr'
+        return await asyncio.to_thread(FileProcessor._finish_extraction, result, info, started, cache_key)
+    
+    @staticmethod
+    async def process_many(file_paths: List[str]) -> AsyncIterator[Tuple[int, Dict[str, any]]]:
+        """
+        Extract a batch of files with parsing spread over the extraction process pool
+        (EXTRACTION_WORKERS, per-file timeout and memory limit). Yields (index, result)
+        in completion order; a file that fails or times out yields an 'error' result.
+        """
+        pool = get_extraction_pool()
+        
+        async def extract(index: int, file_path: str) -> Tuple[int, Dict[str, any]]:
+            try:
+                return index, await FileProcessor.read_file_async(file_path, pool.run)
+            except Exception as e:
+                path_obj = Path(file_path)
+                return index, {
+                    'filename': path_obj.name,
+                    'content': f"[Error reading file: {str(e)}]",
+                    'file_type': 'error',
+                    'extension': path_obj.suffix.lower()
+                }
+        
+        tasks = [asyncio.ensure_future(extract(i, str(p))) for i, p in enumerate(file_paths)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+    
+    @staticmethod
+    def _read_file_job(file_path: str) -> Tuple[Dict[str, any], Dict]:
+        """Picklable parsing job for the extraction pool: (result, info).
+
+        Word images that need OCR come back in info['ocr_images'] rather than being OCR'd
+        here, so Gemini calls stay under the parent's limiter, quotas and breaker.
+        """
+        info: Dict = {'ocr_images': []}
+        return FileProcessor._read_file_uncached(Path(file_path), info), info
+    
+    @staticmethod
+    def _extraction_cache_lookup(file_path_obj: Path) -> Tuple[Optional[str], Optional[Dict]]:
+        """(cache_key, cached extraction) for types worth caching; (None, None) otherwise"""
+        extension = file_path_obj.suffix.lower()
+        if not EXTRACTION_CACHE_ENABLED or extension not in FileProcessor.EXTRACTION_CACHE_EXTENSIONS:
+            return None, None
+        try:
+            file_hash = FileProcessor._file_sha256(str(file_path_obj))
+            cache_key = hashlib.sha256(f"{file_hash}:{extension}:v{EXTRACTION_PIPELINE_VERSION}".encode()).hexdigest()
+            return cache_key, EvaluationCache.get(cache_key, eval_type="extraction")
+        except Exception:
+            return None, None
+    
+    @staticmethod
+    def _cached_extraction(file_path_obj: Path, cached: Dict, started: float) -> Dict[str, any]:
+        return {
+            'filename': file_path_obj.name,
+            'content': cached['content'],
+            'file_type': cached['file_type'],
+            'extension': file_path_obj.suffix.lower(),
+            'extraction': {
+                **cached['extraction'],
+                'cached': True,
+                'seconds': round(time.perf_counter() - started, 4),
+            }
+        }
+    
+    @staticmethod
+    def _finish_extraction(result: Dict, info: Dict, started: float, cache_key: Optional[str]) -> Dict[str, any]:
+        """Attach 'extraction' metadata and store cacheable results"""
+        extraction = {
+            'extractor': info.get('extractor', result['file_type']),
+            'page_count': info.get('page_count'),
+            'pages_text': info.get('pages_text'),
+            'pages_ocr': info.get('pages_ocr'),
+            'pipeline_version': EXTRACTION_PIPELINE_VERSION,
+            'extract_seconds': round(time.perf_counter() - started, 4),
+        }
+        result['extraction'] = {**extraction, 'cached': False, 'seconds': extraction['extract_seconds']}
+        
+        if cache_key and result['file_type'] != 'error' and not FileProcessor._is_placeholder(result['content']):
+            EvaluationCache.set(cache_key, {
+                'content': result['content'],
+                'file_type': result['file_type'],
+                'extraction': extraction,
+            }, eval_type="extraction")
+        return result
+    
+    @staticmethod
+    def _read_file_uncached(file_path_obj: Path, info: Dict) -> Dict[str, any]:
+        """
+        Run the blocking extractor for the file's type. PDFs and images are read by
+        read_file_async itself; Word pictures that need OCR are left in info['ocr_images'].
+        """
+        file_path = str(file_path_obj)
         filename = file_path_obj.name
         extension = file_path_obj.suffix.lower()
         
@@ -250,19 +498,9 @@ class FileProcessor:
                     'extension': extension
                 }
             
-            # PDF files
-            elif extension == '.pdf':
-                content = FileProcessor._read_pdf(file_path)
-                return {
-                    'filename': filename,
-                    'content': content,
-                    'file_type': 'pdf',
-                    'extension': extension
-                }
-            
             # Word .docx
             elif extension == '.docx':
-                content = FileProcessor._read_docx(file_path)
+                content = FileProcessor._read_docx(file_path, info.setdefault('ocr_images', []))
                 return {
                     'filename': filename,
                     'content': content,
@@ -271,7 +509,7 @@ class FileProcessor:
                 }
             # Legacy Word .doc (Windows COM fallback)
             elif extension == '.doc':
-                content = FileProcessor._read_doc(file_path)
+                content = FileProcessor._read_doc(file_path, info.setdefault('ocr_images', []))
                 return {
                     'filename': filename,
                     'content': content,
@@ -299,16 +537,6 @@ class FileProcessor:
                     'extension': extension
                 }
             
-            # Image files (OCR via Gemini Vision)
-            elif extension in FileProcessor.IMAGE_EXTENSIONS:
-                content = FileProcessor._read_image(file_path)
-                return {
-                    'filename': filename,
-                    'content': content,
-                    'file_type': 'image',
-                    'extension': extension
-                }
-            
             # JSON files
             elif extension == '.json':
                 content = FileProcessor._read_json(file_path)
@@ -372,214 +600,181 @@ class FileProcessor:
             return f.read().decode('utf-8', errors='replace')
     
     @staticmethod
-    def _read_pdf(file_path: str) -> str:
-        """Extract text from PDF file"""
+    async def _read_pdf_async(file_path: str, info: Optional[Dict] = None,
+                              run_blocking: Optional[Callable[..., Awaitable]] = None) -> str:
+        """Extract text from a PDF: text-layer parsing via run_blocking (a worker thread by default), OCR awaited on the loop"""
+        info = {} if info is None else info
+        pages, parsed = await (run_blocking or asyncio.to_thread)(FileProcessor._pdf_text_pages_job, file_path)
+        info.update(parsed)
+        text = FileProcessor._text_layer_only(pages, info)
+        if text is None:
+            text = await FileProcessor._read_pdf_ocr_async(file_path, info, pages)
+        return text if text is not None else FileProcessor._pdf_failure_message()
+
+    @staticmethod
+    def _page_ocr_reason(text: str, has_graphics: bool = True) -> Optional[str]:
+        """
+        Why a page's text layer is not good enough ('sparse', 'garbage', 'math'), or None to keep it.
+        Math needs Vision OCR to preserve LaTeX structure: linear text extraction destroys
+        fractions, superscripts, and matrix structure. A sparse page without images or
+        drawings is simply blank.
+        """
+        text = (text or '').strip()
+        if len(text) < PAGE_MIN_TEXT_CHARS:
+            return 'sparse' if has_graphics else None
+        if FileProcessor._is_garbage_text(text):
+            return 'garbage'
+        if FileProcessor._contains_complex_math(text):
+            return 'math'
+        return None
+
+    @staticmethod
+    def _pdf_text_pages(file_path: str, info: Dict) -> Optional[List[Tuple[str, Optional[str]]]]:
+        """
+        Text layer per page as [(text, ocr_reason)] (pdfplumber, PyPDF2 as fallback and as a
+        second opinion on sparse/garbage pages). None when no text layer could be read.
+        """
+        pages = None
         if PDFPLUMBER_AVAILABLE:
             try:
-                text_content = []
                 with pdfplumber.open(file_path) as pdf:
+                    pages = []
                     for page in pdf.pages:
-                        text = page.extract_text()
-                        if text:
-                            text_content.append(text)
-                extracted = '\n\n'.join(text_content)
-                total_pages = len(pdf.pages)
-                avg_chars = len(extracted) / total_pages if total_pages > 0 else 0
-                
-                # If text is extremely sparse (less than 150 chars per page average), 
-                # it's likely a scanned PDF with minor OCR metadata. Proceed to high-quality OCR.
-                # SPECIAL CHECK: If the document contains math, we MUST use Vision OCR to preserve LaTeX structure.
-                # Linear text extraction destroys fractions, superscripts, and matrix structure.
-                is_math_heavy = FileProcessor._contains_complex_math(extracted)
-                
-                if extracted.strip() and not FileProcessor._is_garbage_text(extracted) and avg_chars > 150:
-                    if is_math_heavy:
-                        # Fall through to OCR to preserve math structure
-                        pass 
-                    else:
-                        return extracted
-            except Exception as e:
-                pass
-        
-        if PDF_AVAILABLE:
+                        text = page.extract_text() or ''
+                        has_graphics = bool(page.images or page.curves)
+                        pages.append((text, FileProcessor._page_ocr_reason(text, has_graphics)))
+                info['text_extractor'] = 'pdfplumber'
+            except Exception:
+                pages = None
+
+        if PDF_AVAILABLE and (pages is None or any(reason in ('sparse', 'garbage') for _, reason in pages)):
             try:
-                text_content = []
                 with open(file_path, 'rb') as file:
                     pdf_reader = PyPDF2.PdfReader(file)
-                    for page in pdf_reader.pages:
-                        text = page.extract_text()
-                        if text:
-                            text_content.append(text)
-                extracted = '\n\n'.join(text_content)
-                total_pages = len(pdf_reader.pages)
-                avg_chars = len(extracted) / total_pages if total_pages > 0 else 0
-
-                is_math_heavy = FileProcessor._contains_complex_math(extracted)
-
-                if extracted.strip() and not FileProcessor._is_garbage_text(extracted) and avg_chars > 150:
-                    if is_math_heavy:
-                        pass
+                    if pages is None:
+                        pages = []
+                        for page in pdf_reader.pages:
+                            text = page.extract_text() or ''
+                            pages.append((text, FileProcessor._page_ocr_reason(text)))
+                        info['text_extractor'] = 'pypdf2'
                     else:
-                        return extracted
-            except Exception as e:
-                # If PyPDF2 fails, we continue to OCR fallback instead of returning error immediately
+                        for index, (_, reason) in enumerate(pages):
+                            if reason not in ('sparse', 'garbage'):
+                                continue
+                            text = pdf_reader.pages[index].extract_text() or ''
+                            if FileProcessor._page_ocr_reason(text) is None:
+                                pages[index] = (text, None)
+            except Exception:
+                # If PyPDF2 fails, we continue with what pdfplumber found (or OCR everything)
                 pass
-        
-        # If we reach here, try OCR fallback for scanned PDFs
-        ocr_text_parts = []
+
+        if pages is not None:
+            info.setdefault('page_count', len(pages))
+        return pages
+
+    @staticmethod
+    def _pdf_text_pages_job(file_path: str) -> Tuple[Optional[List[Tuple[str, Optional[str]]]], Dict]:
+        """Picklable text-layer job for the extraction pool: (pages, info)"""
+        info: Dict = {}
+        return FileProcessor._pdf_text_pages(file_path, info), info
+
+    @staticmethod
+    def _text_layer_only(pages: Optional[List[Tuple[str, Optional[str]]]], info: Dict) -> Optional[str]:
+        """Joined text layer when no page needs OCR, otherwise None"""
+        if not pages or any(reason for _, reason in pages):
+            return None
+        texts = [text for text, _ in pages if text.strip()]
+        if not texts:
+            return None
+        info['extractor'] = info.get('text_extractor', 'pdfplumber')
+        info['pages_text'] = len(texts)
+        info['pages_ocr'] = 0
+        return '\n\n'.join(texts)
+
+    @staticmethod
+    async def _read_pdf_ocr_async(file_path: str, info: Dict,
+                                  pages: Optional[List[Tuple[str, Optional[str]]]] = None) -> Optional[str]:
+        """
+        OCR only the pages whose text layer is missing, garbled or math-heavy (every page when the
+        text layer is unreadable) and keep the text layer for the rest. Every page is wrapped in
+        START/END PAGE markers.
+        """
+        wanted = [n for n, (_, reason) in enumerate(pages, start=1) if reason] if pages is not None else None
+        ocr_texts: Dict[int, str] = {}
+        seen_pages = set()
+        used_renderers = []
         
         # Method 1: PyMuPDF (FITZ) - Highly robust, no Poppler needed
+        # Method 2: PDF2IMAGE (Poppler Fallback), for whatever pages are still missing
+        renderers = []
         if PYMUPDF_AVAILABLE:
-            try:
-                doc = fitz.open(file_path)
-                for page in doc:
-                    pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))  # Scale up for better OCR
-                    img_data = pix.tobytes("png")
-                    
-                    text = None
-                    # Try Gemini Vision OCR (State-of-the-Art)
-                    try:
-                        gemini = GeminiService()
-                        def run_sync(coro):
-                            try:
-                                loop = asyncio.get_event_loop()
-                                if loop.is_running():
-                                    import nest_asyncio
-                                    nest_asyncio.apply()
-                                return loop.run_until_complete(coro)
-                            except Exception:
-                                return asyncio.run(coro)
-                        
-                        text = run_sync(gemini.ocr_with_gemini(img_data))
-                    except Exception:
-                        pass
-                    
-                    if not text or not str(text).strip():
-                        # Try local tesseract if Gemini failed
-                        if PYTESSERACT_AVAILABLE:
-                            try:
-                                img = Image.open(io.BytesIO(img_data))
-                                text = pytesseract.image_to_string(img)
-                            except Exception:
-                                pass
-                    
-                    if text:
-                        page_num = page.number + 1
-                        ocr_text_parts.append(f"--- [START PAGE {page_num}] ---\n{str(text)}\n--- [END PAGE {page_num}] ---")
-                
-                if ocr_text_parts:
-                    ocr_text = '\n\n'.join(ocr_text_parts)
-                    if ocr_text.strip():
-                        return ocr_text
-            except Exception:
-                pass
-
-        # Method 2: PDF2IMAGE (Poppler Fallback)
+            renderers.append('pymupdf')
         if PDF2IMAGE_AVAILABLE:
+            renderers.append('pdf2image')
+        todo = wanted
+        for renderer in renderers:
+            if todo is not None and not todo:
+                break
             try:
-                poppler_path = os.getenv('POPPLER_PATH') or None
-                images = convert_from_path(file_path, dpi=200, poppler_path=poppler_path)
-                for img in images:
-                    text = None
-
-                    
-                    # 2. Try Gemini Vision OCR
-                    if not text or not str(text).strip():
-                        try:
-                            gemini = GeminiService()
-                            def run_sync(coro):
-                                try:
-                                    loop = asyncio.get_event_loop()
-                                    if loop.is_running():
-                                        import nest_asyncio
-                                        nest_asyncio.apply()
-                                    return loop.run_until_complete(coro)
-                                except Exception:
-                                    return asyncio.run(coro)
-                            
-                            buf = io.BytesIO()
-                            img.save(buf, format='PNG')
-                            text = run_sync(gemini.ocr_with_gemini(buf.getvalue()))
-                        except Exception:
-                            text = None
-
-                    if (not text or not str(text).strip()) and PYTESSERACT_AVAILABLE:
-                        try:
-                            text = pytesseract.image_to_string(img)
-                        except Exception:
-                            text = None
-                    
-                    if text:
-                        page_num = images.index(img) + 1
-                        ocr_text_parts.append(f"--- [START PAGE {page_num}] ---\n{str(text)}\n--- [END PAGE {page_num}] ---")
-                
-                if ocr_text_parts:
-                    ocr_text = '\n\n'.join(ocr_text_parts)
-                    if ocr_text.strip():
-                        return ocr_text
+                result = await FileProcessor._ocr_pdf_pages_async(file_path, renderer, pages=todo)
             except Exception:
-                pass
+                continue
+            seen_pages.update(result)
+            recovered = {n: text for n, text in result.items() if text and text.strip()}
+            if recovered:
+                ocr_texts.update(recovered)
+                used_renderers.append(renderer)
+            todo = [n for n in sorted(result) if n not in ocr_texts]
 
-        # If everything failed
+        page_numbers = range(1, len(pages) + 1) if pages is not None else sorted(seen_pages)
+        parts = []
+        pages_text = 0
+        for page_num in page_numbers:
+            text = ocr_texts.get(page_num)
+            if text is None:
+                # Text layer (also the fallback when OCR of this page failed)
+                text = pages[page_num - 1][0] if pages is not None else ''
+                if not text.strip():
+                    continue
+                pages_text += 1
+            parts.append(f"--- [START PAGE {page_num}] ---\n{text}\n--- [END PAGE {page_num}] ---")
+        
+        if not parts:
+            return None
+        extractors = ([info.get('text_extractor', 'pdfplumber')] if pages_text else []) + [f'{r}_ocr' for r in used_renderers]
+        info['extractor'] = '+'.join(extractors)
+        info['pages_ocr'] = len(ocr_texts)
+        info['pages_text'] = pages_text
+        info.setdefault('page_count', len(page_numbers))
+        return '\n\n'.join(parts)
+
+    @staticmethod
+    def _pdf_failure_message() -> str:
         if not (PDFPLUMBER_AVAILABLE or PDF_AVAILABLE):
             return "[PDF library not available. Install PyPDF2 or pdfplumber]"
         
         return "[No extractable text found in PDF. Scanned documents require Poppler (for pdf2image) or PyMuPDF installed.]"
     
     @staticmethod
-    def _ocr_docx_images(file_path: str) -> str:
-        """Extract images from .docx and run OCR on them using NVIDIA OCR (if configured) or pytesseract."""
+    def _docx_images(file_path: str, images: List[bytes]) -> None:
+        """Collect the images embedded in a .docx into images; the caller OCRs them (see _ocr_images_async)."""
         try:
-            texts = []
             with zipfile.ZipFile(file_path, 'r') as z:
                 for name in z.namelist():
                     if name.startswith('word/media/'):
                         try:
-                            data = z.read(name)
-
-
-                            # Try Gemini Vision OCR (Extremely accurate for math/code)
-                            try:
-                                gemini = GeminiService()
-                                def run_sync(coro):
-                                    import asyncio
-                                    try:
-                                        loop = asyncio.get_event_loop()
-                                        if loop.is_running():
-                                            import nest_asyncio
-                                            nest_asyncio.apply()
-                                        return loop.run_until_complete(coro)
-                                    except Exception:
-                                        return asyncio.run(coro)
-
-                                text = run_sync(gemini.ocr_with_gemini(data))
-                                if text and text.strip():
-                                    texts.append(text.strip())
-                                    continue
-                            except Exception:
-                                pass
-
-                            # Fallback to local tesseract if available
-                            if PYTESSERACT_AVAILABLE:
-                                try:
-                                    from PIL import Image
-                                    img = Image.open(_io.BytesIO(data))
-                                    text = pytesseract.image_to_string(img)
-                                    if text and text.strip():
-                                        texts.append(text.strip())
-                                except Exception:
-                                    continue
+                            images.append(z.read(name))
                         except Exception:
                             continue
-            if texts:
-                return '\n\n'.join(texts)
         except Exception:
-            return None
-        return None
+            pass
 
     @staticmethod
-    def _ocr_doc_images(file_path: str) -> str:
-        """Convert .doc to PDF using win32com, then convert PDF to images and run OCR."""
+    def _doc_page_images(file_path: str, images: List[bytes]) -> Optional[str]:
+        """Convert .doc to PDF using win32com and collect its pages as PNGs into images for the caller to OCR.
+
+        Without pdf2image the pages cannot be rendered, so the text COM extracts is returned instead.
+        """
         # Check prerequisites
         if not WIN32COM_AVAILABLE:
             return None
@@ -642,48 +837,12 @@ class FileProcessor:
                     if not os.path.exists(pdf_path):
                         return None
                     
-                    # Convert PDF pages to images and OCR
+                    # Convert PDF pages to images; OCR happens in the caller
                     poppler_path = os.getenv('POPPLER_PATH') or None
-                    images = convert_from_path(pdf_path, dpi=200, poppler_path=poppler_path)
-                    texts = []
-                    
-                    for img in images:
-
-                        
-                        # Try Gemini Vision OCR (Very High Accuracy)
-                        try:
-                            gemini = GeminiService()
-                            def run_sync(coro):
-                                import asyncio
-                                try:
-                                    loop = asyncio.get_event_loop()
-                                    if loop.is_running():
-                                        import nest_asyncio
-                                        nest_asyncio.apply()
-                                    return loop.run_until_complete(coro)
-                                except Exception:
-                                    return asyncio.run(coro)
-
-                            buf = io.BytesIO()
-                            img.save(buf, format='PNG')
-                            text = run_sync(gemini.ocr_with_gemini(buf.getvalue()))
-                            if text and text.strip():
-                                texts.append(text)
-                                continue
-                        except Exception:
-                            pass
-                        
-                        # Fallback to local pytesseract
-                        if PYTESSERACT_AVAILABLE:
-                            try:
-                                text = pytesseract.image_to_string(img)
-                                if text and text.strip():
-                                    texts.append(text)
-                            except Exception:
-                                pass
-                    
-                    if texts:
-                        return '\n\n'.join(texts)
+                    for img in convert_from_path(pdf_path, dpi=200, poppler_path=poppler_path):
+                        buf = io.BytesIO()
+                        img.save(buf, format='PNG')
+                        images.append(buf.getvalue())
                         
                 finally:
                     doc.Close(False)
@@ -699,18 +858,18 @@ class FileProcessor:
             # Log error for debugging but return None silently
             import logging
             logger = logging.getLogger(__name__)
-            logger.debug(f"OCR for DOC file failed: {e}")
+            logger.debug(f"Rendering DOC pages for OCR failed: {e}")
             return None
         return None
 
-    def _read_docx(file_path: str) -> str:
+    def _read_docx(file_path: str, ocr_images: List[bytes]) -> str:
         """Extract text from Word document, including paragraphs, tables, headers and footers.
 
         This function tries multiple strategies in order:
         1. python-docx structured extraction (paragraphs, tables, headers/footers)
         2. docx2txt extraction (if installed)
         3. mammoth extraction (if installed)
-        4. OCR images embedded in the .docx (if pytesseract is installed)
+        4. images embedded in the .docx, collected into ocr_images for the caller to OCR
         """
         if not DOCX_AVAILABLE:
             # Fall back to docx2txt or mammoth if python-docx not installed
@@ -790,17 +949,15 @@ class FileProcessor:
                                 return t
                     except Exception:
                         pass
-                # Try OCR on images embedded in docx
-                ocr_text = FileProcessor._ocr_docx_images(file_path)
-                if ocr_text:
-                    return ocr_text
+                # Leave images embedded in the docx to be OCR'd by the caller
+                FileProcessor._docx_images(file_path, ocr_images)
 
             return extracted if extracted else "[No text extracted from DOCX]"
         except Exception as e:
             return f"[Error reading DOCX: {str(e)}]"
 
     @staticmethod
-    def _read_doc(file_path: str) -> str:
+    def _read_doc(file_path: str, ocr_images: List[bytes]) -> str:
         """Extract text from legacy .doc using Windows Word COM if available, with OCR fallback"""
         if WIN32COM_AVAILABLE:
             try:
@@ -821,7 +978,7 @@ class FileProcessor:
                     if paragraphs:
                         return '\n\n'.join(paragraphs)
                     # If no text found via COM, try OCR as fallback
-                    ocr_result = FileProcessor._ocr_doc_images(file_path)
+                    ocr_result = FileProcessor._doc_page_images(file_path, ocr_images)
                     if ocr_result and ocr_result.strip():
                         return ocr_result
                     return "[No text extracted from .doc]"
@@ -832,7 +989,7 @@ class FileProcessor:
                 error_msg = str(e)
                 # Try OCR fallback even if COM fails
                 try:
-                    ocr_result = FileProcessor._ocr_doc_images(file_path)
+                    ocr_result = FileProcessor._doc_page_images(file_path, ocr_images)
                     if ocr_result and ocr_result.strip():
                         return ocr_result
                 except Exception:
@@ -841,7 +998,7 @@ class FileProcessor:
                 return f"[Error reading DOC via COM: {error_msg}]"
         
         # If win32com not available, try OCR directly
-        ocr_result = FileProcessor._ocr_doc_images(file_path)
+        ocr_result = FileProcessor._doc_page_images(file_path, ocr_images)
         if ocr_result and ocr_result.strip():
             return ocr_result
         
@@ -911,24 +1068,11 @@ class FileProcessor:
             return f"[Error reading PPT: {str(e)}]"
 
     @staticmethod
-    def _read_image(file_path: str) -> str:
-        """Read text from an image file using Gemini Vision OCR"""
+    async def _read_image_async(file_path: str) -> str:
         try:
-            with open(file_path, 'rb') as f:
-                img_data = f.read()
+            img_data = await asyncio.to_thread(Path(file_path).read_bytes)
             
             gemini = GeminiService()
-            def run_sync(coro):
-                import asyncio
-                try:
-                    loop = asyncio.get_event_loop()
-                    if loop.is_running():
-                        import nest_asyncio
-                        nest_asyncio.apply()
-                    return loop.run_until_complete(coro)
-                except Exception:
-                    return asyncio.run(coro)
-
             # Detect mime type from extension
             ext = Path(file_path).suffix.lower()
             mime_map = {
@@ -941,7 +1085,7 @@ class FileProcessor:
             }
             mime_type = mime_map.get(ext, 'image/png')
             
-            text = run_sync(gemini.ocr_with_gemini(img_data, mime_type=mime_type))
+            text = await gemini.ocr_with_gemini(img_data, mime_type=mime_type)
             return text if text else "[No text extracted from image]"
         except Exception as e:
             return f"[Error processing image: {str(e)}]"
@@ -1045,12 +1189,11 @@ class FileProcessor:
         return None
     
     @staticmethod
-    def process_multiple_files(file_paths: List[str]) -> List[Dict[str, any]]:
-        """Process multiple files and return their contents"""
-        results = []
-        for file_path in file_paths:
-            result = FileProcessor.read_file(file_path)
-            results.append(result)
+    async def process_multiple_files(file_paths: List[str]) -> List[Dict[str, any]]:
+        """Process multiple files and return their contents (in input order)"""
+        results: List[Dict[str, any]] = [None] * len(file_paths)
+        async for index, result in FileProcessor.process_many(file_paths):
+            results[index] = result
         return results
 
 
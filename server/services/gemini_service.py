@@ -2,13 +2,19 @@ import os
 import time
 import logging
 import asyncio
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Callable, Awaitable
 from dotenv import load_dotenv
-from google import genai
 from google.genai import types
 from pydantic import BaseModel, Field
 
 from .determinism_config import DeterministicEvalConfig, EvaluationCache
+from .llm_limiter import LLMPriority, gemini_limiter
+from .single_flight import SingleFlight
+from .context_cache import prompt_cache
+from .circuit_breaker import get_circuit_breaker
+from .rate_limiter import estimate_prompt_tokens, get_rate_limiter
+from .llm_backend import get_llm_backend
+from .llm_trace import llm_tracer
 
 load_dotenv()
 
@@ -38,6 +44,9 @@ class EvalDetail(BaseModel):
     max_marks: float = Field(1.0, description="The maximum marks for this question found in the text (e.g., 5 or 10). Default 1.0.")
     feedback: str = Field(description="Detailed feedback on the student's answer")
 
+class EvalDetailList(BaseModel):
+    evaluations: List[EvalDetail] = Field(description="One evaluation per question, in the same order as the questions were given")
+
 class PPTEvalCriteria(BaseModel):
     score: int = Field(description="Score between 0 and 100")
     feedback: str = Field(description="Brief feedback on the criteria")
@@ -89,34 +98,124 @@ class GitGradingResult(BaseModel):
     rule_results: List[GitRuleResult]
     technology_mismatch: GitTechMismatch
 
+# Identical concurrent evaluations / OCR pages share one in-flight LLM computation
+_qa_eval_flight = SingleFlight("qa_evaluation")
+_ocr_flight = SingleFlight("ocr")
+
+# Process-wide consensus counters (how many votes early-exit saved)
+_consensus_stats = {"evaluations": 0, "calls_issued": 0, "calls_saved": 0, "early_exits": 0, "hedged": 0}
+
+def _record_consensus(max_calls: int, issued: int, hedged: bool) -> None:
+    _consensus_stats["evaluations"] += 1
+    _consensus_stats["calls_issued"] += issued
+    _consensus_stats["calls_saved"] += max_calls - issued
+    if issued < max_calls:
+        _consensus_stats["early_exits"] += 1
+    if hedged:
+        _consensus_stats["hedged"] += 1
+
+# Grading rules shared by single-question and batched evaluation prompts
+QA_GRADING_RULES = """### GRADING PROCESS (STRICT FLOW):
+1. **AUTHENTICITY & REQUIREMENT CHECK (FIRST PRIORITY)**:
+   - **RULE**: Check if the requirement for `<<<QUESTION_START>>>` exists in **EITHER** the Assignment Description **OR** the Reference Materials provided in `<<<RUBRIC_START>>>`.
+   - **EMPTY DESCRIPTION EDGE CASE**: If the Assignment Description is EMPTY or contains no specific tasks, the **Reference Material** is the **ABSOLUTE BOUNDARY**. 
+     - If the student's work in `<<<STUDENT_ANSWER_START>>>` is about a topic/problem NOT found in the Reference Material, you **MUST** award **0.0**.
+     - **FEEDBACK**: "no question provided".
+   - **ZERO SCORE CONDITION**: Only if the question is missing from **BOTH** the Description and all Reference Materials:
+     - **ACTION**: SCORE 0.0 IMMEDIATELY.
+     - **FEEDBACK**: "no question provided".
+
+2. **CHECK FOR REFERENCE MATERIAL & DESCRIPTION (HYBRID EVALUATION)**:
+   - Identify if "OFFICIAL REFERENCE MATERIAL" or "ANSWER KEY" is present.
+    - **SCORING HIERARCHY**:
+      - **MATCH**: If the Student Answer matches any provided Reference Material -> **AWARD 1.0**.
+      - **DESC-DRIVEN**: If the question/topic is NOT in the Reference Material but IS in the Description -> **EVALUATE BASED ON DESCRIPTION**.
+      - **TOPIC CONSISTENCY & SCOPE LOCK (CRITICAL)**: If a Reference Material is provided, it defines the **ONLY** valid scope for the assignment. 
+         - **RULE**: If the Student submission is about a completely different topic than the Reference Material (e.g., Reference is about "Physics" but Student answers "History"), you **MUST award 0.0**.
+         - **EXCEPTION**: If the **Assignment Description** explicitly matches the Student's topic, you may ignore the unrelated Reference Material and award credit.
+         - **RATIONALE**: We must ensure students are answering the *specific* assignment provided by the teacher.
+
+    - **IF REFERENCE MATERIAL IS PRESENT (COLLECTIVE REFERENCE SET)**:
+      - **QUESTION EXISTENCE RULE (NON-NEGOTIABLE)**: Check if the specific `<<<QUESTION_START>>>` or its overall topic exists in the Reference Set OR the Description.
+        - **IF MISSING FROM BOTH (TOPIC MISMATCH)**: 
+          - **SCORE**: 0.0
+          - **FEEDBACK**: "Topic Mismatch: Evaluation failed because the submission does not relate to the provided reference material or assignment description."
+      - **RELEVANCE CHECK**: First determine if any part of the Reference Set is relevant to the topic of `<<<QUESTION_START>>>`.
+      - **POSITIVE MATCH RULE**: If the student's answer/logic matches ANY relevant provided reference materials -> **AWARD CREDIT**.
+      - **DEVIATION RULE**: If a RELEVANT part of the Reference Set exists and the student's logic contradicts it -> **SCORE 0.0**.
+      - **IDENTITY RULE**: Verbatim or substantive matches to ANY relevant part of the Reference Set -> **AWARD 1.0 IMMEDIATELY**.
+      - **FLEXIBILITY (Format Only)**: Different fonts, variable names, or languages are allowed ONLY if the logic matches a version in the Reference Set.
+      
+    - **IF NO RELEVANT REFERENCE IS PRESENT**: 
+      - Evaluate based on the Assignment Description and standard academic correctness.
+
+3.  **Analyze Requirements**: Check for specific constraints (e.g., time complexity, specific libraries).
+    - If student follows description but varies from reference format (e.g. different variable names), award credit.
+
+4.  **Verify Correctness**:
+   - Check for: Exactness, Logic, Syntax (for code), and Completeness.
+
+5.  **Determine Score (0.0 to 1.0)**:
+   - **1.0 (Correct)**: Matches logic/truth of Reference and meets Description requirements.
+   - **0.5 (Partial)**: Correct logic but missing a minor constraint from Description.
+   - **0.0 (Incorrect)**: Wrong logic (based on Reference) or fails a critical Description mandate.
+   - *Note*: Map to nearest bucket (0.0, 0.25, 0.5, 0.75, 1.0).
+
+### DETERMINISTIC RULES (NON-NEGOTIABLE):
+- **Language Independence**: Unless the Description explicitly mandates ONE language, treat the Reference as a logic guide, not a syntax constraint.
+- **Mathematics**: Evaluate based on **MATHEMATICAL CORRECTNESS**.
+- **No Hallucination**: NEVER infer missing content.
+- **Context is King**: If the student answers Question X correctly according to the Description, give credit even if the Reference is formatted differently.
+
+### FEEDBACK REQUIREMENTS:
+- Start with "Score: X/Y".
+- State: "Graded against Reference Key and Assignment Description."
+- Provide the logic used for the score.
+- Explain precisely why points were awarded or deducted."""
+
 class GeminiService:
     def __init__(self):
-        self.api_key = os.getenv("GEMINI_API_KEY", "")
         # CRITICAL: Force fixed model for determinism
         self.model = DeterministicEvalConfig.FIXED_MODEL
         logger.info(f"🔐 Using FIXED model for determinism: {self.model}")
         self.max_retries = MAX_LLM_RETRIES
         self.backoff_base = BACKOFF_BASE
-        
-        if self.api_key:
-            self.client = genai.Client(api_key=self.api_key)
-        else:
-            self.client = None
-            logger.warning("GEMINI_API_KEY not found in environment")
-
-    def _get_client(self):
-        if not self.client:
-            self.api_key = os.getenv("GEMINI_API_KEY", "")
-            if self.api_key:
-                self.client = genai.Client(api_key=self.api_key)
-        return self.client
-
-    async def _call_gemini_core(self, contents: Any, config: types.GenerateContentConfig, response_schema: Optional[Any] = None, operation_name: str = "LLM Call") -> Dict:
+        # Transport is pluggable (LLM_BACKEND=gemini|fake); shared by every instance
+        self.backend = get_llm_backend()
+
+    def _get_backend(self):
+        """The LLM backend, or None if it is not usable (e.g. Gemini without an API key)"""
+        return self.backend if self.backend.is_available() else None
+
+    @staticmethod
+    def _classify_error(e: Exception):
+        """Return (status_code, is_retryable) for an SDK/transport exception."""
+        error_msg = str(e)
+        status_code = getattr(e, 'status_code', None)
+
+        # Detect status codes from message if not provided
+        if status_code is None:
+            for code in [429, 500, 502, 503, 504]:
+                if str(code) in error_msg:
+                    status_code = code
+                    break
+
+        retryable_codes = {429, 500, 502, 503, 504}
+        retry_strings = ["overloaded", "timeout", "deadline", "connection", "rate limit", "busy"]
+
+        is_retryable = (status_code in retryable_codes) or \
+                       any(s in error_msg.lower() for s in retry_strings)
+        return status_code, is_retryable
+
+    async def _call_gemini_core(self, contents: Any, config: types.GenerateContentConfig, response_schema: Optional[Any] = None, operation_name: str = "LLM Call", priority: int = LLMPriority.NORMAL) -> Dict:
         """
-        Robust core wrapper for Gemini SDK with exponential retry and standardized error handling.
+        Robust core wrapper around the configured LLM backend with exponential retry and standardized error handling.
+        Every attempt is paced by the model's RPM/TPM quota limiter and admitted through the
+        process-wide adaptive concurrency limiter, and fails fast without calling the API
+        while the model's circuit breaker is open.
         """
-        client = self._get_client()
-        if not client:
+        backend = self._get_backend()
+        if not backend:
             return {
                 "success": False, 
                 "error": {
@@ -130,44 +229,69 @@ class GeminiService:
         attempt = 0
         last_error_msg = ""
         last_status_code = None
+        breaker = get_circuit_breaker(self.model)
+        quota = get_rate_limiter(self.model)
+        estimated_tokens = estimate_prompt_tokens(contents) if quota.enabled else 0
+        traced = llm_tracer.sample(operation_name)
+        cached_content = getattr(config, "cached_content", None)
 
         while attempt <= self.max_retries:
+            if not breaker.allow():
+                logger.warning(f"{operation_name} short-circuited: circuit breaker open for {self.model}")
+                return {
+                    "success": False,
+                    "error": {
+                        "type": "LLM_UNAVAILABLE",
+                        "message": "LLM service temporarily unavailable (circuit breaker open). Please try again later.",
+                        "circuit_open": True,  # Short-circuited: the call was never sent
+                        "status_code": last_status_code or 503,
+                        "raw": last_error_msg or f"Circuit breaker open for model {self.model}"
+                    }
+                }
+
             try:
-                # DEBUG: Log the model being used
-                print(f"\n🤖 [ACTIVE MODEL] Operation: '{operation_name}' is using Model: '{self.model}'")
-                print("-" * 50)
-
-                # DEBUG: Print exact input being sent to LLM
-                print(f"🚀 [LLM INPUT] {operation_name} (Attempt {attempt+1}):")
-                print("-" * 50)
-                # Handle both string prompts and part-based prompts (vision)
-                if isinstance(contents, str):
-                    print(contents)
-                elif isinstance(contents, list):
-                    for part in contents:
-                        if isinstance(part, str): print(part)
-                        else: print(f"[Binary Part: {type(part)}]")
-                print("-" * 50)
-
-                # Use thread pool for blocking SDK call
-                loop = asyncio.get_event_loop()
-                response = await loop.run_in_executor(
-                    None,
-                    lambda: client.models.generate_content(
-                        model=self.model,
-                        contents=contents,
-                        config=config
-                    )
-                )
+                logger.debug(f"🤖 {operation_name} -> {self.model} (attempt {attempt+1})")
+
+                # Hold a limiter slot only for the call itself, never across backoff sleeps
+                call_verdict = None
+                try:
+                    # Wait for RPM/TPM budget before taking a concurrency slot
+                    await quota.acquire(estimated_tokens)
+                    await gemini_limiter.acquire(priority)
+                    call_started = time.monotonic()
+                    call_error = None
+                    call_cancelled = False
+                    try:
+                        response = await backend.generate(self.model, contents, config)
+                        call_verdict = True
+                    except asyncio.CancelledError:
+                        # Abandoned (e.g. a losing hedged vote): neither fast success nor failure
+                        call_cancelled = True
+                        raise
+                    except Exception as call_err:
+                        call_error = call_err
+                        # Only backend-health failures count against the breaker; a bad request does not
+                        call_verdict = not self._classify_error(call_err)[1]
+                        llm_tracer.record(operation_name, traced, model=self.model, attempt=attempt + 1, contents=contents,
+                                          error=call_err, latency=time.monotonic() - call_started, cached_content=cached_content)
+                        raise
+                    finally:
+                        call_latency = time.monotonic() - call_started
+                        if call_cancelled:
+                            gemini_limiter.abandon()
+                        else:
+                            gemini_limiter.release(call_latency, call_error)
+                finally:
+                    # A cancelled call leaves call_verdict as None: no outcome is recorded,
+                    # only a half-open probe slot is handed back
+                    breaker.record(call_verdict)
 
                 # Successful execution
+                usage = getattr(response, "usage_metadata", None)
+                quota.reconcile(estimated_tokens, getattr(usage, "total_token_count", None))
                 raw_text = response.text or ""
-                
-                # DEBUG: Print exact output received from LLM
-                print(f"\n✨ [LLM OUTPUT] {operation_name}:")
-                print("-" * 50)
-                print(raw_text)
-                print("-" * 50 + "\n")
+                llm_tracer.record(operation_name, traced, model=self.model, attempt=attempt + 1, contents=contents,
+                                  response_text=raw_text, latency=call_latency, usage=usage, cached_content=cached_content)
 
                 if response_schema:
                     try:
@@ -175,6 +299,9 @@ class GeminiService:
                         return {"success": True, "response": data}
                     except Exception as parse_err:
                         logger.error(f"Structured parse failed for {operation_name}: {parse_err}")
+                        if not traced:
+                            llm_tracer.record(operation_name, traced, model=self.model, attempt=attempt + 1, contents=contents,
+                                              response_text=raw_text, error=parse_err, latency=call_latency, cached_content=cached_content)
                         return {
                             "success": False,
                             "error": {
@@ -189,20 +316,7 @@ class GeminiService:
 
             except Exception as e:
                 last_error_msg = str(e)
-                last_status_code = getattr(e, 'status_code', None)
-                
-                # Detect status codes from message if not provided
-                if last_status_code is None:
-                    for code in [429, 500, 502, 503, 504]:
-                        if str(code) in last_error_msg:
-                            last_status_code = code
-                            break
-                
-                retryable_codes = {429, 500, 502, 503, 504}
-                retry_strings = ["overloaded", "timeout", "deadline", "connection", "rate limit", "busy"]
-                
-                is_retryable = (last_status_code in retryable_codes) or \
-                               any(s in last_error_msg.lower() for s in retry_strings)
+                last_status_code, is_retryable = self._classify_error(e)
                 
                 if is_retryable and attempt < self.max_retries:
                     delay = 2 ** attempt
@@ -276,7 +390,7 @@ Analyze and extract Question–Answer pairs from the provided text.
             response_schema=ExtractedQAList.model_json_schema(),
         )
         
-        res = await self._call_gemini_core(prompt, config, ExtractedQAList, "QA Extraction")
+        res = await self._call_gemini_core(prompt, config, ExtractedQAList, "QA Extraction", priority=LLMPriority.HIGH)
         
         if res["success"]:
             # Flatten to compatibility format
@@ -286,37 +400,27 @@ Analyze and extract Question–Answer pairs from the provided text.
         
         return res
 
-    async def evaluate_one_qa(self, description: str, question: str, student_answer: str, question_index: int = 1, teacher_preferences: str = "") -> Dict:
-        """
-        Standardized per-question evaluation using strict atomic call with structured output.
-        DETERMINISTIC: Uses content hashing, caching, and consensus voting.
-        Includes optional Teacher Preferences for "In-the-loop" learning.
-        """
-        # Create deterministic content hash for caching
+    @staticmethod
+    def _qa_cache_key(description: str, question: str, student_answer: str, question_index: int, teacher_preferences: str) -> str:
+        """Deterministic cache key for a single graded question (shared by single and batched grading)"""
         combined_input = f"{description}|||{question}|||{student_answer}|||{question_index}|||{teacher_preferences}"
-        content_hash = DeterministicEvalConfig.get_content_hash(combined_input)
-        
-        # Check cache first
-        cached_result = EvaluationCache.get(content_hash, eval_type="qa_evaluation")
-        if cached_result is not None:
-            return cached_result
-        
-        # Normalize student answer
-        student_answer_norm = student_answer.replace("\r\n", "\n").replace("\r", "\n")
+        return DeterministicEvalConfig.get_content_hash(combined_input)
 
-        # Inject Teacher Preferences if provided
-        preference_block = ""
-        if teacher_preferences.strip():
-            preference_block = f"""
+    @staticmethod
+    def _preference_block(teacher_preferences: str) -> str:
+        if not teacher_preferences.strip():
+            return ""
+        return f"""
 ### TEACHER PREFERENCES & LEARNING CONTEXT (CRITICAL):
 The teacher has previously provided feedback or corrected scores in this batch.
 FOLLOW THESE RULES FOR CONSISTENCY:
 {teacher_preferences}
 """
 
-        # Standardized, deterministic prompt with exact scoring rules
-        prompt = f"""### ROLE: You are a strict and consistent academic grader.
-{preference_block}
+    def _qa_prompt_prefix(self, description: str, teacher_preferences: str) -> str:
+        """Stable part of every grading prompt: role, teacher preferences, rubric/reference and rules"""
+        return f"""### ROLE: You are a strict and consistent academic grader.
+{self._preference_block(teacher_preferences)}
 Evaluate the student's answer based ONLY on the provided rubric and question.
 
 ### ASSIGNMENT DESCRIPTION/RUBRIC:
@@ -324,6 +428,15 @@ Evaluate the student's answer based ONLY on the provided rubric and question.
 {description}
 <<<RUBRIC_END>>>
 
+{QA_GRADING_RULES}
+"""
+
+    @staticmethod
+    def _qa_question_block(question_index: int, question: str, student_answer: str) -> str:
+        """Variable part of a grading prompt: one question and the student's answer"""
+        # Normalize student answer
+        student_answer_norm = student_answer.replace("\r\n", "\n").replace("\r", "\n")
+        return f"""
 ### QUESTION NUMBER: {question_index}
 ### QUESTION:
 <<<QUESTION_START>>>
@@ -334,64 +447,148 @@ Evaluate the student's answer based ONLY on the provided rubric and question.
 <<<STUDENT_ANSWER_START>>>
 {student_answer_norm}
 <<<STUDENT_ANSWER_END>>>
+"""
 
-### GRADING PROCESS (STRICT FLOW):
-1. **AUTHENTICITY & REQUIREMENT CHECK (FIRST PRIORITY)**:
-   - **RULE**: Check if the requirement for `<<<QUESTION_START>>>` exists in **EITHER** the Assignment Description **OR** the Reference Materials provided in `<<<RUBRIC_START>>>`.
-   - **EMPTY DESCRIPTION EDGE CASE**: If the Assignment Description is EMPTY or contains no specific tasks, the **Reference Material** is the **ABSOLUTE BOUNDARY**. 
-     - If the student's work in `<<<STUDENT_ANSWER_START>>>` is about a topic/problem NOT found in the Reference Material, you **MUST** award **0.0**.
-     - **FEEDBACK**: "no question provided".
-   - **ZERO SCORE CONDITION**: Only if the question is missing from **BOTH** the Description and all Reference Materials:
-     - **ACTION**: SCORE 0.0 IMMEDIATELY.
-     - **FEEDBACK**: "no question provided".
+    async def _call_with_prefix(self, prefix: str, suffix: str, config: types.GenerateContentConfig, response_schema: Optional[Any], operation_name: str, priority: int = LLMPriority.NORMAL) -> Dict:
+        """
+        Call Gemini with a prompt split into a stable prefix and a variable suffix.
+        The prefix is sent as a cached-content handle when context caching applies,
+        otherwise (or if the provider rejects the handle) the full prompt is sent inline.
+        """
+        handle = await prompt_cache.get_handle(self._get_backend(), self.model, prefix)
+        if handle:
+            cached_config = config.model_copy(update={"cached_content": handle})
+            res = await self._call_gemini_core(suffix, cached_config, response_schema, operation_name, priority)
+            if res["success"] or "cache" not in str(res["error"].get("raw", "")).lower():
+                return res
+            logger.warning(f"Context cache {handle} rejected for {operation_name}; retrying with inline prompt")
+            prompt_cache.invalidate_name(handle)
+        return await self._call_gemini_core(prefix + suffix, config, response_schema, operation_name, priority)
+
+    def context_cache_batch(self):
+        """Async context manager scoping context-cache handles to one evaluation batch"""
+        return prompt_cache.batch(self._get_backend())
+
+    @staticmethod
+    def _quantize_score(resp: EvalDetail) -> float:
+        """Normalize a graded response to the 0.0 / 0.5 / 1.0 voting buckets"""
+        if resp.is_correct:
+            return 1.0
+        if resp.partial_credit is not None:
+            pc = float(resp.partial_credit)
+            if pc >= 0.75:
+                return 1.0
+            if pc >= 0.25:
+                return 0.5
+        return 0.0
+
+    @staticmethod
+    def _select_consensus(valid_responses: List[EvalDetail]) -> EvalDetail:
+        """Majority vote over quantized scores with a deterministic (most lenient) tie-breaker"""
+        from collections import Counter
+        votes = [GeminiService._quantize_score(resp) for resp in valid_responses]
+        sorted_votes = Counter(votes).most_common()
+
+        if len(sorted_votes) > 1 and sorted_votes[0][1] == sorted_votes[1][1]:
+            # Tie scenario: select highest score (most lenient)
+            winner_score = max(sorted_votes[0][0], sorted_votes[1][0])
+            logger.warning(f"⚠️ Consensus TIE detected. Votes: {votes}. Tiebreaker: selecting {winner_score}")
+        else:
+            winner_score = sorted_votes[0][0]
 
-2. **CHECK FOR REFERENCE MATERIAL & DESCRIPTION (HYBRID EVALUATION)**:
-   - Identify if "OFFICIAL REFERENCE MATERIAL" or "ANSWER KEY" is present.
-    - **SCORING HIERARCHY**:
-      - **MATCH**: If the Student Answer matches any provided Reference Material -> **AWARD 1.0**.
-      - **DESC-DRIVEN**: If the question/topic is NOT in the Reference Material but IS in the Description -> **EVALUATE BASED ON DESCRIPTION**.
-      - **TOPIC CONSISTENCY & SCOPE LOCK (CRITICAL)**: If a Reference Material is provided, it defines the **ONLY** valid scope for the assignment. 
-         - **RULE**: If the Student submission is about a completely different topic than the Reference Material (e.g., Reference is about "Physics" but Student answers "History"), you **MUST award 0.0**.
-         - **EXCEPTION**: If the **Assignment Description** explicitly matches the Student's topic, you may ignore the unrelated Reference Material and award credit.
-         - **RATIONALE**: We must ensure students are answering the *specific* assignment provided by the teacher.
+        # First response matching the winning bucket
+        for idx, resp in enumerate(valid_responses):
+            if votes[idx] == winner_score:
+                logger.info(f"✓ Consensus Result: {votes} -> Winner: {winner_score} (Call #{idx+1})")
+                return resp
 
-    - **IF REFERENCE MATERIAL IS PRESENT (COLLECTIVE REFERENCE SET)**:
-      - **QUESTION EXISTENCE RULE (NON-NEGOTIABLE)**: Check if the specific `<<<QUESTION_START>>>` or its overall topic exists in the Reference Set OR the Description.
-        - **IF MISSING FROM BOTH (TOPIC MISMATCH)**: 
-          - **SCORE**: 0.0
-          - **FEEDBACK**: "Topic Mismatch: Evaluation failed because the submission does not relate to the provided reference material or assignment description."
-      - **RELEVANCE CHECK**: First determine if any part of the Reference Set is relevant to the topic of `<<<QUESTION_START>>>`.
-      - **POSITIVE MATCH RULE**: If the student's answer/logic matches ANY relevant provided reference materials -> **AWARD CREDIT**.
-      - **DEVIATION RULE**: If a RELEVANT part of the Reference Set exists and the student's logic contradicts it -> **SCORE 0.0**.
-      - **IDENTITY RULE**: Verbatim or substantive matches to ANY relevant part of the Reference Set -> **AWARD 1.0 IMMEDIATELY**.
-      - **FLEXIBILITY (Format Only)**: Different fonts, variable names, or languages are allowed ONLY if the logic matches a version in the Reference Set.
-      
-    - **IF NO RELEVANT REFERENCE IS PRESENT**: 
-      - Evaluate based on the Assignment Description and standard academic correctness.
+        return valid_responses[0]
 
-3.  **Analyze Requirements**: Check for specific constraints (e.g., time complexity, specific libraries).
-    - If student follows description but varies from reference format (e.g. different variable names), award credit.
+    async def _run_consensus(self, make_call: Callable[[], Awaitable[Dict]], bucket_of: Callable[[Any], Any]) -> List[Dict]:
+        """
+        Collect consensus votes for one evaluation.
+        - "parallel": fire all CONSENSUS_CALLS at once (legacy behaviour).
+        - "hedged": fire just enough calls for a majority and only issue more when the
+          completed votes disagree (or a call fails), or when no call has finished within
+          CONSENSUS_HEDGE_DELAY_SECONDS. Remaining calls are cancelled once a majority agrees.
+        Returns completed call results in issue order.
+        """
+        total = DeterministicEvalConfig.CONSENSUS_CALLS
 
-4.  **Verify Correctness**:
-   - Check for: Exactness, Logic, Syntax (for code), and Completeness.
+        if DeterministicEvalConfig.CONSENSUS_STRATEGY != "hedged":
+            logger.info(f"🔄 Running consensus evaluation ({total} parallel calls)")
+            results = await asyncio.gather(*[make_call() for _ in range(total)])
+            _record_consensus(total, total, hedged=False)
+            return list(results)
 
-5.  **Determine Score (0.0 to 1.0)**:
-   - **1.0 (Correct)**: Matches logic/truth of Reference and meets Description requirements.
-   - **0.5 (Partial)**: Correct logic but missing a minor constraint from Description.
-   - **0.0 (Incorrect)**: Wrong logic (based on Reference) or fails a critical Description mandate.
-   - *Note*: Map to nearest bucket (0.0, 0.25, 0.5, 0.75, 1.0).
+        majority = total // 2 + 1
+        hedge_delay = DeterministicEvalConfig.CONSENSUS_HEDGE_DELAY_SECONDS
+        tasks = [asyncio.ensure_future(make_call()) for _ in range(majority)]
+        hedges = 0
 
-### DETERMINISTIC RULES (NON-NEGOTIABLE):
-- **Language Independence**: Unless the Description explicitly mandates ONE language, treat the Reference as a logic guide, not a syntax constraint.
-- **Mathematics**: Evaluate based on **MATHEMATICAL CORRECTNESS**.
-- **No Hallucination**: NEVER infer missing content.
-- **Context is King**: If the student answers Question X correctly according to the Description, give credit even if the Reference is formatted differently.
+        try:
+            while True:
+                votes = {}
+                for t in tasks:
+                    if t.done() and not t.cancelled():
+                        res = t.result()
+                        if res.get("success"):
+                            bucket = bucket_of(res["response"])
+                            if bucket is not None:
+                                votes[bucket] = votes.get(bucket, 0) + 1
+                if votes and max(votes.values()) >= majority:
+                    break
+
+                pending = [t for t in tasks if not t.done()]
+                if not pending:
+                    if len(tasks) >= total:
+                        break
+                    # Disagreement or failed call: issue the next vote
+                    tasks.append(asyncio.ensure_future(make_call()))
+                    continue
 
-### FEEDBACK REQUIREMENTS:
-- Start with "Score: X/Y".
-- State: "Graded against Reference Key and Assignment Description."
-- Provide the logic used for the score.
-- Explain precisely why points were awarded or deducted."""
+                timeout = hedge_delay if (hedge_delay > 0 and len(tasks) < total) else None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done and len(tasks) < total:
+                    # Slow votes: hedge with an extra call instead of waiting
+                    tasks.append(asyncio.ensure_future(make_call()))
+                    hedges += 1
+        finally:
+            for t in tasks:
+                if not t.done():
+                    t.cancel()
+
+        _record_consensus(total, len(tasks), hedged=hedges > 0)
+        return [t.result() for t in tasks if t.done() and not t.cancelled()]
+
+    async def evaluate_one_qa(self, description: str, question: str, student_answer: str, question_index: int = 1, teacher_preferences: str = "") -> Dict:
+        """
+        Standardized per-question evaluation using strict atomic call with structured output.
+        DETERMINISTIC: Uses content hashing, caching, and consensus voting.
+        Includes optional Teacher Preferences for "In-the-loop" learning.
+        """
+        # Create deterministic content hash for caching
+        content_hash = self._qa_cache_key(description, question, student_answer, question_index, teacher_preferences)
+        
+        # Check cache first
+        cached_result = EvaluationCache.get(content_hash, eval_type="qa_evaluation")
+        if cached_result is not None:
+            return cached_result
+
+        # Coalesce with an identical evaluation already in flight
+        return await _qa_eval_flight.do(
+            content_hash,
+            lambda: self._evaluate_one_qa_uncached(content_hash, description, question, student_answer, question_index, teacher_preferences)
+        )
+
+    async def _evaluate_one_qa_uncached(self, content_hash: str, description: str, question: str, student_answer: str, question_index: int, teacher_preferences: str) -> Dict:
+        """LLM grading for one question (cache miss path of evaluate_one_qa)."""
+        # Stable prefix (role + preferences + rubric/reference + rules) is shared by every
+        # question of the batch and can be served from a provider-side context cache.
+        prefix = self._qa_prompt_prefix(description, teacher_preferences)
+        suffix = self._qa_question_block(question_index, question, student_answer) + """
+### TASK:
+Grade the student answer above following the GRADING PROCESS and FEEDBACK REQUIREMENTS."""
         
         config = types.GenerateContentConfig(
             temperature=DeterministicEvalConfig.TEMPERATURE,
@@ -404,14 +601,12 @@ Evaluate the student's answer based ONLY on the provided rubric and question.
         self.model = DeterministicEvalConfig.FIXED_MODEL
         
         try:
-            # Consensus mechanism: 3 parallel calls with deterministic tiebreaker
+            # Consensus mechanism: majority voting with deterministic tiebreaker
             if DeterministicEvalConfig.USE_CONSENSUS and DeterministicEvalConfig.CONSENSUS_CALLS >= 2:
-                async def _single_eval_call():
-                    return await self._call_gemini_core(prompt, config, EvalDetail, "Question Evaluation")
-
-                # Fire parallel calls
-                logger.info(f"🔄 Running consensus evaluation ({DeterministicEvalConfig.CONSENSUS_CALLS} parallel calls)")
-                results = await asyncio.gather(*[_single_eval_call() for _ in range(DeterministicEvalConfig.CONSENSUS_CALLS)])
+                results = await self._run_consensus(
+                    lambda: self._call_with_prefix(prefix, suffix, config, EvalDetail, "Question Evaluation"),
+                    lambda resp: self._quantize_score(resp)
+                )
 
                 # Filter successful responses
                 valid_responses = [r["response"] for r in results if r["success"] and "response" in r]
@@ -420,65 +615,17 @@ Evaluate the student's answer based ONLY on the provided rubric and question.
                     # All failed
                     return results[0]
 
-                # Deterministic voting with tie-breaker
-                votes = []
-                for resp in valid_responses:
-                    # Normalize to 0.0, 0.5, or 1.0
-                    if resp.is_correct:
-                        score = 1.0
-                    elif resp.partial_credit is not None:
-                        pc = float(resp.partial_credit)
-                        # Quantize to nearest bucket
-                        if pc >= 0.75:
-                            score = 1.0
-                        elif pc >= 0.25:
-                            score = 0.5
-                        else:
-                            score = 0.0
-                    else:
-                        score = 0.0
-                    votes.append(score)
-
-                from collections import Counter
-                vote_counts = Counter(votes)
-                
-                # Majority voting with deterministic tie-breaker
-                sorted_votes = vote_counts.most_common()
-                
-                if len(sorted_votes) > 1 and sorted_votes[0][1] == sorted_votes[1][1]:
-                    # Tie scenario: select highest score (most lenient)
-                    winner_score = max(sorted_votes[0][0], sorted_votes[1][0])
-                    logger.warning(f"⚠️ Consensus TIE detected. Votes: {votes}. Tiebreaker: selecting {winner_score}")
-                else:
-                    winner_score = sorted_votes[0][0]
-
-                # Find first response matching winner score
-                for idx, resp in enumerate(valid_responses):
-                    s = 1.0 if resp.is_correct else (float(resp.partial_credit) if resp.partial_credit is not None else 0.0)
-                    # Quantize check
-                    if s >= 0.75 and winner_score == 1.0:
-                        resp_consensus = {"success": True, "response": resp.model_dump()}
-                        EvaluationCache.set(content_hash, resp_consensus, eval_type="qa_evaluation")
-                        logger.info(f"✓ Consensus Result: {votes} -> Winner: {winner_score} (Call #{idx+1})")
-                        return resp_consensus
-                    elif 0.25 <= s < 0.75 and winner_score == 0.5:
-                        resp_consensus = {"success": True, "response": resp.model_dump()}
-                        EvaluationCache.set(content_hash, resp_consensus, eval_type="qa_evaluation")
-                        logger.info(f"✓ Consensus Result: {votes} -> Winner: {winner_score} (Call #{idx+1})")
-                        return resp_consensus
-                    elif s < 0.25 and winner_score == 0.0:
-                        resp_consensus = {"success": True, "response": resp.model_dump()}
-                        EvaluationCache.set(content_hash, resp_consensus, eval_type="qa_evaluation")
-                        logger.info(f"✓ Consensus Result: {votes} -> Winner: {winner_score} (Call #{idx+1})")
-                        return resp_consensus
-                
-                # Fallback: return first response
-                resp_consensus = {"success": True, "response": valid_responses[0].model_dump()}
+                winner = self._select_consensus(valid_responses)
+                resp_consensus = {
+                    "success": True,
+                    "response": winner.model_dump(),
+                    "consensus": {"votes": [self._quantize_score(r) for r in valid_responses], "calls": len(results)}
+                }
                 EvaluationCache.set(content_hash, resp_consensus, eval_type="qa_evaluation")
                 return resp_consensus
             else:
                 # Single call (if consensus disabled)
-                result = await self._call_gemini_core(prompt, config, EvalDetail, "Question Evaluation")
+                result = await self._call_with_prefix(prefix, suffix, config, EvalDetail, "Question Evaluation")
                 if result["success"]:
                     result["response"] = result["response"].model_dump()
                     EvaluationCache.set(content_hash, result, eval_type="qa_evaluation")
@@ -487,6 +634,126 @@ Evaluate the student's answer based ONLY on the provided rubric and question.
         finally:
             self.model = original_model
 
+    @staticmethod
+    def _estimate_tokens(text: str) -> int:
+        """Rough token estimate (~4 characters per token) used for batch sizing"""
+        return len(text or "") // 4 + 1
+
+    def _chunk_for_budget(self, description: str, teacher_preferences: str, pending: List[Dict]) -> List[List[Dict]]:
+        """Greedily pack pending questions into chunks that fit the input/output token budgets"""
+        base_tokens = self._estimate_tokens(description) + self._estimate_tokens(teacher_preferences) + self._estimate_tokens(QA_GRADING_RULES) + 200
+        chunks, current, in_tokens, out_tokens = [], [], base_tokens, 0
+        for item in pending:
+            item_in = self._estimate_tokens(item["question"]) + self._estimate_tokens(item["student_answer"]) + 50
+            # The model echoes question and answer back in every EvalDetail, plus feedback
+            item_out = item_in + 400
+            if current and (in_tokens + item_in > DeterministicEvalConfig.BATCH_INPUT_TOKEN_BUDGET
+                            or out_tokens + item_out > DeterministicEvalConfig.BATCH_OUTPUT_TOKEN_BUDGET
+                            or len(current) >= DeterministicEvalConfig.BATCH_MAX_QUESTIONS):
+                chunks.append(current)
+                current, in_tokens, out_tokens = [], base_tokens, 0
+            current.append(item)
+            in_tokens += item_in
+            out_tokens += item_out
+        if current:
+            chunks.append(current)
+        return chunks
+
+    async def evaluate_qa_batch(self, description: str, qa_items: List[Dict], teacher_preferences: str = "") -> List[Dict]:
+        """
+        Batched grading: evaluates all QA pairs of one submission with one structured call per chunk.
+        The rubric/reference is sent once per chunk instead of once per question.
+        qa_items: [{"question": str, "student_answer": str, "question_index": int}, ...]
+        Returns results aligned with qa_items, each shaped exactly like evaluate_one_qa's result.
+        Per-question cache entries are shared with evaluate_one_qa, so graded questions are skipped.
+        """
+        results: List[Optional[Dict]] = [None] * len(qa_items)
+        keyed = []
+        for pos, item in enumerate(qa_items):
+            question = item.get("question", "") or ""
+            answer = item.get("student_answer", "") or ""
+            q_index = item.get("question_index", pos + 1)
+            content_hash = self._qa_cache_key(description, question, answer, q_index, teacher_preferences)
+            keyed.append({"pos": pos, "hash": content_hash, "question": question, "student_answer": answer, "question_index": q_index})
+
+        # One cache round trip for the whole submission
+        cached = EvaluationCache.get_many([item["hash"] for item in keyed], eval_type="qa_evaluation")
+        pending = []
+        for item in keyed:
+            if item["hash"] in cached:
+                results[item["pos"]] = cached[item["hash"]]
+            else:
+                pending.append(item)
+
+        if pending:
+            chunks = self._chunk_for_budget(description, teacher_preferences, pending)
+            logger.info(f"📦 Batched evaluation: {len(pending)} uncached question(s) in {len(chunks)} request chunk(s)")
+            chunk_results = await asyncio.gather(*[self._evaluate_qa_chunk(description, chunk, teacher_preferences) for chunk in chunks])
+            for chunk, chunk_result in zip(chunks, chunk_results):
+                for item, res in zip(chunk, chunk_result):
+                    results[item["pos"]] = res
+
+        return results
+
+    async def _evaluate_qa_chunk(self, description: str, chunk: List[Dict], teacher_preferences: str) -> List[Dict]:
+        """Grade one chunk of questions in a single EvalDetailList call (with consensus voting)."""
+        if len(chunk) == 1:
+            item = chunk[0]
+            return [await self.evaluate_one_qa(description, item["question"], item["student_answer"], item["question_index"], teacher_preferences)]
+
+        prefix = self._qa_prompt_prefix(description, teacher_preferences)
+        questions_text = "\n".join(self._qa_question_block(item["question_index"], item["question"], item["student_answer"]) for item in chunk)
+        suffix = f"""### QUESTIONS TO GRADE ({len(chunk)} in total):
+{questions_text}
+### TASK:
+Grade EACH student answer above following the GRADING PROCESS and FEEDBACK REQUIREMENTS.
+- Apply the grading process to EACH question block independently; never let one answer influence another.
+- Return exactly {len(chunk)} evaluations, in the same order as the question blocks above."""
+
+        config = types.GenerateContentConfig(
+            temperature=DeterministicEvalConfig.TEMPERATURE,
+            response_mime_type="application/json",
+            response_schema=EvalDetailList.model_json_schema(),
+        )
+
+        def _batch_call():
+            return self._call_with_prefix(prefix, suffix, config, EvalDetailList, "Batched Question Evaluation")
+
+        if DeterministicEvalConfig.USE_CONSENSUS and DeterministicEvalConfig.CONSENSUS_CALLS >= 2:
+            # A batch "agrees" only when every question lands in the same bucket
+            results = await self._run_consensus(
+                _batch_call,
+                lambda resp: tuple(self._quantize_score(e) for e in resp.evaluations) if len(resp.evaluations) == len(chunk) else None
+            )
+        else:
+            results = [await _batch_call()]
+
+        # Only responses that graded every question can be aligned back to the chunk
+        valid_lists = [r["response"].evaluations for r in results if r["success"] and len(r["response"].evaluations) == len(chunk)]
+
+        if not valid_lists:
+            if all(not r["success"] and r["error"]["type"] == "LLM_UNAVAILABLE" for r in results):
+                # One result per question (nested error dict included) so callers can annotate each independently
+                return [{**results[0], "error": dict(results[0]["error"])} for _ in chunk]
+            # Misaligned or unparsable batch output: grade this chunk per question instead
+            logger.warning(f"Batched evaluation returned unusable output for {len(chunk)} question(s). Falling back to per-question calls.")
+            return list(await asyncio.gather(*[
+                self.evaluate_one_qa(description, item["question"], item["student_answer"], item["question_index"], teacher_preferences)
+                for item in chunk
+            ]))
+
+        chunk_results = []
+        for pos, item in enumerate(chunk):
+            winner = self._select_consensus([evaluations[pos] for evaluations in valid_lists])
+            res = {
+                "success": True,
+                "response": winner.model_dump(),
+                "consensus": {"votes": [self._quantize_score(evaluations[pos]) for evaluations in valid_lists], "calls": len(results)}
+            }
+            chunk_results.append(res)
+        EvaluationCache.set_many([(item["hash"], res) for item, res in zip(chunk, chunk_results)], eval_type="qa_evaluation")
+        return chunk_results
+
     async def evaluate_ppt_structured(self, title: str, description: str, total_slides: int, slides_text: str) -> Dict:
         """Evaluate PPT Content - DETERMINISTIC"""
         # Content hash for caching
@@ -717,7 +984,15 @@ Evaluate the PowerPoint design based on visual quality and professional standard
                 # logger.info(f"✓ OCR Cache HIT for image {image_hash[:8]}...")
                 return str(cached_text)
 
-            parts = [
+            # Coalesce with an identical page already being OCR'd
+            return await _ocr_flight.do(image_hash, lambda: self._ocr_uncached(image_hash, image_data, mime_type))
+        except Exception as e:
+            logger.error(f"Gemini OCR failed: {e}")
+            return None
+
+    async def _ocr_uncached(self, image_hash: str, image_data: bytes, mime_type: str) -> Optional[str]:
+        """Gemini Vision OCR call (cache miss path of ocr_with_gemini)."""
+        parts = [
     "Extract ALL text from this image with extreme precision and honesty.\n"
     "THIS OUTPUT WILL BE USED FOR AUTOMATED EVALUATION — ACCURACY IS CRITICAL.\n\n"
 
@@ -761,21 +1036,18 @@ Evaluate the PowerPoint design based on visual quality and professional standard
     types.Part.from_bytes(data=image_data, mime_type=mime_type)
 ]
 
-            config = types.GenerateContentConfig(
-                temperature=0.0,
-                max_output_tokens=8192,
-            )
-            
-            res = await self._call_gemini_core(parts, config, None, "Gemini OCR")
-            if res.get("success"):
-                extracted_text = res.get("response")
-                # Store in cache
-                EvaluationCache.set(image_hash, extracted_text, eval_type="ocr")
-                return extracted_text
-            return None
-        except Exception as e:
-            logger.error(f"Gemini OCR failed: {e}")
-            return None
+        config = types.GenerateContentConfig(
+            temperature=0.0,
+            max_output_tokens=8192,
+        )
+        
+        res = await self._call_gemini_core(parts, config, None, "Gemini OCR", priority=LLMPriority.HIGH)
+        if res.get("success"):
+            extracted_text = res.get("response")
+            # Store in cache
+            EvaluationCache.set(image_hash, extracted_text, eval_type="ocr")
+            return extracted_text
+        return None
 
     async def extract_qa_pairs(self, cleaned_text: str) -> List[Dict]:
         """Extracts QA pairs from text, with a fallback to whole-document evaluation."""
@@ -793,10 +1065,19 @@ Evaluate the PowerPoint design based on visual quality and professional standard
             "max_marks": None
         }]
 
+    @staticmethod
+    def get_coalescing_stats() -> Dict:
+        """Single-flight counters: requests served by joining an identical in-flight computation"""
+        return {"qa_evaluation": _qa_eval_flight.get_stats(), "ocr": _ocr_flight.get_stats()}
+
+    @staticmethod
+    def get_consensus_stats() -> Dict:
+        """Process-wide consensus vote counters"""
+        return dict(_consensus_stats)
+
     def check_connection(self) -> bool:
         """Compatibility check for LLM service status"""
-        client = self._get_client()
-        return client is not None
+        return self._get_backend() is not None
 
     def list_models(self) -> List[str]:
         """Compatibility list models (returns current configured model)"""
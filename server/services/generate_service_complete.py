@@ -8,7 +8,7 @@ import os
 import uuid
 import difflib
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import Awaitable, Callable, List, Dict, Optional
 import logging
 import asyncio
 from sqlalchemy.orm import Session
@@ -21,6 +21,8 @@ from services.ppt_processor import PPTProcessor
 from services.ppt_evaluator import PPTEvaluator
 from services.ppt_design_evaluator import PPTDesignEvaluator
 from services.re_evaluator import ReEvaluator
+from services.determinism_config import DeterministicEvalConfig
+from services.pipeline import Stage, run_pipeline
 from models import Assignment, AssignmentFile, EvaluationResult, EvaluationDetail, AssignmentStatus, EvaluationType
 
 logger = logging.getLogger(__name__)
@@ -29,6 +31,13 @@ logger = logging.getLogger(__name__)
 UPLOAD_DIR = Path("uploads")
 UPLOAD_DIR.mkdir(exist_ok=True)
 
+PPT_EXTENSIONS = {'.ppt', '.pptx', '.pptm'}
+
+# Staged evaluation pipeline: queue depth between stages and workers per stage
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "8"))
+PIPELINE_QA_CONCURRENCY = int(os.getenv("PIPELINE_QA_CONCURRENCY", "4"))
+PIPELINE_GRADE_CONCURRENCY = int(os.getenv("PIPELINE_GRADE_CONCURRENCY", "8"))
+
 
 class GenerateServiceComplete:
     """Complete service with ALL original evaluation logic"""
@@ -137,10 +146,7 @@ class GenerateServiceComplete:
         """Complete generate content method"""
         # Description is now optional; if empty, evaluation uses general defaults.
         
-        github_url = request.github_url or None
-        if not github_url and "github.com" in (request.description or "").lower():
-            github_match = re.search(r'https?://github\.com/[\w\-\.]+/[\w\-\.]+', request.description)
-            if github_match: github_url = github_match.group(0)
+        github_url = self._resolve_github_url(request)
         
         if not request.file_ids and not github_url:
             from fastapi import HTTPException
@@ -148,105 +154,28 @@ class GenerateServiceComplete:
         
         try:
             # 1. Process Reference Files (if any)
-            reference_context = ""
-            if request.reference_file_ids:
-                logger.info(f"📄 STARTING ANALYSIS: Processing {len(request.reference_file_ids)} reference documents...")
-                print(f"📄 STARTING ANALYSIS: Processing {len(request.reference_file_ids)} reference documents...")
-                ref_contents = []
-                for ref_id in request.reference_file_ids:
-                    ref_path = None
-                    for saved_file in UPLOAD_DIR.glob(f"{ref_id}.*"):
-                        if saved_file.name == f"{ref_id}.meta.json": continue
-                        ref_path = saved_file
-                        break
-                    
-                    if ref_path:
-                        try:
-                            # Read reference file
-                            ref_data = self.file_processor.read_file(str(ref_path))
-                            content = ref_data.get('content', '')
-                            # Strip large binary dumps if any
-                            if len(content) > 100000: content = content[:100000] + "... [TRUNCATED]"
-                            ref_contents.append(f"--- REFERENCE DOC: {ref_data.get('filename')} ---\n{content}\n")
-                            logger.info(f"✅ Reference Material Processed: {ref_data.get('filename')}")
-                            print(f"✅ Reference Material Processed: {ref_data.get('filename')}")
-                        except Exception as e:
-                            logger.error(f"Failed to read reference file {ref_id}: {e}")
-                
-                if ref_contents:
-                    reference_context = "\n\n" + "="*50 + "\nOFFICIAL REFERENCE MATERIAL / ANSWER KEY / RUBRIC\n" + "="*50 + "\n"
-                    reference_context += "\n".join(ref_contents)
-                    reference_context += "\n" + "="*50 + "\nEND OF REFERENCE MATERIAL\n" + "="*50 + "\n\n"
-                    
-                    # Append to description so it becomes part of the "Rubric" prompt
-                    logger.info("Appending reference material to evaluation description.")
-                    print("Appending reference material to evaluation description.")
-                    request.description = (request.description or "") + reference_context
-                
-                else:
-                    logger.info("⚠️ No valid content extracted from reference files. Proceeding with standard evaluation.")
-                    print("⚠️ No valid content extracted from reference files. Proceeding with standard evaluation.")
+            await self._apply_reference_material(request)
 
-            file_contents = []
-            file_paths_to_cleanup = []
-            file_basenames = []
-            file_ids_by_index = []
+            file_contents, file_basenames = await self._github_files(github_url)
+            student_files = self._resolve_student_files(request.file_ids)
             
-            if github_url:
-                github_files = await self.github_service.fetch_repository_files(github_url, max_files=100)
-                for gh_file in github_files:
-                    path_obj = Path(gh_file['path'])
-                    file_contents.append({
-                        'filename': gh_file['name'],
-                        'content': gh_file['content'],
-                        'file_type': 'github',
-                        'extension': path_obj.suffix.lower(),
-                        'path': gh_file['path']
-                    })
-                    file_basenames.append(path_obj.stem)
+            file_ids_by_index = [file_id for file_id, _, _ in student_files]
+            file_paths_to_cleanup = [file_path for _, file_path, _ in student_files]
             
-            for file_id in request.file_ids:
-                file_path = None
-                original_filename = None
-                for saved_file in UPLOAD_DIR.glob(f"{file_id}.*"):
-                    if saved_file.name == f"{file_id}.meta.json": continue
-                    file_path = saved_file
-                    break
-                
-                if not file_path: continue
-                
-                try:
-                    meta_path = UPLOAD_DIR / f"{file_id}.meta.json"
-                    if meta_path.exists():
-                        with open(meta_path, "r", encoding="utf-8") as m:
-                            md = json.load(m)
-                            original_filename = md.get("original_filename")
-                except Exception: pass
-
-                logger.info(f"📄 STARTING ANALYSIS: Processing Student File (ID: {file_id})...")
-                print(f"📄 STARTING ANALYSIS: Processing Student File (ID: {file_id})...")
-
-                file_data = self.file_processor.read_file(str(file_path))
-                if original_filename: file_data['filename'] = original_filename
-                # determine display name (Student Name)
-                extracted_name = FileProcessor.extract_name_from_content(file_data.get('content', ''))
-                fallback_name = Path(original_filename or file_path.name).stem
-                
-                # Use extracted name if found, otherwise use filename
-                final_display_name = extracted_name if extracted_name else fallback_name
-                
-                logger.info(f"🔍 EXTRACTING CONTENT for {final_display_name}...")
-                print(f"🔍 EXTRACTING CONTENT for {final_display_name}...")
-                
-                # IMPORTANT: Save back to file_data so it travels with the obj
-                file_data['display_name'] = final_display_name
-                
-                file_contents.append(file_data)
-                file_paths_to_cleanup.append(file_path)
-                file_ids_by_index.append(file_id)
-                file_basenames.append(final_display_name)
+            # PPT Logic (decided from the extensions so regular files can stream through the pipeline)
+            all_ppt_files = bool(student_files) and not file_contents and all(
+                file_path.suffix.lower() in PPT_EXTENSIONS for _, file_path, _ in student_files
+            )
+            if not all_ppt_files:
+                source = self._extracted_files(file_contents, file_basenames, student_files)
+                return await self._run_file_pipeline(request, source, file_ids_by_index, current_user, db)
+            
+            extracted = [None] * len(student_files)
+            async for index, item in self._extracted_files([], [], student_files):
+                extracted[index] = item
+            file_contents = [item['file_data'] for item in extracted]
+            file_basenames = [item['display_name'] for item in extracted]
             
-            # PPT Logic
             all_ppt_files = all(fd.get('file_type') == 'ppt' for fd in file_contents)
             if all_ppt_files and file_contents:
                 ppt_tasks = []
@@ -259,20 +188,9 @@ class GenerateServiceComplete:
                 final_result_parts = []
                 
                 for i, result in enumerate(ppt_results):
-                    if isinstance(result, Exception) or (isinstance(result, dict) and "error" in result and result.get("is_llm_fail")):
-                        err_info = result.get("error") if isinstance(result, dict) else str(result)
-                        final_scores.append({
-                            "name": file_contents[i].get('display_name', 'Unknown'),
-                            "file_id": file_ids_by_index[i],
-                            "score_percent": 0.0,
-                            "reasoning": "Evaluation could not be completed because the LLM service was temporarily unavailable. Please try again later.",
-                            "details": [],
-                            "error": err_info
-                        })
-                        final_result_parts.append(f"LLM Unavailable for {file_contents[i].get('filename')}")
-                    else:
-                        final_scores.append(result['score'])
-                        final_result_parts.append(result['formatted'])
+                    score, formatted = self._ppt_outcome(result, file_contents[i], file_ids_by_index[i])
+                    final_scores.append(score)
+                    final_result_parts.append(formatted)
                 
                 assignment_id = None
                 if db:
@@ -287,98 +205,200 @@ class GenerateServiceComplete:
             from fastapi import HTTPException
             raise HTTPException(status_code=500, detail=str(e))
     
+    @staticmethod
+    def _resolve_github_url(request) -> Optional[str]:
+        github_url = request.github_url or None
+        if not github_url and "github.com" in (request.description or "").lower():
+            github_match = re.search(r'https?://github\.com/[\w\-\.]+/[\w\-\.]+', request.description)
+            if github_match: github_url = github_match.group(0)
+        return github_url
+    
+    async def _apply_reference_material(self, request) -> None:
+        """Append the extracted reference documents (answer key / rubric) to request.description."""
+        if not request.reference_file_ids:
+            return
+        
+        logger.info(f"📄 STARTING ANALYSIS: Processing {len(request.reference_file_ids)} reference documents...")
+        print(f"📄 STARTING ANALYSIS: Processing {len(request.reference_file_ids)} reference documents...")
+        ref_contents = []
+        for ref_id in request.reference_file_ids:
+            ref_path = None
+            for saved_file in UPLOAD_DIR.glob(f"{ref_id}.*"):
+                if saved_file.name == f"{ref_id}.meta.json": continue
+                ref_path = saved_file
+                break
+            
+            if ref_path:
+                try:
+                    # Read reference file
+                    ref_data = await self.file_processor.read_file_async(str(ref_path))
+                    content = ref_data.get('content', '')
+                    # Strip large binary dumps if any
+                    if len(content) > 100000: content = content[:100000] + "... [TRUNCATED]"
+                    ref_contents.append(f"--- REFERENCE DOC: {ref_data.get('filename')} ---\n{content}\n")
+                    logger.info(f"✅ Reference Material Processed: {ref_data.get('filename')}")
+                    print(f"✅ Reference Material Processed: {ref_data.get('filename')}")
+                except Exception as e:
+                    logger.error(f"Failed to read reference file {ref_id}: {e}")
+        
+        if ref_contents:
+            reference_context = "\n\n" + "="*50 + "\nOFFICIAL REFERENCE MATERIAL / ANSWER KEY / RUBRIC\n" + "="*50 + "\n"
+            reference_context += "\n".join(ref_contents)
+            reference_context += "\n" + "="*50 + "\nEND OF REFERENCE MATERIAL\n" + "="*50 + "\n\n"
+            
+            # Append to description so it becomes part of the "Rubric" prompt
+            logger.info("Appending reference material to evaluation description.")
+            print("Appending reference material to evaluation description.")
+            request.description = (request.description or "") + reference_context
+        
+        else:
+            logger.info("⚠️ No valid content extracted from reference files. Proceeding with standard evaluation.")
+            print("⚠️ No valid content extracted from reference files. Proceeding with standard evaluation.")
+    
+    async def _github_files(self, github_url: Optional[str]) -> tuple[List[Dict], List[str]]:
+        file_contents = []
+        file_basenames = []
+        if github_url:
+            github_files = await self.github_service.fetch_repository_files(github_url, max_files=100)
+            for gh_file in github_files:
+                path_obj = Path(gh_file['path'])
+                file_contents.append({
+                    'filename': gh_file['name'],
+                    'content': gh_file['content'],
+                    'file_type': 'github',
+                    'extension': path_obj.suffix.lower(),
+                    'path': gh_file['path']
+                })
+                file_basenames.append(path_obj.stem)
+        return file_contents, file_basenames
+    
+    def _resolve_student_files(self, file_ids: List[str]) -> List[tuple]:
+        """(file_id, saved path, original filename) for every uploaded file that still exists."""
+        student_files = []
+        for file_id in file_ids:
+            file_path = None
+            original_filename = None
+            for saved_file in UPLOAD_DIR.glob(f"{file_id}.*"):
+                if saved_file.name == f"{file_id}.meta.json": continue
+                file_path = saved_file
+                break
+            
+            if not file_path: continue
+            
+            try:
+                meta_path = UPLOAD_DIR / f"{file_id}.meta.json"
+                if meta_path.exists():
+                    with open(meta_path, "r", encoding="utf-8") as m:
+                        md = json.load(m)
+                        original_filename = md.get("original_filename")
+            except Exception: pass
+
+            logger.info(f"📄 STARTING ANALYSIS: Processing Student File (ID: {file_id})...")
+            print(f"📄 STARTING ANALYSIS: Processing Student File (ID: {file_id})...")
+            student_files.append((file_id, file_path, original_filename))
+        return student_files
+    
+    @staticmethod
+    def _name_extracted_file(file_data: Dict, file_path: Path, original_filename: Optional[str]) -> str:
+        """Set the original filename and the student's display name on freshly extracted file data."""
+        if original_filename: file_data['filename'] = original_filename
+        # determine display name (Student Name)
+        extracted_name = FileProcessor.extract_name_from_content(file_data.get('content', ''))
+        fallback_name = Path(original_filename or file_path.name).stem
+        
+        # Use extracted name if found, otherwise use filename
+        final_display_name = extracted_name if extracted_name else fallback_name
+        
+        logger.info(f"🔍 EXTRACTING CONTENT for {final_display_name}...")
+        print(f"🔍 EXTRACTING CONTENT for {final_display_name}...")
+        
+        # IMPORTANT: Save back to file_data so it travels with the obj
+        file_data['display_name'] = final_display_name
+        return final_display_name
+    
+    async def _extracted_files(self, ready_files: List[Dict], ready_names: List[str], student_files: List[tuple]):
+        """
+        Pipeline source: already-extracted files (GitHub) first, then uploads in the order
+        their extraction finishes. Yields (index, item) with the index in submission order.
+        """
+        for idx, fd in enumerate(ready_files):
+            yield idx, {"file_data": fd, "display_name": ready_names[idx] if idx < len(ready_names) else 'Unknown', "file_id": None}
+        
+        offset = len(ready_files)
+        paths = [str(file_path) for _, file_path, _ in student_files]
+        async for index, file_data in self.file_processor.process_many(paths):
+            file_id, file_path, original_filename = student_files[index]
+            extraction = file_data.get('extraction') or {}
+            logger.info(f"✅ Extracted {file_path.name} via {extraction.get('extractor', file_data.get('file_type'))} in {extraction.get('seconds', 0)}s")
+            
+            final_display_name = self._name_extracted_file(file_data, file_path, original_filename)
+            yield offset + index, {"file_data": file_data, "display_name": final_display_name, "file_id": file_id}
+    
     async def evaluate_with_complete_logic(self, request, file_contents, file_basenames, file_ids_map, file_ids_by_index, file_paths_to_cleanup=None, current_user=None, db: Optional[Session] = None):
         """Standard evaluation with per-question deterministic logic & robust error handling."""
-        try:
-            prepared = []
+        async def source():
             for idx, fd in enumerate(file_contents):
-                content = str(fd.get('content', ''))
-                qa_pairs = await self.extract_qa_pairs(content)
-                
-                if not qa_pairs:
-                    logger.info(f"No QA pairs extracted for {file_basenames[idx]}. Checking description for questions...")
-                    
-                    # Try to find questions in the description
-                    description_questions = await self.extract_qa_pairs(request.description or "")
-                    
-                    if description_questions:
-                        # Use questions found in the description
-                        qa_pairs = []
-                        for dq in description_questions:
-                            qa_pairs.append({
-                                "question": dq.get("question", "Assignment Question"),
-                                "student_answer": content
-                            })
-                    else:
-                        # FALLBACK: If no structured questions found anywhere, but a description exists,
-                        # treat the entire content as a single answer to the assignment description/task.
-                        if request.description and len(request.description.strip()) > 5:
-                            logger.info(f"No structured questions found. Falling back to whole-file evaluation against description for {file_basenames[idx]}.")
-                            qa_pairs = [{
-                                "question": "Evaluate the submitted assignment/code strictly against the provided requirements/description.",
-                                "student_answer": content
-                            }]
-                        else:
-                            # Truly no questions found and no description to evaluate against.
-                            qa_pairs = []
-                
-                fd_copy = dict(fd)
-                fd_copy['qa_pairs'] = qa_pairs
-                fd_copy['display_name'] = file_basenames[idx] if idx < len(file_basenames) else 'Unknown'
-                fd_copy['file_id'] = file_ids_by_index[idx] if idx < len(file_ids_by_index) else None
-                prepared.append(fd_copy)
+                yield idx, {
+                    "file_data": fd,
+                    "display_name": file_basenames[idx] if idx < len(file_basenames) else 'Unknown',
+                    "file_id": file_ids_by_index[idx] if idx < len(file_ids_by_index) else None,
+                }
+        return await self._run_file_pipeline(request, source(), file_ids_by_index, current_user, db)
+    
+    async def _run_file_pipeline(self, request, source, file_ids_by_index, current_user=None, db: Optional[Session] = None):
+        """
+        Staged evaluation: extract (source) -> QA split -> grade -> persist, connected by bounded
+        queues so early files are graded and saved while later ones are still being extracted.
+        """
+        assignment_id = None
+        try:
+            results: Dict[int, Dict] = {}
+            description_qa: Dict[str, asyncio.Task] = {}
             
-            async def evaluate_file(fd):
-                details = []
-                qa_pairs = fd.get('qa_pairs', [])
-                
-                if not qa_pairs:
-                    return {
-                        "name": fd['display_name'],
-                        "file_id": fd['file_id'],
-                        "reasoning": "No questions found in file or description. Unable to evaluate.",
-                        "details": [],
+            if db:
+                assignment_id = await asyncio.to_thread(self._create_assignment, db, current_user, request, EvaluationType.FILE)
+            
+            async def numbered():
+                async for index, item in source:
+                    item['index'] = index
+                    yield item
+            
+            async def qa_split(item):
+                item['qa_pairs'] = await self._split_qa(item, request, description_qa)
+                return item
+            
+            async def grade(item):
+                try:
+                    item['score'] = await self._grade_file(item, request)
+                except Exception as e:
+                    logger.error(f"Grading failed for {item['display_name']}: {e}")
+                    item['score'] = {
+                        "name": item['display_name'],
+                        "file_id": item['file_id'],
                         "score_percent": 0.0,
+                        "reasoning": "Evaluation could not be completed because the LLM service was temporarily unavailable. Please try again later.",
+                        "details": [],
+                        "error": str(e)
                     }
-
-                eval_tasks = []
-                for idx_q, qa in enumerate(qa_pairs, 1):
-                    question = qa.get('question', '')
-                    answer = qa.get('answer') or qa.get('student_answer', '')
-                    eval_tasks.append(self.gemini_service.evaluate_one_qa(request.description, question, answer, question_index=idx_q))
-                
-                eval_results = await asyncio.gather(*eval_tasks)
-                
-                for res in eval_results:
-                    if not res.get("success"):
-                        # Graceful failure handling for LLM unavailability
-                        return {
-                            "name": fd['display_name'],
-                            "file_id": fd['file_id'],
-                            "score_percent": 0.0,
-                            "reasoning": "Evaluation could not be completed because the LLM service was temporarily unavailable. Please try again later.",
-                            "details": [],
-                            "error": res.get("error")
-                        }
-                    
-                    detail_model = res.get("response")
-                    details.append(detail_model)
-                
-                score_percent = self.calculate_score_from_details(details)
-                return {
-                    "name": fd['display_name'],
-                    "file_id": fd['file_id'],
-                    "reasoning": "Auto-computed from per-question evaluation.",
-                    "details": details,
-                    "score_percent": score_percent,
-                }
-
-            file_tasks = [evaluate_file(fd) for fd in prepared]
-            final_scores = await asyncio.gather(*file_tasks)
+                return item
             
-            assignment_id = None
-            if db:
-                assignment_id, final_scores = self._save_to_database(db, current_user, request, file_contents, file_basenames, file_ids_by_index, file_paths_to_cleanup or [], final_scores, "File Evaluation Complete", EvaluationType.FILE)
+            async def persist(item):
+                if assignment_id is not None:
+                    await asyncio.to_thread(self._persist_file_result, db, assignment_id, item, EvaluationType.FILE)
+                results[item['index']] = item
+                return None
+            
+            # Rubric/reference prefix is cached provider-side once for the whole batch
+            async with self.gemini_service.context_cache_batch():
+                await run_pipeline(numbered(), [
+                    Stage("qa_split", qa_split, PIPELINE_QA_CONCURRENCY),
+                    Stage("grade", grade, PIPELINE_GRADE_CONCURRENCY),
+                    Stage("persist", persist, 1),
+                ], queue_size=PIPELINE_QUEUE_SIZE)
+            
+            final_scores = [results[i]['score'] for i in sorted(results)]
+            if assignment_id is not None:
+                await asyncio.to_thread(self._complete_assignment, db, assignment_id)
             
             # --- Peer-to-Peer Plagiarism Detection ---
             self.detect_batch_plagiarism(final_scores)
@@ -387,8 +407,110 @@ class GenerateServiceComplete:
 
         except Exception as e:
             logger.error(f"Eval error: {e}")
+            if assignment_id is not None:
+                # Don't leave a half-saved draft behind in history
+                await asyncio.to_thread(self._discard_assignment, db, assignment_id)
             return {"success": False, "error": str(e)}
 
+    async def _split_qa(self, item: Dict, request, description_qa: Dict[str, asyncio.Task]) -> List[Dict]:
+        """QA pairs for one file, falling back to the description's questions or a whole-file evaluation."""
+        content = str(item['file_data'].get('content', ''))
+        qa_pairs = await self.extract_qa_pairs(content)
+        
+        if not qa_pairs:
+            logger.info(f"No QA pairs extracted for {item['display_name']}. Checking description for questions...")
+            
+            # Try to find questions in the description (extracted once per batch)
+            if "task" not in description_qa:
+                description_qa["task"] = asyncio.ensure_future(self.extract_qa_pairs(request.description or ""))
+            description_questions = await description_qa["task"]
+            
+            if description_questions:
+                # Use questions found in the description
+                qa_pairs = []
+                for dq in description_questions:
+                    qa_pairs.append({
+                        "question": dq.get("question", "Assignment Question"),
+                        "student_answer": content
+                    })
+            else:
+                # FALLBACK: If no structured questions found anywhere, but a description exists,
+                # treat the entire content as a single answer to the assignment description/task.
+                if request.description and len(request.description.strip()) > 5:
+                    logger.info(f"No structured questions found. Falling back to whole-file evaluation against description for {item['display_name']}.")
+                    qa_pairs = [{
+                        "question": "Evaluate the submitted assignment/code strictly against the provided requirements/description.",
+                        "student_answer": content
+                    }]
+                else:
+                    # Truly no questions found and no description to evaluate against.
+                    qa_pairs = []
+        return qa_pairs
+
+    async def _grade_file(self, item: Dict, request, graded: Optional[Dict[int, Dict]] = None,
+                          on_graded: Optional[Callable[[int, Dict], Awaitable[None]]] = None) -> Dict:
+        """
+        Grade every QA pair of one file. graded holds details a durable job already checkpointed
+        (question_index -> detail); only the remaining questions go to the LLM, and
+        on_graded(question_index, detail) is awaited as each new grade comes back.
+        """
+        graded = dict(graded or {})
+        qa_pairs = item.get('qa_pairs', [])
+        
+        if not qa_pairs:
+            return {
+                "name": item['display_name'],
+                "file_id": item['file_id'],
+                "reasoning": "No questions found in file or description. Unable to evaluate.",
+                "details": [],
+                "score_percent": 0.0,
+            }
+
+        pending = [(idx_q, qa) for idx_q, qa in enumerate(qa_pairs, 1) if idx_q not in graded]
+        if DeterministicEvalConfig.BATCH_QA_EVALUATION:
+            batch_items = [
+                {"question": qa.get('question', ''), "student_answer": qa.get('answer') or qa.get('student_answer', ''), "question_index": idx_q}
+                for idx_q, qa in pending
+            ]
+            eval_results = await self.gemini_service.evaluate_qa_batch(request.description, batch_items) if batch_items else []
+            for (idx_q, _), res in zip(pending, eval_results):
+                if res.get("success") and on_graded:
+                    await on_graded(idx_q, res.get("response"))
+        else:
+            async def grade_one(idx_q: int, qa: Dict) -> Dict:
+                question = qa.get('question', '')
+                answer = qa.get('answer') or qa.get('student_answer', '')
+                res = await self.gemini_service.evaluate_one_qa(request.description, question, answer, question_index=idx_q)
+                if res.get("success") and on_graded:
+                    await on_graded(idx_q, res.get("response"))
+                return res
+            
+            eval_results = await asyncio.gather(*(grade_one(idx_q, qa) for idx_q, qa in pending))
+        
+        for (idx_q, _), res in zip(pending, eval_results):
+            if not res.get("success"):
+                # Graceful failure handling for LLM unavailability
+                return {
+                    "name": item['display_name'],
+                    "file_id": item['file_id'],
+                    "score_percent": 0.0,
+                    "reasoning": "Evaluation could not be completed because the LLM service was temporarily unavailable. Please try again later.",
+                    "details": [],
+                    "error": res.get("error")
+                }
+            
+            graded[idx_q] = res.get("response")
+        
+        details = [graded[idx_q] for idx_q in range(1, len(qa_pairs) + 1)]
+        score_percent = self.calculate_score_from_details(details)
+        return {
+            "name": item['display_name'],
+            "file_id": item['file_id'],
+            "reasoning": "Auto-computed from per-question evaluation.",
+            "details": details,
+            "score_percent": score_percent,
+        }
+
     async def _evaluate_single_ppt(self, fd: Dict, file_path: str, file_id: str, title: str, description: str) -> Dict:
         """Evaluate single PPT with error handling."""
         res_info = await self.ppt_evaluator.evaluate_ppt(title, description, {'slides_text': fd.get('content'), 'filename': fd.get('filename')})
@@ -418,24 +540,25 @@ class GenerateServiceComplete:
         }
         return {"score": score, "formatted": formatted}
 
+    @staticmethod
+    def _ppt_outcome(result, fd: Dict, file_id: str) -> tuple[Dict, str]:
+        """(score, formatted text) for one _evaluate_single_ppt result, an LLM failure or an exception."""
+        if isinstance(result, Exception) or (isinstance(result, dict) and "error" in result and result.get("is_llm_fail")):
+            err_info = result.get("error") if isinstance(result, dict) else str(result)
+            score = {
+                "name": fd.get('display_name', 'Unknown'),
+                "file_id": file_id,
+                "score_percent": 0.0,
+                "reasoning": "Evaluation could not be completed because the LLM service was temporarily unavailable. Please try again later.",
+                "details": [],
+                "error": err_info
+            }
+            return score, f"LLM Unavailable for {fd.get('filename')}"
+        return result['score'], result['formatted']
+
     def _save_to_database(self, db: Session, current_user, request, file_contents, file_basenames, file_ids_by_index, file_paths_to_cleanup, final_scores, summary, evaluation_type) -> tuple[Optional[int], List[Dict]]:
         try:
-            # Map EvaluationType to category string
-            category_map = {
-                EvaluationType.FILE: 'file_upload',
-                EvaluationType.PPT: 'ppt',
-                EvaluationType.GITHUB: 'git'
-            }
-            category = category_map.get(evaluation_type, 'file_upload')
-            
-            assignment = Assignment(
-                user_id=current_user.id, 
-                title=request.title, 
-                description=request.description, 
-                status=AssignmentStatus.COMPLETED,
-                category=category
-            )
-            db.add(assignment); db.flush()
+            assignment = self._new_assignment(db, current_user, request, evaluation_type, AssignmentStatus.COMPLETED)
             
             file_objs = {}
             for idx, fd in enumerate(file_contents):
@@ -446,21 +569,87 @@ class GenerateServiceComplete:
             db.flush()
 
             for score in final_scores:
-                f_id = score.get('file_id')
-                f_obj = file_objs.get(f_id)
-                ev = EvaluationResult(assignment_id=assignment.id, assignment_file_id=f_obj.id if f_obj else None, student_name=score.get('name', 'Unknown'), score_percent=float(score.get('score_percent', 0)), reasoning=score.get('reasoning', ''), evaluation_type=evaluation_type)
-                db.add(ev); db.flush()
-                score['id'] = ev.id # Inject Result ID
-                
-                for d_idx, d in enumerate(score.get('details', [])):
-                    detail_obj = EvaluationDetail(evaluation_result_id=ev.id, question=d.get('question', 'N/A'), student_answer=d.get('student_answer', 'N/A'), correct_answer=d.get('correct_answer', 'N/A'), is_correct=bool(d.get('is_correct')), feedback=d.get('feedback', 'N/A'), order_index=d_idx)
-                    db.add(detail_obj); db.flush()
-                    d['id'] = detail_obj.id # Inject Detail ID
+                f_obj = file_objs.get(score.get('file_id'))
+                self._add_evaluation_result(db, assignment.id, f_obj, score, evaluation_type)
             db.commit()
             return assignment.id, final_scores
         except Exception as e:
             db.rollback(); logger.error(f"DB Error: {e}"); return None, final_scores
 
+    def _new_assignment(self, db: Session, current_user, request, evaluation_type, status) -> Assignment:
+        # Map EvaluationType to category string
+        category_map = {
+            EvaluationType.FILE: 'file_upload',
+            EvaluationType.PPT: 'ppt',
+            EvaluationType.GITHUB: 'git'
+        }
+        category = category_map.get(evaluation_type, 'file_upload')
+        
+        assignment = Assignment(
+            user_id=current_user.id, 
+            title=request.title, 
+            description=request.description, 
+            status=status,
+            category=category
+        )
+        db.add(assignment); db.flush()
+        return assignment
+
+    def _add_evaluation_result(self, db: Session, assignment_id: int, f_obj: Optional[AssignmentFile], score: Dict, evaluation_type) -> None:
+        ev = EvaluationResult(assignment_id=assignment_id, assignment_file_id=f_obj.id if f_obj else None, student_name=score.get('name', 'Unknown'), score_percent=float(score.get('score_percent', 0)), reasoning=score.get('reasoning', ''), evaluation_type=evaluation_type)
+        db.add(ev); db.flush()
+        score['id'] = ev.id # Inject Result ID
+        
+        for d_idx, d in enumerate(score.get('details', [])):
+            detail_obj = EvaluationDetail(evaluation_result_id=ev.id, question=d.get('question', 'N/A'), student_answer=d.get('student_answer', 'N/A'), correct_answer=d.get('correct_answer', 'N/A'), is_correct=bool(d.get('is_correct')), feedback=d.get('feedback', 'N/A'), order_index=d_idx)
+            db.add(detail_obj); db.flush()
+            d['id'] = detail_obj.id # Inject Detail ID
+
+    def _create_assignment(self, db: Session, current_user, request, evaluation_type) -> Optional[int]:
+        """Draft assignment that pipeline results are saved into as each file finishes."""
+        try:
+            assignment = self._new_assignment(db, current_user, request, evaluation_type, AssignmentStatus.DRAFT)
+            db.commit()
+            return assignment.id
+        except Exception as e:
+            db.rollback(); logger.error(f"DB Error: {e}"); return None
+
+    def _discard_assignment(self, db: Session, assignment_id: int) -> None:
+        """Delete a draft assignment and the file results already saved into it."""
+        try:
+            assignment = db.query(Assignment).filter(Assignment.id == assignment_id).first()
+            if assignment:
+                db.delete(assignment)
+                db.commit()
+        except Exception as e:
+            db.rollback(); logger.error(f"DB Error discarding draft assignment {assignment_id}: {e}")
+
+    def _persist_file_result(self, db: Session, assignment_id: int, item: Dict, evaluation_type) -> None:
+        """Commit one file and its evaluation; a failure is logged and the batch carries on."""
+        try:
+            self._add_file_result(db, assignment_id, item, evaluation_type)
+            db.commit()
+        except Exception as e:
+            db.rollback(); logger.error(f"DB Error saving {item['display_name']}: {e}")
+
+    def _add_file_result(self, db: Session, assignment_id: int, item: Dict, evaluation_type) -> None:
+        """Add (without committing) one pipeline item's AssignmentFile, EvaluationResult and details."""
+        fd, score = item['file_data'], item['score']
+        f_obj = None
+        if item.get('file_id'):
+            f_obj = AssignmentFile(assignment_id=assignment_id, file_id=item['file_id'], original_filename=fd.get('filename', ''), extracted_text=str(fd.get('content'))[:50000], extracted_name=item['display_name'], file_type=fd.get('file_type', 'unknown'))
+            db.add(f_obj); db.flush()
+        self._add_evaluation_result(db, assignment_id, f_obj, score, evaluation_type)
+
+    def _complete_assignment(self, db: Session, assignment_id: int) -> None:
+        try:
+            assignment = db.query(Assignment).filter(Assignment.id == assignment_id).first()
+            if assignment:
+                assignment.status = AssignmentStatus.COMPLETED
+                db.commit()
+        except Exception as e:
+            db.rollback(); logger.error(f"DB Error: {e}")
+
     def detect_batch_plagiarism(self, final_scores: List[Dict], threshold: float = 0.85):
         """
         Detects peer-to-peer plagiarism between students in the same batch.
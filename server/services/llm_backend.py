@@ -0,0 +1,342 @@
+"""
+LLM Backends
+Transport layer behind GeminiService._call_gemini_core, selected with LLM_BACKEND:
+- gemini: the real google-genai client (default)
+- fake:   deterministic local backend for offline load / tail-latency testing
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import os
+import random
+import threading
+import weakref
+from types import SimpleNamespace
+from typing import Any, Dict, Optional, Protocol
+
+from google import genai
+from google.genai import errors, types
+
+logger = logging.getLogger(__name__)
+
+# Use the SDK's native async client (True) or the blocking client on a thread pool (False)
+USE_ASYNC_TRANSPORT = os.getenv("GEMINI_ASYNC_TRANSPORT", "true").lower() in ("1", "true", "yes")
+
+
+class LLMBackend(Protocol):
+    """What GeminiService and the context cache need from an LLM provider"""
+
+    name: str
+
+    def is_available(self) -> bool:
+        ...
+
+    async def generate(self, model: str, contents: Any, config: types.GenerateContentConfig) -> Any:
+        """Return a response exposing .text and .usage_metadata; raise on transport/API errors."""
+        ...
+
+    async def create_cache(self, model: str, contents: Any, ttl_seconds: int, display_name: str) -> str:
+        ...
+
+    async def update_cache(self, name: str, ttl_seconds: int) -> None:
+        ...
+
+    async def delete_cache(self, name: str) -> None:
+        ...
+
+
+# One client (and its HTTP connection pool) per API key, shared by every backend instance
+_shared_clients: Dict[str, Any] = {}
+
+
+def _get_shared_client(api_key: str):
+    client = _shared_clients.get(api_key)
+    if client is None:
+        client = genai.Client(api_key=api_key)
+        _shared_clients[api_key] = client
+    return client
+
+
+# The aio side wraps an httpx AsyncClient bound to the loop that first uses it, so async
+# calls get one client per (event loop, API key); entries go away with their loop
+_loop_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, Any]]" = weakref.WeakKeyDictionary()
+_loop_clients_lock = threading.Lock()
+
+
+def _get_loop_client(api_key: str):
+    loop = asyncio.get_running_loop()
+    with _loop_clients_lock:
+        clients = _loop_clients.setdefault(loop, {})
+        client = clients.get(api_key)
+        if client is None:
+            client = genai.Client(api_key=api_key)
+            clients[api_key] = client
+        return client
+
+
+class GeminiBackend:
+    """google-genai backed transport"""
+
+    name = "gemini"
+
+    def __init__(self, api_key: str = ""):
+        self.api_key = api_key or os.getenv("GEMINI_API_KEY", "")
+        self.client = _get_shared_client(self.api_key) if self.api_key else None
+        if not self.client:
+            logger.warning("GEMINI_API_KEY not found in environment")
+
+    def is_available(self) -> bool:
+        if not self.client:
+            self.api_key = os.getenv("GEMINI_API_KEY", "")
+            if self.api_key:
+                self.client = _get_shared_client(self.api_key)
+        return self.client is not None
+
+    def _aio(self):
+        """The SDK's async client for the running event loop"""
+        return _get_loop_client(self.api_key).aio
+
+    async def generate(self, model: str, contents: Any, config: types.GenerateContentConfig) -> Any:
+        if USE_ASYNC_TRANSPORT:
+            # Native aio client: no thread held per in-flight request
+            return await self._aio().models.generate_content(model=model, contents=contents, config=config)
+
+        # Legacy transport: blocking SDK call on the default thread pool
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            None,
+            lambda: self.client.models.generate_content(model=model, contents=contents, config=config)
+        )
+
+    async def create_cache(self, model: str, contents: Any, ttl_seconds: int, display_name: str) -> str:
+        cached = await self._aio().caches.create(
+            model=model,
+            config=types.CreateCachedContentConfig(
+                contents=[contents],
+                ttl=f"{ttl_seconds}s",
+                display_name=display_name,
+            ),
+        )
+        return cached.name
+
+    async def update_cache(self, name: str, ttl_seconds: int) -> None:
+        await self._aio().caches.update(name=name, config=types.UpdateCachedContentConfig(ttl=f"{ttl_seconds}s"))
+
+    async def delete_cache(self, name: str) -> None:
+        await self._aio().caches.delete(name=name)
+
+
+class FakeLLMBackend:
+    """
+    Offline stand-in for Gemini.
+    - Responses are schema-valid JSON generated from config.response_schema, seeded by the
+      prompt so identical prompts get identical answers (consensus votes agree).
+    - Latency follows LLM_FAKE_LATENCY (fixed | uniform | exponential | lognormal) with mean
+      LLM_FAKE_LATENCY_MEAN_SECONDS and spread LLM_FAKE_LATENCY_SIGMA.
+    - LLM_FAKE_ERROR_429_RATE / LLM_FAKE_ERROR_503_RATE / LLM_FAKE_TIMEOUT_RATE inject
+      the same SDK errors the real client raises; timeouts fire after LLM_FAKE_TIMEOUT_SECONDS.
+    """
+
+    name = "fake"
+
+    def __init__(self, latency: str = "lognormal", latency_mean: float = 1.0, latency_sigma: float = 0.5,
+                 error_429_rate: float = 0.0, error_503_rate: float = 0.0, timeout_rate: float = 0.0,
+                 timeout_seconds: float = 30.0, seed: Optional[int] = None):
+        self.latency = latency
+        self.latency_mean = latency_mean
+        self.latency_sigma = latency_sigma
+        self.error_429_rate = error_429_rate
+        self.error_503_rate = error_503_rate
+        self.timeout_rate = timeout_rate
+        self.timeout_seconds = timeout_seconds
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._caches: Dict[str, str] = {}
+        self._cache_seq = 0
+        self._stats = {"calls": 0, "errors_429": 0, "errors_503": 0, "timeouts": 0}
+
+    @classmethod
+    def from_env(cls) -> "FakeLLMBackend":
+        seed = os.getenv("LLM_FAKE_SEED")
+        return cls(
+            latency=os.getenv("LLM_FAKE_LATENCY", "lognormal").lower(),
+            latency_mean=float(os.getenv("LLM_FAKE_LATENCY_MEAN_SECONDS", "1.0")),
+            latency_sigma=float(os.getenv("LLM_FAKE_LATENCY_SIGMA", "0.5")),
+            error_429_rate=float(os.getenv("LLM_FAKE_ERROR_429_RATE", "0")),
+            error_503_rate=float(os.getenv("LLM_FAKE_ERROR_503_RATE", "0")),
+            timeout_rate=float(os.getenv("LLM_FAKE_TIMEOUT_RATE", "0")),
+            timeout_seconds=float(os.getenv("LLM_FAKE_TIMEOUT_SECONDS", "30")),
+            seed=int(seed) if seed else None,
+        )
+
+    def is_available(self) -> bool:
+        return True
+
+    def _sample_latency(self) -> float:
+        mean = self.latency_mean
+        with self._lock:
+            if self.latency == "fixed":
+                return mean
+            if self.latency == "uniform":
+                return max(0.0, self._rng.uniform(mean - self.latency_sigma, mean + self.latency_sigma))
+            if self.latency == "exponential":
+                return self._rng.expovariate(1.0 / mean) if mean > 0 else 0.0
+            # lognormal with the requested mean: mu = ln(mean) - sigma^2 / 2
+            if mean <= 0:
+                return 0.0
+            return self._rng.lognormvariate(math.log(mean) - self.latency_sigma ** 2 / 2, self.latency_sigma)
+
+    def _roll_fault(self) -> Optional[str]:
+        with self._lock:
+            roll = self._rng.random()
+        for fault, rate in (("429", self.error_429_rate), ("503", self.error_503_rate), ("timeout", self.timeout_rate)):
+            if roll < rate:
+                return fault
+            roll -= rate
+        return None
+
+    async def generate(self, model: str, contents: Any, config: types.GenerateContentConfig) -> Any:
+        with self._lock:
+            self._stats["calls"] += 1
+        fault = self._roll_fault()
+
+        if fault == "timeout":
+            with self._lock:
+                self._stats["timeouts"] += 1
+            await asyncio.sleep(self.timeout_seconds)
+            raise errors.ServerError(504, {"error": {"code": 504, "message": "Deadline exceeded (timeout)", "status": "DEADLINE_EXCEEDED"}})
+
+        await asyncio.sleep(self._sample_latency())
+
+        if fault == "429":
+            with self._lock:
+                self._stats["errors_429"] += 1
+            raise errors.ClientError(429, {"error": {"code": 429, "message": "Resource has been exhausted (e.g. check quota).", "status": "RESOURCE_EXHAUSTED"}})
+        if fault == "503":
+            with self._lock:
+                self._stats["errors_503"] += 1
+            raise errors.ServerError(503, {"error": {"code": 503, "message": "The model is overloaded. Please try again later.", "status": "UNAVAILABLE"}})
+
+        prompt = _contents_text(contents)
+        cached_name = getattr(config, "cached_content", None) if config is not None else None
+        if cached_name:
+            if cached_name not in self._caches:
+                raise errors.ClientError(404, {"error": {"code": 404, "message": f"CachedContent not found: {cached_name}", "status": "NOT_FOUND"}})
+            prompt = self._caches[cached_name] + prompt
+
+        schema = getattr(config, "response_schema", None) if config is not None else None
+        rng = random.Random(hashlib.sha256(prompt.encode("utf-8", "ignore")).hexdigest())
+        if schema is not None:
+            if hasattr(schema, "model_json_schema"):
+                schema = schema.model_json_schema()
+            array_hint = prompt.count("### QUESTION NUMBER:") or None
+            text = json.dumps(_fake_from_schema(schema, schema.get("$defs", {}), rng, array_hint))
+        else:
+            text = f"Fake response ({rng.randint(0, 9999)})"
+
+        prompt_tokens = len(prompt) // 4 + 1
+        output_tokens = len(text) // 4 + 1
+        usage = SimpleNamespace(
+            prompt_token_count=prompt_tokens,
+            candidates_token_count=output_tokens,
+            total_token_count=prompt_tokens + output_tokens,
+        )
+        return SimpleNamespace(text=text, usage_metadata=usage)
+
+    async def create_cache(self, model: str, contents: Any, ttl_seconds: int, display_name: str) -> str:
+        with self._lock:
+            self._cache_seq += 1
+            name = f"cachedContents/fake-{self._cache_seq}"
+            self._caches[name] = _contents_text(contents)
+        return name
+
+    async def update_cache(self, name: str, ttl_seconds: int) -> None:
+        if name not in self._caches:
+            raise errors.ClientError(404, {"error": {"code": 404, "message": f"CachedContent not found: {name}", "status": "NOT_FOUND"}})
+
+    async def delete_cache(self, name: str) -> None:
+        with self._lock:
+            self._caches.pop(name, None)
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {**self._stats, "active_caches": len(self._caches)}
+
+
+def _contents_text(contents: Any) -> str:
+    if contents is None:
+        return ""
+    if isinstance(contents, str):
+        return contents
+    if isinstance(contents, (bytes, bytearray)):
+        return f"[binary:{hashlib.sha256(contents).hexdigest()[:16]}]"
+    if isinstance(contents, (list, tuple)):
+        return "\n".join(_contents_text(c) for c in contents)
+    text = getattr(contents, "text", None)
+    if isinstance(text, str):
+        return text
+    inline = getattr(contents, "inline_data", None)
+    if inline is not None and getattr(inline, "data", None):
+        return _contents_text(inline.data)
+    parts = getattr(contents, "parts", None)
+    if parts:
+        return _contents_text(list(parts))
+    return str(contents)
+
+
+def _fake_from_schema(schema: Dict, defs: Dict, rng: random.Random, array_hint: Optional[int] = None, depth: int = 0) -> Any:
+    """Produce a value valid against a (pydantic-generated) JSON schema"""
+    if "$ref" in schema:
+        return _fake_from_schema(defs.get(schema["$ref"].split("/")[-1], {}), defs, rng, array_hint, depth)
+    if "default" in schema and schema["default"] is not None:
+        return schema["default"]
+    for key in ("anyOf", "oneOf"):
+        if key in schema:
+            options = [s for s in schema[key] if s.get("type") != "null"] or schema[key]
+            return _fake_from_schema(options[0], defs, rng, array_hint, depth)
+    if "enum" in schema:
+        return rng.choice(schema["enum"])
+
+    kind = schema.get("type")
+    if kind == "object" or "properties" in schema:
+        return {name: _fake_from_schema(prop, defs, rng, array_hint, depth + 1)
+                for name, prop in schema.get("properties", {}).items()}
+    if kind == "array":
+        items = schema.get("items", {})
+        # Batched grading expects one entry per question block in the prompt
+        is_object_list = "$ref" in items or items.get("type") == "object"
+        count = array_hint if (array_hint and is_object_list and depth <= 1) else rng.randint(1, 3)
+        return [_fake_from_schema(items, defs, rng, None, depth + 1) for _ in range(count)]
+    if kind == "boolean":
+        return rng.random() < 0.5
+    if kind == "integer":
+        return rng.randint(int(schema.get("minimum", 0)), int(schema.get("maximum", 100)))
+    if kind == "number":
+        low, high = float(schema.get("minimum", 0.0)), float(schema.get("maximum", 1.0))
+        return round(low + (high - low) * rng.choice([0.0, 0.25, 0.5, 0.75, 1.0]), 2)
+    if kind == "null":
+        return None
+    title = schema.get("title", "value")
+    return f"Fake {title.lower()} {rng.randint(0, 9999)}"
+
+
+_backend: Optional[LLMBackend] = None
+_backend_lock = threading.Lock()
+
+
+def get_llm_backend() -> LLMBackend:
+    """Process-wide backend chosen by LLM_BACKEND (gemini | fake)"""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            choice = os.getenv("LLM_BACKEND", "gemini").lower()
+            if choice == "fake":
+                _backend = FakeLLMBackend.from_env()
+                logger.warning("🧪 LLM_BACKEND=fake: using the local fake LLM backend (no real model calls)")
+            else:
+                if choice != "gemini":
+                    logger.warning(f"Unknown LLM_BACKEND '{choice}', falling back to gemini")
+                _backend = GeminiBackend()
+        return _backend
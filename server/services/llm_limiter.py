@@ -0,0 +1,201 @@
+"""
+Adaptive Concurrency Limiter
+Process-wide, priority-aware AIMD limiter shared by every Gemini call path
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class LLMPriority:
+    """Admission priorities for LLM calls (lower value is admitted first)"""
+    HIGH = 0    # OCR / QA extraction - gates all downstream grading
+    NORMAL = 1  # Per-question grading, PPT and Git evaluation
+    LOW = 2     # Best-effort / background calls
+
+
+class _Waiter:
+    __slots__ = ("future", "loop", "admitted", "cancelled")
+
+    def __init__(self, future: asyncio.Future, loop: asyncio.AbstractEventLoop):
+        self.future = future
+        self.loop = loop
+        self.admitted = False
+        self.cancelled = False
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Bounds the number of in-flight LLM requests and adapts the bound (AIMD):
+    - additive increase of ~1 slot per window of successful, fast calls
+    - multiplicative decrease on 429/503 (at most once per cooldown) or when
+      smoothed latency exceeds the configured threshold.
+
+    Thread-safe: waiters may live on different event loops (e.g. OCR run via
+    asyncio.run from a worker thread), so admission is signalled with
+    call_soon_threadsafe.
+    """
+
+    OVERLOAD_STATUS_CODES = {429, 503}
+    OVERLOAD_STRINGS = ["resource_exhausted", "rate limit", "overloaded", "unavailable"]
+
+    def __init__(self, initial_limit: int = 8, min_limit: int = 1, max_limit: int = 64,
+                 increase_step: float = 1.0, decrease_factor: float = 0.5,
+                 latency_threshold: float = 60.0, decrease_cooldown: float = 2.0):
+        self.min_limit = max(1, int(min_limit))
+        self.max_limit = max(self.min_limit, int(max_limit))
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.latency_threshold = latency_threshold
+        self.decrease_cooldown = decrease_cooldown
+
+        self._lock = threading.Lock()
+        self._limit = float(min(max(initial_limit, self.min_limit), self.max_limit))
+        self._waiters: List[Tuple[int, int, _Waiter]] = []
+        self._seq = itertools.count()
+        self._in_flight = 0
+        self._queued = 0
+        self._admitted = 0
+        self._completed = 0
+        self._overloads = 0
+        self._decreases = 0
+        self._last_decrease = 0.0
+        self._latency_ewma: Optional[float] = None
+
+    @classmethod
+    def from_env(cls) -> "AdaptiveConcurrencyLimiter":
+        return cls(
+            initial_limit=int(os.getenv("GEMINI_CONCURRENCY_INITIAL", "8")),
+            min_limit=int(os.getenv("GEMINI_CONCURRENCY_MIN", "1")),
+            max_limit=int(os.getenv("GEMINI_CONCURRENCY_MAX", "64")),
+            latency_threshold=float(os.getenv("GEMINI_LATENCY_THRESHOLD_SECONDS", "60")),
+        )
+
+    @property
+    def limit(self) -> int:
+        return max(self.min_limit, int(self._limit))
+
+    @classmethod
+    def is_overload_error(cls, error: Optional[BaseException]) -> bool:
+        """True if the error signals quota exhaustion or server overload (429/503)"""
+        if error is None:
+            return False
+        if getattr(error, "status_code", None) in cls.OVERLOAD_STATUS_CODES:
+            return True
+        msg = str(error).lower()
+        return any(str(code) in msg for code in cls.OVERLOAD_STATUS_CODES) or \
+            any(s in msg for s in cls.OVERLOAD_STRINGS)
+
+    async def acquire(self, priority: int = LLMPriority.NORMAL) -> None:
+        """Wait for an admission slot. Higher priority (lower value) waiters go first."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._in_flight < self.limit and self._queued == 0:
+                self._in_flight += 1
+                self._admitted += 1
+                return
+            waiter = _Waiter(loop.create_future(), loop)
+            heapq.heappush(self._waiters, (priority, next(self._seq), waiter))
+            self._queued += 1
+
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            release_slot = False
+            with self._lock:
+                if waiter.admitted:
+                    release_slot = True
+                else:
+                    waiter.cancelled = True
+                    self._queued -= 1
+            if release_slot:
+                self._release_slot()
+            raise
+
+    def release(self, latency: Optional[float] = None, error: Optional[BaseException] = None) -> None:
+        """Return a slot and feed the observed outcome into the AIMD controller."""
+        with self._lock:
+            self._in_flight -= 1
+            self._completed += 1
+            now = time.monotonic()
+
+            if self.is_overload_error(error):
+                self._overloads += 1
+                self._decrease(now, self.decrease_factor, reason="overload")
+            elif error is None and latency is not None:
+                self._latency_ewma = latency if self._latency_ewma is None else (0.8 * self._latency_ewma + 0.2 * latency)
+                if self.latency_threshold and self._latency_ewma > self.latency_threshold:
+                    self._decrease(now, 0.9, reason="latency")
+                else:
+                    self._limit = min(float(self.max_limit), self._limit + self.increase_step / max(self._limit, 1.0))
+
+            self._dispatch()
+
+    def abandon(self) -> None:
+        """Return a slot whose call was cancelled; no outcome is fed into the AIMD controller."""
+        self._release_slot()
+
+    def _release_slot(self) -> None:
+        with self._lock:
+            self._in_flight -= 1
+            self._dispatch()
+
+    def _decrease(self, now: float, factor: float, reason: str) -> None:
+        # Caller holds the lock. Concurrent failures from one burst only count once.
+        if now - self._last_decrease < self.decrease_cooldown:
+            return
+        old = self.limit
+        self._limit = max(float(self.min_limit), self._limit * factor)
+        self._last_decrease = now
+        self._decreases += 1
+        if self.limit != old:
+            logger.warning(f"LLM concurrency limit reduced {old} -> {self.limit} ({reason})")
+
+    def _dispatch(self) -> None:
+        # Caller holds the lock.
+        while self._waiters and self._in_flight < self.limit:
+            _, _, waiter = heapq.heappop(self._waiters)
+            if waiter.cancelled:
+                continue
+            try:
+                waiter.loop.call_soon_threadsafe(self._wake, waiter.future)
+            except RuntimeError:
+                # Waiter's event loop is closed; nobody is left to use the slot
+                self._queued -= 1
+                continue
+            waiter.admitted = True
+            self._queued -= 1
+            self._in_flight += 1
+            self._admitted += 1
+
+    @staticmethod
+    def _wake(future: asyncio.Future) -> None:
+        if not future.done():
+            future.set_result(None)
+
+    def snapshot(self) -> Dict:
+        """Current limiter state for status endpoints"""
+        with self._lock:
+            return {
+                "limit": self.limit,
+                "min_limit": self.min_limit,
+                "max_limit": self.max_limit,
+                "in_flight": self._in_flight,
+                "queued": self._queued,
+                "admitted": self._admitted,
+                "completed": self._completed,
+                "overloads": self._overloads,
+                "decreases": self._decreases,
+                "latency_ewma_seconds": round(self._latency_ewma, 3) if self._latency_ewma is not None else None,
+            }
+
+
+# Shared by every GeminiService instance in the process
+gemini_limiter = AdaptiveConcurrencyLimiter.from_env()
@@ -0,0 +1,205 @@
+"""
+LLM Trace Sink
+Sampled, size-bounded JSONL traces of LLM prompts and responses, written off the
+request path by a background logging QueueListener into a rotating file
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks or formats on the caller's thread; drops when the queue is full."""
+
+    def __init__(self, q: queue.Queue, on_drop):
+        super().__init__(q)
+        self._on_drop = on_drop
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The trace payload is a dict in record.msg; serialization happens on the listener thread
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self._on_drop()
+
+
+class _JsonLineFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        return json.dumps(record.msg, ensure_ascii=False, default=str)
+
+
+class LLMTracer:
+    """
+    Records one JSON line per LLM attempt.
+    - Successful calls are sampled per call (sample_rate); failed attempts of enabled
+      operations are always recorded.
+    - Prompt and response text are truncated to max_chars before they are queued.
+    - operations / disabled_operations toggle tracing by operation name
+      (e.g. "QA Extraction", "Question Evaluation"); an empty allow-list means all.
+    """
+
+    def __init__(self, enabled: bool = True, path: str = "logs/llm_trace.jsonl", sample_rate: float = 0.1,
+                 max_chars: int = 2000, max_bytes: int = 10 * 1024 * 1024, backup_count: int = 5,
+                 queue_size: int = 10000, operations: Optional[set] = None, disabled_operations: Optional[set] = None):
+        self.enabled = enabled
+        self.path = path
+        self.sample_rate = sample_rate
+        self.max_chars = max_chars
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.operations = operations or set()
+        self.disabled_operations = disabled_operations or set()
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._listener: Optional[logging.handlers.QueueListener] = None
+        self._trace_logger: Optional[logging.Logger] = None
+        self._stats = {"recorded": 0, "sampled_out": 0, "dropped": 0}
+
+    @classmethod
+    def from_env(cls) -> "LLMTracer":
+        def _names(var: str) -> set:
+            return {n.strip() for n in os.getenv(var, "").split(",") if n.strip()}
+
+        return cls(
+            enabled=os.getenv("LLM_TRACE_ENABLED", "true").lower() in ("1", "true", "yes"),
+            path=os.getenv("LLM_TRACE_FILE", "logs/llm_trace.jsonl"),
+            sample_rate=float(os.getenv("LLM_TRACE_SAMPLE_RATE", "0.1")),
+            max_chars=int(os.getenv("LLM_TRACE_MAX_CHARS", "2000")),
+            max_bytes=int(os.getenv("LLM_TRACE_MAX_BYTES", str(10 * 1024 * 1024))),
+            backup_count=int(os.getenv("LLM_TRACE_BACKUP_COUNT", "5")),
+            operations=_names("LLM_TRACE_OPERATIONS"),
+            disabled_operations=_names("LLM_TRACE_DISABLED_OPERATIONS"),
+        )
+
+    def enabled_for(self, operation: str) -> bool:
+        if not self.enabled or operation in self.disabled_operations:
+            return False
+        return not self.operations or operation in self.operations
+
+    def sample(self, operation: str) -> bool:
+        """Decide once per call whether its successful attempts are traced."""
+        if not self.enabled_for(operation):
+            return False
+        if self.sample_rate >= 1.0 or random.random() < self.sample_rate:
+            return True
+        self._stats["sampled_out"] += 1
+        return False
+
+    def _truncate(self, text: str) -> str:
+        if len(text) <= self.max_chars:
+            return text
+        return text[:self.max_chars] + f"...[truncated {len(text) - self.max_chars} chars]"
+
+    @staticmethod
+    def _contents_text(contents: Any) -> str:
+        # Handle both string prompts and part-based prompts (vision)
+        if isinstance(contents, str):
+            return contents
+        if isinstance(contents, list):
+            return "\n".join(p if isinstance(p, str) else f"[Binary Part: {type(p).__name__}]" for p in contents)
+        return f"[{type(contents).__name__}]"
+
+    def record(self, operation: str, sampled: bool, *, model: str, attempt: int, contents: Any,
+               response_text: Optional[str] = None, error: Optional[BaseException] = None,
+               latency: Optional[float] = None, usage: Any = None, cached_content: Optional[str] = None) -> None:
+        """Queue a trace line for one attempt (cheap no-op when not sampled and not an error)."""
+        if not (sampled or (error is not None and self.enabled_for(operation))):
+            return
+
+        prompt = self._contents_text(contents)
+        event: Dict[str, Any] = {
+            "ts": time.time(),
+            "operation": operation,
+            "model": model,
+            "attempt": attempt,
+            "outcome": "error" if error is not None else "ok",
+            "latency_ms": round(latency * 1000, 1) if latency is not None else None,
+            "prompt_chars": len(prompt),
+            "prompt": self._truncate(prompt),
+        }
+        if cached_content:
+            event["cached_content"] = cached_content
+        if response_text is not None:
+            event["response_chars"] = len(response_text)
+            event["response"] = self._truncate(response_text)
+        if error is not None:
+            event["error"] = self._truncate(f"{type(error).__name__}: {error}")
+        if usage is not None:
+            event["usage"] = {
+                "prompt_tokens": getattr(usage, "prompt_token_count", None),
+                "output_tokens": getattr(usage, "candidates_token_count", None),
+                "total_tokens": getattr(usage, "total_token_count", None),
+            }
+
+        trace_logger = self._ensure_started()
+        if trace_logger is None:
+            return
+        trace_logger.info(event)
+        self._stats["recorded"] += 1
+
+    def _on_drop(self) -> None:
+        self._stats["dropped"] += 1
+
+    def _ensure_started(self) -> Optional[logging.Logger]:
+        if self._trace_logger is not None:
+            return self._trace_logger
+        with self._lock:
+            if self._trace_logger is not None:
+                return self._trace_logger
+            try:
+                Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+                file_handler = logging.handlers.RotatingFileHandler(
+                    self.path, maxBytes=self.max_bytes, backupCount=self.backup_count, encoding="utf-8"
+                )
+            except OSError as e:
+                logger.warning(f"LLM trace sink disabled, cannot open {self.path}: {e}")
+                self.enabled = False
+                return None
+            file_handler.setFormatter(_JsonLineFormatter())
+            self._listener = logging.handlers.QueueListener(self._queue, file_handler, respect_handler_level=False)
+            self._listener.start()
+
+            trace_logger = logging.getLogger("llm_trace")
+            trace_logger.setLevel(logging.INFO)
+            trace_logger.propagate = False
+            trace_logger.addHandler(_DroppingQueueHandler(self._queue, self._on_drop))
+            self._trace_logger = trace_logger
+            atexit.register(self.stop)
+            logger.info(f"📝 LLM trace sink writing to {self.path} (sample_rate={self.sample_rate})")
+            return trace_logger
+
+    def stop(self) -> None:
+        """Flush queued traces and stop the background writer."""
+        with self._lock:
+            if self._listener is not None:
+                self._listener.stop()
+                self._listener = None
+
+    def get_stats(self) -> Dict:
+        return {
+            "enabled": self.enabled,
+            "path": self.path,
+            "sample_rate": self.sample_rate,
+            "max_chars": self.max_chars,
+            "operations": sorted(self.operations) or "all",
+            "disabled_operations": sorted(self.disabled_operations),
+            "queued": self._queue.qsize(),
+            **self._stats,
+        }
+
+
+# Shared by every GeminiService instance in the process
+llm_tracer = LLMTracer.from_env()
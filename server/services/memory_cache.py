@@ -0,0 +1,86 @@
+"""
+In-Process LRU Cache Tier
+Bounded (entries and bytes) memory tier in front of the on-disk EvaluationCache
+"""
+import threading
+from collections import OrderedDict, defaultdict
+from typing import Dict, Optional, Tuple, Union
+
+
+class MemoryLRUCache:
+    """
+    Thread-safe LRU keyed by (eval_type, content_hash).
+    Values are the serialized JSON payload (str, or cache_codec-compressed bytes for large
+    payloads) plus the cached_at epoch, so every hit hands the caller a fresh object and the
+    byte budget reflects the real in-memory size.
+    """
+
+    def __init__(self, max_entries: int = 5000, max_bytes: int = 64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._data: "OrderedDict[Tuple[str, str], Tuple[float, Union[str, bytes]]]" = OrderedDict()
+        self._bytes = 0
+        self._counters: Dict[str, Dict[str, int]] = defaultdict(lambda: {"hits": 0, "misses": 0, "evictions": 0})
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.max_bytes > 0
+
+    def get(self, eval_type: str, content_hash: str) -> Optional[Tuple[float, Union[str, bytes]]]:
+        """Return (cached_at_epoch, payload_json) and mark the entry most recently used."""
+        key = (eval_type, content_hash)
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self._counters[eval_type]["misses"] += 1
+                return None
+            self._data.move_to_end(key)
+            self._counters[eval_type]["hits"] += 1
+            return entry
+
+    def put(self, eval_type: str, content_hash: str, cached_at: float, payload: Union[str, bytes]) -> None:
+        if not self.enabled:
+            return
+        size = len(payload)
+        if size > self.max_bytes:
+            return
+        key = (eval_type, content_hash)
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old[1])
+            self._data[key] = (cached_at, payload)
+            self._bytes += size
+            while self._data and (len(self._data) > self.max_entries or self._bytes > self.max_bytes):
+                (evicted_type, _), (_, evicted_payload) = self._data.popitem(last=False)
+                self._bytes -= len(evicted_payload)
+                self._counters[evicted_type]["evictions"] += 1
+
+    def discard(self, eval_type: str, content_hash: str) -> None:
+        with self._lock:
+            old = self._data.pop((eval_type, content_hash), None)
+            if old is not None:
+                self._bytes -= len(old[1])
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            per_type = {}
+            for eval_type, counters in self._counters.items():
+                lookups = counters["hits"] + counters["misses"]
+                per_type[eval_type] = {
+                    **counters,
+                    "hit_rate": round(counters["hits"] / lookups, 3) if lookups else None,
+                }
+            return {
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "by_eval_type": per_type,
+            }
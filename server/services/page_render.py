@@ -0,0 +1,78 @@
+"""
+PDF Page Rendering
+Rasterizes single PDF pages to PNG in a shared process pool so OCR of scanned
+documents is not serialized behind one CPU-bound render loop.
+Kept free of app imports: spawned workers import only this module.
+"""
+import io
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+# Optional renderers (same fallbacks as FileProcessor)
+try:
+    import fitz  # PyMuPDF
+    PYMUPDF_AVAILABLE = True
+except ImportError:
+    PYMUPDF_AVAILABLE = False
+
+try:
+    from pdf2image import convert_from_path
+    PDF2IMAGE_AVAILABLE = True
+except ImportError:
+    PDF2IMAGE_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# 0 renders in the default thread pool instead of worker processes
+OCR_RENDER_WORKERS = int(os.getenv("OCR_RENDER_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def render_page(file_path: str, page_num: int, renderer: str, resolution: int) -> bytes:
+    """
+    Render one 1-based page to PNG bytes.
+    resolution is the zoom factor for PyMuPDF and the DPI for pdf2image.
+    """
+    if renderer == "pymupdf":
+        with fitz.open(file_path) as doc:
+            pix = doc[page_num - 1].get_pixmap(matrix=fitz.Matrix(resolution, resolution))
+            return pix.tobytes("png")
+
+    poppler_path = os.getenv("POPPLER_PATH") or None
+    images = convert_from_path(file_path, dpi=resolution, poppler_path=poppler_path,
+                               first_page=page_num, last_page=page_num)
+    if not images:
+        raise ValueError(f"pdf2image rendered no image for page {page_num}")
+    buf = io.BytesIO()
+    images[0].save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def get_render_pool() -> Optional[ProcessPoolExecutor]:
+    """Shared render pool (spawned workers, so no server threads or sockets are forked), or None when disabled"""
+    global _pool
+    if OCR_RENDER_WORKERS <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=OCR_RENDER_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            logger.info(f"🖼️ PDF render pool started with {OCR_RENDER_WORKERS} worker processes")
+        return _pool
+
+
+def reset_render_pool() -> None:
+    """Drop a pool whose workers died (BrokenProcessPool); the next call starts a fresh one"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
@@ -0,0 +1,70 @@
+"""
+Staged Async Pipeline
+Chains async stages with bounded queues so different items can be in different stages
+at once (file 1 is graded while file 50 is still being OCR'd). Bounded queues apply
+backpressure: a fast stage waits instead of piling up work in memory.
+"""
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Any, AsyncIterable, Awaitable, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+@dataclass
+class Stage:
+    """One pipeline step: handler(item) -> item for the next stage (None drops it)"""
+    name: str
+    handler: Callable[[Any], Awaitable[Any]]
+    concurrency: int = 1
+
+
+async def run_pipeline(source: AsyncIterable[Any], stages: List[Stage], queue_size: int = 8,
+                       on_stage: Optional[Callable[[str, Any], None]] = None) -> None:
+    """
+    Feed every item from source through the stages in order.
+    Handlers are expected to turn per-item failures into results; an exception escaping a
+    handler cancels the whole pipeline and is re-raised here. on_stage(stage_name, item)
+    is called as an item enters each stage.
+    """
+    queues = [asyncio.Queue(maxsize=max(1, queue_size)) for _ in stages]
+
+    async def feed() -> None:
+        async for item in source:
+            await queues[0].put(item)
+        for _ in range(max(1, stages[0].concurrency)):
+            await queues[0].put(_DONE)
+
+    async def work(index: int) -> None:
+        stage = stages[index]
+        inbox = queues[index]
+        outbox = queues[index + 1] if index + 1 < len(stages) else None
+        while True:
+            item = await inbox.get()
+            if item is _DONE:
+                return
+            if on_stage is not None:
+                on_stage(stage.name, item)
+            result = await stage.handler(item)
+            if result is not None and outbox is not None:
+                await outbox.put(result)
+
+    async def run_stage(index: int) -> None:
+        stage = stages[index]
+        await asyncio.gather(*(work(index) for _ in range(max(1, stage.concurrency))))
+        # Every worker of this stage is done: close the next stage
+        if index + 1 < len(stages):
+            for _ in range(max(1, stages[index + 1].concurrency)):
+                await queues[index + 1].put(_DONE)
+
+    tasks = [asyncio.ensure_future(feed())] + [asyncio.ensure_future(run_stage(i)) for i in range(len(stages))]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
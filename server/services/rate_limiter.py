@@ -0,0 +1,205 @@
+"""
+LLM Quota Rate Limiter
+Token buckets for requests-per-minute and tokens-per-minute, per model, so calls are
+paced to the provider quota instead of discovering it through 429s
+"""
+import asyncio
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Gemini bills each inline image at a flat rate regardless of resolution (<=384px tiles aside)
+IMAGE_TOKEN_ESTIMATE = 258
+CHARS_PER_TOKEN = 4
+
+
+def estimate_prompt_tokens(contents: Any) -> int:
+    """Rough prompt token count for strings, Parts and lists of either (no API call)."""
+    if contents is None:
+        return 0
+    if isinstance(contents, str):
+        return len(contents) // CHARS_PER_TOKEN + 1
+    if isinstance(contents, (bytes, bytearray)):
+        return IMAGE_TOKEN_ESTIMATE
+    if isinstance(contents, (list, tuple)):
+        return sum(estimate_prompt_tokens(part) for part in contents)
+
+    text = getattr(contents, "text", None)
+    if isinstance(text, str):
+        return len(text) // CHARS_PER_TOKEN + 1
+    if getattr(contents, "inline_data", None) is not None or getattr(contents, "file_data", None) is not None:
+        return IMAGE_TOKEN_ESTIMATE
+    parts = getattr(contents, "parts", None)
+    if parts:
+        return estimate_prompt_tokens(list(parts))
+    return len(str(contents)) // CHARS_PER_TOKEN + 1
+
+
+class _TokenBucket:
+    """Continuous-refill bucket that allows reservations to drive the level negative (debt)."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay_for(self, amount: float, now: float) -> float:
+        self._refill(now)
+        deficit = min(amount, self.capacity) - self.level
+        return max(0.0, deficit / self.rate)
+
+    def take(self, amount: float) -> None:
+        self.level -= min(amount, self.capacity)
+
+    def give_back(self, amount: float) -> None:
+        self.level = min(self.capacity, self.level + min(amount, self.capacity))
+
+
+class QuotaRateLimiter:
+    """
+    Paces one model's calls to its RPM/TPM quota.
+    - acquire(tokens) reserves a request and the estimated tokens, then sleeps until
+      both buckets cover the reservation (FIFO by reservation order, no polling).
+    - reconcile() charges the difference once the response reports actual usage.
+    - A limit of 0 disables that bucket.
+    """
+
+    WAIT_BUCKETS = [0.0, 0.1, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0]
+
+    def __init__(self, model: str, rpm: int = 0, tpm: int = 0):
+        self.model = model
+        self.rpm = rpm
+        self.tpm = tpm
+        self._lock = threading.Lock()
+        self._requests = _TokenBucket(rpm) if rpm > 0 else None
+        self._tokens = _TokenBucket(tpm) if tpm > 0 else None
+        self._histogram = [0] * (len(self.WAIT_BUCKETS) + 1)
+        self._acquired = 0
+        self._delayed = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._estimated_tokens = 0
+        self._actual_tokens = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._requests is not None or self._tokens is not None
+
+    async def acquire(self, tokens: int) -> float:
+        """Wait until the quota admits one request of ~tokens. Returns seconds waited."""
+        if not self.enabled:
+            return 0.0
+
+        with self._lock:
+            now = time.monotonic()
+            delay = 0.0
+            if self._requests is not None:
+                delay = max(delay, self._requests.delay_for(1, now))
+            if self._tokens is not None:
+                delay = max(delay, self._tokens.delay_for(tokens, now))
+            if self._requests is not None:
+                self._requests.take(1)
+            if self._tokens is not None:
+                self._tokens.take(tokens)
+
+        if delay > 0:
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                # Hand the reservation back so a cancelled call does not starve the others
+                with self._lock:
+                    if self._requests is not None:
+                        self._requests.give_back(1)
+                    if self._tokens is not None:
+                        self._tokens.give_back(tokens)
+                raise
+
+        with self._lock:
+            self._acquired += 1
+            self._estimated_tokens += tokens
+            self._total_wait += delay
+            self._max_wait = max(self._max_wait, delay)
+            if delay > 0:
+                self._delayed += 1
+            self._histogram[bisect.bisect_left(self.WAIT_BUCKETS, delay)] += 1
+        return delay
+
+    def reconcile(self, estimated_tokens: int, actual_tokens: Optional[int]) -> None:
+        """Charge (or refund) the TPM bucket for the gap between estimate and reported usage."""
+        if not actual_tokens:
+            return
+        with self._lock:
+            self._actual_tokens += actual_tokens
+            if self._tokens is None:
+                return
+            self._tokens._refill(time.monotonic())
+            diff = actual_tokens - estimated_tokens
+            if diff > 0:
+                self._tokens.take(diff)
+            elif diff < 0:
+                self._tokens.give_back(-diff)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            labels = [f"<={b}s" for b in self.WAIT_BUCKETS] + [f">{self.WAIT_BUCKETS[-1]}s"]
+            return {
+                "rpm": self.rpm or None,
+                "tpm": self.tpm or None,
+                "acquired": self._acquired,
+                "delayed": self._delayed,
+                "total_wait_seconds": round(self._total_wait, 3),
+                "max_wait_seconds": round(self._max_wait, 3),
+                "estimated_tokens": self._estimated_tokens,
+                "actual_tokens": self._actual_tokens,
+                "wait_histogram": dict(zip(labels, self._histogram)),
+            }
+
+
+def _limits_for(model: str) -> Dict[str, int]:
+    limits = {
+        "rpm": int(os.getenv("GEMINI_RPM", "0")),
+        "tpm": int(os.getenv("GEMINI_TPM", "0")),
+    }
+    # Per-model overrides, e.g. GEMINI_RATE_LIMITS='{"gemini-2.5-pro": {"rpm": 150, "tpm": 2000000}}'
+    overrides = os.getenv("GEMINI_RATE_LIMITS", "")
+    if overrides:
+        try:
+            model_limits = json.loads(overrides).get(model, {})
+            limits.update({k: int(v) for k, v in model_limits.items() if k in limits})
+        except (ValueError, AttributeError, TypeError) as e:
+            logger.warning(f"Ignoring invalid GEMINI_RATE_LIMITS: {e}")
+    return limits
+
+
+_limiters: Dict[str, QuotaRateLimiter] = {}
+_registry_lock = threading.Lock()
+
+
+def get_rate_limiter(model: str) -> QuotaRateLimiter:
+    """Shared quota limiter for a model (one per process)"""
+    with _registry_lock:
+        limiter = _limiters.get(model)
+        if limiter is None:
+            limits = _limits_for(model)
+            limiter = QuotaRateLimiter(model, rpm=limits["rpm"], tpm=limits["tpm"])
+            _limiters[model] = limiter
+            if limiter.enabled:
+                logger.info(f"⏱️ Rate limiting {model}: rpm={limits['rpm'] or '∞'} tpm={limits['tpm'] or '∞'}")
+        return limiter
+
+
+def get_rate_limiter_states() -> Dict[str, Dict]:
+    with _registry_lock:
+        limiters = list(_limiters.values())
+    return {l.model: l.snapshot() for l in limiters}
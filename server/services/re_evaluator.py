@@ -11,6 +11,7 @@ from typing import Dict, List, Optional, Any, TYPE_CHECKING
 from sqlalchemy.orm import Session
 from .file_processor import FileProcessor
 from .gemini_service import GeminiService
+from .determinism_config import DeterministicEvalConfig
 from .ppt_processor import PPTProcessor
 from .ppt_evaluator import PPTEvaluator
 from .ppt_design_evaluator import PPTDesignEvaluator
@@ -90,7 +91,7 @@ class ReEvaluator:
     
     async def re_evaluate_file(self, file_path: str, title: str, description: str, file_id: Optional[str] = None, db: Optional[Session] = None, current_user: Optional["User"] = None) -> Dict:
         try:
-            file_type_res = self.file_processor.read_file(file_path)
+            file_type_res = await self.file_processor.read_file_async(file_path)
             
             # ATTEMPT TO RESTORE ORIGINAL FILENAME via meta file
             original_filename = None
@@ -138,11 +139,16 @@ class ReEvaluator:
             
             display_name = FileProcessor.extract_name_from_content(content) or os.path.splitext(filename)[0]
 
-            eval_tasks = []
-            for idx_q, qa in enumerate(qa_pairs, 1):
-                eval_tasks.append(self.gemini_service.evaluate_one_qa(description, qa.get('question', ''), qa.get('answer') or qa.get('student_answer', ''), question_index=idx_q, teacher_preferences=teacher_prefs))
-            
-            eval_results = await asyncio.gather(*eval_tasks)
+            async with self.gemini_service.context_cache_batch():
+                if DeterministicEvalConfig.BATCH_QA_EVALUATION:
+                    batch_items = [{"question": qa.get('question', ''), "student_answer": qa.get('answer') or qa.get('student_answer', ''), "question_index": idx_q} for idx_q, qa in enumerate(qa_pairs, 1)]
+                    eval_results = await self.gemini_service.evaluate_qa_batch(description, batch_items, teacher_preferences=teacher_prefs)
+                else:
+                    eval_tasks = []
+                    for idx_q, qa in enumerate(qa_pairs, 1):
+                        eval_tasks.append(self.gemini_service.evaluate_one_qa(description, qa.get('question', ''), qa.get('answer') or qa.get('student_answer', ''), question_index=idx_q, teacher_preferences=teacher_prefs))
+                    
+                    eval_results = await asyncio.gather(*eval_tasks)
             details = []
             for res in eval_results:
                 if not res.get("success"):
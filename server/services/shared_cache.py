@@ -0,0 +1,199 @@
+"""
+Shared Evaluation Cache Tier
+Networked cache (Redis protocol) shared by every worker and node, so an answer graded
+once anywhere is reused everywhere. Optional: the local tiers keep working without it.
+"""
+import fnmatch
+import logging
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from . import cache_codec
+
+# Optional Redis client
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+class InMemoryRedis:
+    """Process-local stand-in implementing the subset of the redis-py API the shared tier uses"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data: Dict[str, Tuple[bytes, Optional[float]]] = {}
+
+    def _live(self, key: str) -> Optional[bytes]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at is not None and expires_at <= time.time():
+            del self._data[key]
+            return None
+        return value
+
+    def ping(self) -> bool:
+        return True
+
+    def mget(self, keys: List[str]) -> List[Optional[bytes]]:
+        with self._lock:
+            return [self._live(k) for k in keys]
+
+    def set(self, key: str, value, ex: Optional[int] = None) -> bool:
+        if isinstance(value, str):
+            value = value.encode("utf-8")
+        with self._lock:
+            self._data[key] = (value, time.time() + ex if ex else None)
+        return True
+
+    def delete(self, *keys: str) -> int:
+        with self._lock:
+            return sum(1 for k in keys if self._data.pop(k, None) is not None)
+
+    def scan_iter(self, match: str = "*", count: int = 1000):
+        with self._lock:
+            keys = [k for k in self._data if fnmatch.fnmatchcase(k, match)]
+        yield from keys
+
+    def pipeline(self, transaction: bool = False) -> "_InMemoryPipeline":
+        return _InMemoryPipeline(self)
+
+
+class _InMemoryPipeline:
+    def __init__(self, store: InMemoryRedis):
+        self._store = store
+        self._ops = []
+
+    def set(self, key: str, value, ex: Optional[int] = None) -> "_InMemoryPipeline":
+        self._ops.append((key, value, ex))
+        return self
+
+    def execute(self) -> List[bool]:
+        return [self._store.set(k, v, ex=ex) for k, v, ex in self._ops]
+
+
+class SharedCacheTier:
+    """
+    Key scheme mirrors the local store: <prefix>:<eval_type>:<content_hash>.
+    Values are b"<cached_at>\\n<cache_codec-encoded result>" with the cache TTL applied as the key expiry.
+    Any connection error disables the tier for retry_seconds so callers never wait on
+    an unreachable server; reads then simply miss and writes are skipped.
+    """
+
+    def __init__(self, client, prefix: str = "evalcache", ttl_seconds: Optional[int] = None,
+                 retry_seconds: float = 30.0, name: str = "redis"):
+        self.client = client
+        self.prefix = prefix
+        self.ttl_seconds = ttl_seconds
+        self.retry_seconds = retry_seconds
+        self.name = name
+        self._lock = threading.Lock()
+        self._down_until = 0.0
+        self._counters: Dict[str, Dict[str, int]] = defaultdict(lambda: {"hits": 0, "misses": 0})
+        self._errors = 0
+        self._writes = 0
+
+    def _key(self, eval_type: str, content_hash: str) -> str:
+        return f"{self.prefix}:{eval_type}:{content_hash}"
+
+    @property
+    def available(self) -> bool:
+        return time.monotonic() >= self._down_until
+
+    def _fail(self, op: str, e: Exception) -> None:
+        with self._lock:
+            self._errors += 1
+            was_up = self.available
+            self._down_until = time.monotonic() + self.retry_seconds
+        if was_up:
+            logger.warning(f"Shared cache {op} failed, using local tiers only for {self.retry_seconds:.0f}s: {e}")
+
+    def get_many(self, eval_type: str, content_hashes: Iterable[str]) -> Dict[str, Tuple[float, str]]:
+        hashes = list(content_hashes)
+        if not hashes or not self.available:
+            return {}
+        try:
+            values = self.client.mget([self._key(eval_type, h) for h in hashes])
+        except Exception as e:
+            self._fail("read", e)
+            return {}
+
+        found = {}
+        for content_hash, value in zip(hashes, values):
+            if value is None:
+                continue
+            if isinstance(value, str):
+                value = value.encode("utf-8")
+            cached_at, _, encoded = value.partition(b"\n")
+            try:
+                found[content_hash] = (float(cached_at), cache_codec.decode(encoded))
+            except (ValueError, RuntimeError):
+                continue
+        with self._lock:
+            self._counters[eval_type]["hits"] += len(found)
+            self._counters[eval_type]["misses"] += len(hashes) - len(found)
+        return found
+
+    def set_many(self, eval_type: str, records: Iterable[Tuple[str, float, str]]) -> None:
+        if not self.available:
+            return
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            count = 0
+            for content_hash, cached_at, payload in records:
+                pipe.set(self._key(eval_type, content_hash), f"{cached_at}\n".encode() + cache_codec.encode(payload), ex=self.ttl_seconds)
+                count += 1
+            pipe.execute()
+            with self._lock:
+                self._writes += count
+        except Exception as e:
+            self._fail("write", e)
+
+    def clear(self) -> int:
+        if not self.available:
+            return 0
+        try:
+            removed = 0
+            batch = []
+            for key in self.client.scan_iter(match=f"{self.prefix}:*", count=1000):
+                batch.append(key)
+                if len(batch) >= 1000:
+                    removed += self.client.delete(*batch)
+                    batch = []
+            if batch:
+                removed += self.client.delete(*batch)
+            return removed
+        except Exception as e:
+            self._fail("clear", e)
+            return 0
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {
+                "backend": self.name,
+                "available": self.available,
+                "errors": self._errors,
+                "writes": self._writes,
+                "by_eval_type": {t: dict(c) for t, c in self._counters.items()},
+            }
+
+
+def create_shared_tier(url: str, prefix: str, ttl_seconds: Optional[int]) -> Optional[SharedCacheTier]:
+    """Build the shared tier from a URL: redis://..., rediss://... or memory:// (in-process stand-in)"""
+    if not url:
+        return None
+    if url.startswith("memory://"):
+        return SharedCacheTier(InMemoryRedis(), prefix=prefix, ttl_seconds=ttl_seconds, name="memory")
+    if not REDIS_AVAILABLE:
+        logger.warning("EVAL_SHARED_CACHE_URL is set but the 'redis' package is not installed; shared cache disabled")
+        return None
+    client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+    logger.info(f"🌐 Shared evaluation cache tier enabled ({url.split('@')[-1]})")
+    return SharedCacheTier(client, prefix=prefix, ttl_seconds=ttl_seconds)
@@ -0,0 +1,55 @@
+"""
+Single-Flight Request Coalescing
+Concurrent callers asking for the same key share one in-flight computation
+"""
+import asyncio
+import logging
+import threading
+from typing import Any, Awaitable, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """
+    Deduplicates concurrent work by key (e.g. an evaluation content hash).
+    The first caller starts the work as a task; later callers with the same key
+    await that task instead of repeating the LLM calls. The work runs in its own
+    task so one cancelled waiter never aborts it for the others.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._leaders = 0
+        self._coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            task = self._inflight.get(key)
+            if task is not None and task.get_loop() is loop:
+                self._coalesced += 1
+            else:
+                owner = task is None
+                task = loop.create_task(fn())
+                self._leaders += 1
+                # Work started on another event loop cannot be awaited here; run independently
+                if owner:
+                    self._inflight[key] = task
+                    task.add_done_callback(lambda t, k=key: self._forget(k, t))
+        return await asyncio.shield(task)
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        with self._lock:
+            if self._inflight.get(key) is task:
+                del self._inflight[key]
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {
+                "in_flight": len(self._inflight),
+                "executed": self._leaders,
+                "coalesced": self._coalesced,
+            }
@@ -0,0 +1,100 @@
+import asyncio
+
+from google.genai import types
+
+from services.context_cache import ContextCacheManager
+from services.gemini_service import GeminiService
+from services.llm_backend import FakeLLMBackend
+
+MODEL = "test-model"
+PREFIX = "rubric " * 200
+
+
+def _manager() -> ContextCacheManager:
+    return ContextCacheManager(enabled=True, ttl_seconds=900, min_tokens=10)
+
+
+def _backend() -> FakeLLMBackend:
+    return FakeLLMBackend(latency="fixed", latency_mean=0.0, seed=1)
+
+
+def test_handle_created_once_reused_and_deleted_when_batch_ends():
+    manager, backend = _manager(), _backend()
+
+    async def scenario():
+        async with manager.batch(backend):
+            # Concurrent first use shares one creation; later calls reuse the handle
+            names = await asyncio.gather(*[manager.get_handle(backend, MODEL, PREFIX) for _ in range(3)])
+            names.append(await manager.get_handle(backend, MODEL, PREFIX))
+            assert len(set(names)) == 1
+            assert names[0] in backend._caches
+        return names[0]
+
+    name = asyncio.run(scenario())
+    stats = manager.get_stats()
+    assert stats["created"] == 1
+    assert stats["reused"] == 1
+    assert stats["deleted"] == 1
+    assert stats["active_handles"] == 0
+    assert name not in backend._caches
+
+
+def test_handle_kept_until_last_overlapping_batch_ends():
+    manager, backend = _manager(), _backend()
+
+    async def scenario():
+        holding, outer_done = asyncio.Event(), asyncio.Event()
+
+        async def batch(hold: bool):
+            async with manager.batch(backend):
+                name = await manager.get_handle(backend, MODEL, PREFIX)
+                if hold:
+                    holding.set()
+                    await outer_done.wait()
+                return name
+
+        held = asyncio.create_task(batch(hold=True))
+        await holding.wait()
+        name = await batch(hold=False)
+        assert name in backend._caches
+        outer_done.set()
+        assert await held == name
+        return name
+
+    name = asyncio.run(scenario())
+    assert name not in backend._caches
+    assert manager.get_stats()["created"] == 1
+
+
+def test_sweep_deletes_idle_unscoped_handles():
+    manager, backend = _manager(), _backend()
+
+    async def scenario():
+        name = await manager.get_handle(backend, MODEL, PREFIX)
+        assert await manager.sweep(backend, idle_seconds=3600) == 0
+        assert await manager.sweep(backend, idle_seconds=0) == 1
+        return name
+
+    name = asyncio.run(scenario())
+    assert name not in backend._caches
+    assert manager.get_stats()["active_handles"] == 0
+
+
+def test_rejected_handle_is_invalidated_and_call_retried_inline(monkeypatch):
+    manager, backend = _manager(), _backend()
+    monkeypatch.setattr("services.gemini_service.prompt_cache", manager)
+    service = GeminiService()
+    service.backend = backend
+
+    async def scenario():
+        stale = await manager.get_handle(backend, MODEL, PREFIX)
+        # The provider dropped the handle (expired / deleted elsewhere): generate now 404s
+        await backend.delete_cache(stale)
+        service.model = MODEL
+        res = await service._call_with_prefix(PREFIX, "question", types.GenerateContentConfig(), None, "test call")
+        return stale, res
+
+    stale, res = asyncio.run(scenario())
+    assert res["success"]
+    assert manager.get_stats()["active_handles"] == 0
+    assert stale not in backend._caches